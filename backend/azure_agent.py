@@ -1,23 +1,48 @@
 import os
 import json
-import re
 import logging
+import threading
+import time
+from collections import deque
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
-from azure.ai.agents.models import ListSortOrder
+from azure.ai.agents.models import AgentStreamEvent, ListSortOrder
 from dotenv import load_dotenv
+from pydantic import create_model
+from typing import Optional
+
+from json_extractor import JsonObjectExtractor
+from metrics import StageTimer, registry
+from models import ContentItem
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Where time goes in an agent request (see main() for the stages), and how often
+# each hard-coded fallback answer is served
+agent_stage_seconds = registry.histogram(
+    "azure_agent_stage_seconds", "Time spent in each stage of an agent request", ("stage",))
+agent_request_seconds = registry.histogram(
+    "azure_agent_request_seconds", "Total time of an agent request, fallbacks included")
+agent_fallbacks = registry.counter(
+    "azure_agent_fallbacks_total", "Fallback answers served, by fallback id", ("id",))
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Initialize Azure AI Project Client lazily
 project = None
 
+# AZURE_AGENT_FAKE=true swaps the Azure client for fake_agent.FakeProjectClient
+# (configured by FAKE_AGENT_*), for load tests and local runs without Azure
+AZURE_AGENT_FAKE = os.getenv("AZURE_AGENT_FAKE", "false").lower() == "true"
+
 def get_project_client():
     global project
+    if project is None and AZURE_AGENT_FAKE:
+        from fake_agent import FakeProjectClient
+        project = FakeProjectClient.from_env()
+        logger.warning("Using the fake agent client (AZURE_AGENT_FAKE=true)")
     if project is None:
         endpoint = os.getenv("PROJECT_ENDPOINT")
         if not endpoint:
@@ -27,22 +52,187 @@ def get_project_client():
             endpoint=endpoint)
     return project
 
-def main(query: str = None):
-    try:
-        project_client = get_project_client()
-        agent = project_client.agents.get_agent(os.getenv("AZURE_AI_AGENT_ID"))
-        logger.info(f"Got agent: {agent.id}")
+# The agent handle is resolved once per process and reused by every request.
+# It is dropped whenever a run errors so the next request fetches it again.
+agent = None
+agent_lock = threading.Lock()
 
-        thread = project_client.agents.threads.create()
-        logger.info(f"Created thread, ID: {thread.id}")
+def get_agent(project_client):
+    global agent
+    with agent_lock:
+        if agent is None:
+            agent = project_client.agents.get_agent(os.getenv("AZURE_AI_AGENT_ID"))
+            logger.info(f"Got agent: {agent.id}")
+        return agent
 
-        # Use provided query or default query
-        user_query = query if query else "真夏になったので、今あるおすすめの水筒を値段等含めて教えてください。"
-        
-        message = project_client.agents.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=f'''{user_query}返答は、 content.json から次のようなフォーマットで一件 JSON 形式で出力してください。
+def invalidate_agent():
+    global agent
+    with agent_lock:
+        agent = None
+
+class PooledThread:
+    def __init__(self, thread_id: str):
+        self.id = thread_id
+        self.runs = 0
+        # Set while a streamed run we stopped reading may still be going
+        self.active_run_id = None
+
+class AgentThreadPool:
+    """Pool of pre-created agent threads
+
+    A background worker keeps ``size`` idle threads ready so a request does not
+    pay for ``threads.create``, and deletes retired threads so none are left
+    orphaned. A thread goes back to the pool after a completed run until it has
+    served ``max_runs`` runs; failed or exhausted threads are retired. Without
+    the worker (tests, CLI use) threads are created inline on demand.
+    """
+
+    def __init__(self, size: int = 4, max_runs: int = 1):
+        self.size = size
+        self.max_runs = max_runs
+        self._idle = deque()
+        self._retired = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def acquire(self, project_client) -> PooledThread:
+        with self._lock:
+            pooled = self._idle.popleft() if self._idle else None
+        self._wakeup.set()
+        if pooled is None:
+            stages = StageTimer(agent_stage_seconds)
+            thread = project_client.agents.threads.create()
+            stages.lap("threads_create")
+            logger.info(f"Created thread, ID: {thread.id}")
+            pooled = PooledThread(thread.id)
+        return pooled
+
+    def release(self, pooled: PooledThread, reusable: bool) -> None:
+        pooled.runs += 1
+        with self._lock:
+            if reusable and pooled.runs < self.max_runs and not self._stopping.is_set():
+                self._idle.append(pooled)
+            else:
+                self._retired.append(pooled)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stopping.clear()
+        self._worker = threading.Thread(
+            target=self._run, name="azure-agent-thread-pool", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the worker and delete every pooled and retired thread"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+        with self._lock:
+            self._retired.extend(self._idle)
+            self._idle.clear()
+        try:
+            self._delete_retired(get_project_client())
+        except Exception as e:
+            logger.error(f"Failed to delete agent threads on shutdown: {e}")
+
+    def reset(self) -> None:
+        """Forget all pooled threads without deleting them"""
+        with self._lock:
+            self._idle.clear()
+            self._retired.clear()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                project_client = get_project_client()
+                get_agent(project_client)
+                self._delete_retired(project_client)
+                self._fill(project_client)
+            except Exception as e:
+                logger.error(f"Agent thread pool maintenance failed: {e}")
+                invalidate_agent()
+                self._stopping.wait(5.0)
+            self._wakeup.wait(30.0)
+            self._wakeup.clear()
+
+    def _fill(self, project_client) -> None:
+        while not self._stopping.is_set():
+            with self._lock:
+                if len(self._idle) >= self.size:
+                    return
+            stages = StageTimer(agent_stage_seconds)
+            thread = project_client.agents.threads.create()
+            stages.lap("threads_create")
+            logger.info(f"Pre-created thread, ID: {thread.id}")
+            with self._lock:
+                self._idle.append(PooledThread(thread.id))
+
+    def _delete_retired(self, project_client) -> None:
+        while True:
+            with self._lock:
+                if not self._retired:
+                    return
+                pooled = self._retired.popleft()
+            try:
+                if pooled.active_run_id:
+                    project_client.agents.runs.cancel(thread_id=pooled.id, run_id=pooled.active_run_id)
+                    logger.info(f"Cancelled run {pooled.active_run_id} on thread {pooled.id}")
+                project_client.agents.threads.delete(pooled.id)
+                logger.info(f"Deleted thread, ID: {pooled.id}")
+            except Exception as e:
+                logger.error(f"Failed to delete thread {pooled.id}: {e}")
+
+thread_pool = AgentThreadPool(
+    size=int(os.getenv("AZURE_AGENT_THREAD_POOL_SIZE", "4")),
+    max_runs=int(os.getenv("AZURE_AGENT_THREAD_MAX_RUNS", "1")))
+
+# Stream run events and answer as soon as the reply holds a complete JSON object,
+# instead of waiting for the run (and any trailing explanation) to finish
+AZURE_AGENT_STREAMING = os.getenv("AZURE_AGENT_STREAMING", "false").lower() == "true"
+
+DEFAULT_QUERY = "真夏になったので、今あるおすすめの水筒を値段等含めて教えてください。"
+
+# Rank the local catalog against the query and inline only the top candidates in
+# the prompt, instead of having the agent search content.json (0 = off)
+AZURE_AGENT_CANDIDATES = int(os.getenv("AZURE_AGENT_CANDIDATES", "8"))
+# Set by the API: (query, k) -> up to k catalog items as dicts, best match first
+candidate_provider = None
+# Candidate fields sent to the agent; the rest are filled in from the catalog
+CANDIDATE_FIELDS = ("id", "title", "price", "rating", "category")
+# Ask the agent only for a short ranked list of ids instead of a whole product;
+# the API builds the banner from its own catalog entry for the id
+AZURE_AGENT_ID_ONLY = os.getenv("AZURE_AGENT_ID_ONLY", "false").lower() == "true"
+ID_ONLY_MAX_IDS = 3
+
+def retrieve_candidates(user_query: str):
+    if candidate_provider is None or AZURE_AGENT_CANDIDATES <= 0:
+        return []
+    try:
+        return candidate_provider(user_query, AZURE_AGENT_CANDIDATES)
+    except Exception as e:
+        logger.error(f"Candidate retrieval failed, letting the agent search content.json: {e}")
+        return []
+
+def build_prompt(user_query: str, candidates) -> str:
+    lines = "\n".join(
+        json.dumps({field: candidate[field] for field in CANDIDATE_FIELDS}, ensure_ascii=False, separators=(",", ":"))
+        for candidate in candidates)
+    if AZURE_AGENT_ID_ONLY and candidates:
+        return f'''{user_query}次の候補からおすすめ順に最大{ID_ONLY_MAX_IDS}件選び、候補の id だけを次のような JSON 形式で出力してください。
+候補:
+{lines}
+{{"ids": [""]}}'''
+    if AZURE_AGENT_ID_ONLY:
+        return f'''{user_query}content.json からおすすめ順に最大{ID_ONLY_MAX_IDS}件選び、id だけを次のような JSON 形式で出力してください。
+{{"ids": [""]}}'''
+    if not candidates:
+        return f'''{user_query}返答は、 content.json から次のようなフォーマットで一件 JSON 形式で出力してください。
                 {{
                 "id": "",
                 "title": "",
@@ -52,122 +242,235 @@ def main(query: str = None):
                 "category": "",
                 "isRecommended": false
               }}'''
+    return f'''{user_query}次の候補から一件選び、候補の id のまま次のようなフォーマットで JSON 形式で出力してください。
+候補:
+{lines}
+{{"id": "", "title": "", "price": 0, "rating": 0, "category": "", "isRecommended": false}}'''
+
+# ContentItem with every field optional, to type-check whichever fields an answer has
+PartialContentItem = create_model(
+    "PartialContentItem",
+    **{name: (Optional[field.annotation], None) for name, field in ContentItem.model_fields.items()})
+
+def validate_recommendation(value):
+    """Accept an agent answer that names an item and has correctly typed fields"""
+    if isinstance(value.get("ids"), list):
+        return value
+    if value.get("id") in (None, ""):
+        raise ValueError("answer has no id")
+    PartialContentItem.model_validate(value)
+    return value
+
+def resolve_candidate(result, candidates):
+    """Pin the agent's answer to one of the catalog items it was offered"""
+    if not candidates:
+        return result
+    candidate = next((c for c in candidates if c["id"] == str(result.get("id"))), None)
+    if candidate is None:
+        logger.warning(f"Agent answered with unknown id {result.get('id')!r}, using the best local candidate")
+        return dict(candidates[0])
+    return {**candidate, **result}
+
+def resolve_ids(result, candidates):
+    """Reduce an id-only answer to ``{"id", "ids"}``, keeping offered ids only"""
+    ids = result.get("ids")
+    if not isinstance(ids, list):
+        ids = [result["id"]] if result.get("id") else []
+    ids = [str(item_id) for item_id in ids if item_id not in (None, "")][:ID_ONLY_MAX_IDS]
+    if candidates:
+        offered = {candidate["id"] for candidate in candidates}
+        ids = [item_id for item_id in ids if item_id in offered] or [candidates[0]["id"]]
+    if not ids:
+        logger.warning(f"No usable id in agent answer {result}, returning fallback data")
+        return fallback_recommendation("fallback-008")
+    return {"id": ids[0], "ids": ids}
+
+def resolve_answer(result, candidates):
+    if str(result.get("id", "")).startswith("fallback-"):
+        return result
+    if AZURE_AGENT_ID_ONLY:
+        return resolve_ids(result, candidates)
+    return resolve_candidate(result, candidates)
+
+# Set by the API: (query, recommendation, latency_seconds, run_status) -> None,
+# called for every answer parsed from the agent
+response_recorder = None
+
+def record_response(query, result, started: float, run_status: str):
+    """Hand a parsed answer to ``response_recorder`` and return it unchanged"""
+    if response_recorder is not None and not str(result.get("id", "")).startswith("fallback-"):
+        try:
+            response_recorder(query, result, time.perf_counter() - started, run_status)
+        except Exception as e:
+            logger.error(f"Failed to record agent response: {e}")
+    return result
+
+def fallback_recommendation(fallback_id: str):
+    """Hard-coded recommendation returned when the agent cannot answer"""
+    agent_fallbacks.inc(fallback_id)
+    return {
+        "id": fallback_id,
+        "title": "プレミアムワイヤレスヘッドホン",
+        "price": 15800,
+        "originalPrice": 19800,
+        "rating": 4.8,
+        "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
+        "category": "オーディオ",
+        "isRecommended": True
+    }
+
+def stream_recommendation(project_client, agent, thread: PooledThread):
+    """Run the agent in streaming mode
+
+    Returns ``(recommendation, run_status)``. The stream is closed as soon as
+    the first complete JSON object arrives, in which case ``run_status`` is
+    ``"in_progress"`` and the run id stays on ``thread`` so the thread pool can
+    cancel it in the background.
+    """
+    extractor = JsonObjectExtractor(validate=validate_recommendation)
+    received_text = False
+    run_status = "in_progress"
+    with project_client.agents.runs.stream(thread_id=thread.id, agent_id=agent.id) as stream:
+        for event_type, event_data, _ in stream:
+            if event_type == AgentStreamEvent.THREAD_RUN_CREATED:
+                thread.active_run_id = event_data.id
+                logger.info(f"Streaming run, ID: {event_data.id}")
+            elif event_type == AgentStreamEvent.THREAD_MESSAGE_DELTA:
+                text = event_data.text
+                received_text = received_text or bool(text)
+                result = extractor.feed(text)
+                if result is not None:
+                    logger.info(f"Complete JSON recommendation received from stream: {result}")
+                    return result, run_status
+            elif event_type == AgentStreamEvent.THREAD_RUN_FAILED:
+                thread.active_run_id = None
+                logger.error(f"Run failed: {event_data.last_error}, returning fallback data")
+                return fallback_recommendation("fallback-006"), "failed"
+            elif event_type in (
+                    AgentStreamEvent.THREAD_RUN_COMPLETED,
+                    AgentStreamEvent.THREAD_RUN_INCOMPLETE,
+                    AgentStreamEvent.THREAD_RUN_CANCELLED,
+                    AgentStreamEvent.THREAD_RUN_EXPIRED):
+                thread.active_run_id = None
+                run_status = event_data.status
+            elif event_type == AgentStreamEvent.ERROR:
+                raise RuntimeError(f"Agent stream error: {event_data}")
+            elif event_type == AgentStreamEvent.DONE:
+                break
+
+    logger.info(f"Stream finished with run status: {run_status}")
+    if run_status != "completed":
+        logger.warning(f"Unexpected run status: {run_status}, returning fallback data")
+        return fallback_recommendation("fallback-004"), run_status
+    # An unclosed brace in the prose may have hidden an object until the end
+    result = extractor.finish()
+    if result is not None:
+        logger.info(f"JSON recommendation found at the end of the stream: {result}")
+        return result, run_status
+    if received_text:
+        logger.warning("No JSON found in streamed assistant response, returning fallback data")
+        return fallback_recommendation("fallback-001"), run_status
+    logger.warning("No assistant messages streamed, returning fallback data")
+    return fallback_recommendation("fallback-003"), run_status
+
+def main(query: str = None):
+    thread = None
+    completed = False
+    started = time.perf_counter()
+    # Each lap records the time since the previous one as that stage
+    stages = StageTimer(agent_stage_seconds)
+    try:
+        project_client = get_project_client()
+        agent = get_agent(project_client)
+        stages.lap("get_agent")
+
+        thread = thread_pool.acquire(project_client)
+        stages.lap("thread_acquire")
+
+        # Use provided query or default query
+        user_query = query if query else DEFAULT_QUERY
+        candidates = retrieve_candidates(user_query)
+        stages.lap("candidates")
+        
+        message = project_client.agents.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=build_prompt(user_query, candidates)
         )
+        stages.lap("messages_create")
         logger.info(f"Created message, ID: {message.id}")
 
+        if AZURE_AGENT_STREAMING:
+            logger.info("Starting streamed run...")
+            result, run_status = stream_recommendation(project_client, agent, thread)
+            stages.lap("stream")
+            completed = run_status == "completed"
+            if run_status not in ("completed", "in_progress"):
+                invalidate_agent()
+            return record_response(query, resolve_answer(result, candidates), started, run_status)
+
         logger.info("Starting run creation and processing...")
         run = project_client.agents.runs.create_and_process(
             thread_id=thread.id,
             agent_id=agent.id)
+        stages.lap("create_and_process")
         
         logger.info(f"Run completed with status: {run.status}")
+        completed = run.status == "completed"
+        if run.status != "completed":
+            invalidate_agent()
         
         if run.status == "failed":
             logger.error(f"Run failed: {run.last_error}, returning fallback data")
-            return {
-                "id": "fallback-006",
-                "title": "プレミアムワイヤレスヘッドホン",
-                "price": 15800,
-                "originalPrice": 19800,
-                "rating": 4.8,
-                "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                "category": "オーディオ",
-                "isRecommended": True
-            }
+            return fallback_recommendation("fallback-006")
         elif run.status == "in_progress":
             logger.warning(f"Run is still in progress (status: {run.status}). This might cause inconsistent results. Returning fallback data.")
-            return {
-                "id": "fallback-007",
-                "title": "プレミアムワイヤレスヘッドホン",
-                "price": 15800,
-                "originalPrice": 19800,
-                "rating": 4.8,
-                "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                "category": "オーディオ",
-                "isRecommended": True
-            }
+            return fallback_recommendation("fallback-007")
         elif run.status == "completed":
-            logger.info("Run completed successfully, retrieving messages...")
-            messages = project_client.agents.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-            logger.info(f"Retrieved {len(list(messages))} messages")
-
-            messages = project_client.agents.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-            for message in messages:
+            logger.info("Run completed successfully, retrieving latest assistant message...")
+            # Single round trip: only the newest message written by this run
+            messages = project_client.agents.messages.list(
+                thread_id=thread.id,
+                run_id=run.id,
+                order=ListSortOrder.DESCENDING,
+                limit=1)
+            message = next(iter(messages), None)
+            stages.lap("messages_list")
+            if message is not None:
                 logger.info(f"Processing message with role: {message.role}")
-                if message.role == "assistant" and message.text_messages:
-                    text_content = message.text_messages[-1].text.value
-                    logger.info(f"Assistant response: {text_content[:200]}...")
-                    # Extract JSON from the response text
-                    json_match = re.search(r'\{[\s\S]*\}', text_content)
-                    if json_match:
-                        try:
-                            json_str = json_match.group(0)
-                            result = json.loads(json_str)
-                            logger.info(f"Successfully parsed JSON recommendation: {result}")
-                            return result
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Failed to parse JSON: {e}, returning fallback data")
-                            # Return fallback recommendation when JSON parsing fails
-                            return {
-                                "id": "fallback-002",
-                                "title": "プレミアムワイヤレスヘッドホン",
-                                "price": 15800,
-                                "originalPrice": 19800,
-                                "rating": 4.8,
-                                "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                                "category": "オーディオ",
-                                "isRecommended": True
-                            }
-                    else:
-                        logger.warning("No JSON found in assistant response, returning fallback data")
-                        # Return fallback recommendation when JSON parsing fails
-                        return {
-                            "id": "fallback-001",
-                            "title": "プレミアムワイヤレスヘッドホン",
-                            "price": 15800,
-                            "originalPrice": 19800,
-                            "rating": 4.8,
-                            "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                            "category": "オーディオ",
-                            "isRecommended": True
-                        }
+            if message is not None and message.role == "assistant" and message.text_messages:
+                text_content = message.text_messages[-1].text.value
+                logger.info(f"Assistant response: {text_content[:200]}...")
+                # Single pass over the reply; the first object naming an item wins
+                extractor = JsonObjectExtractor(validate=validate_recommendation)
+                extractor.feed(text_content)
+                result = extractor.finish()
+                stages.lap("parse")
+                if result is not None:
+                    logger.info(f"Successfully parsed JSON recommendation: {result}")
+                    return record_response(query, resolve_answer(result, candidates), started, run.status)
+                elif extractor.rejected:
+                    logger.error(f"No valid recommendation in {extractor.rejected} JSON candidates, returning fallback data")
+                    return fallback_recommendation("fallback-002")
+                else:
+                    logger.warning("No JSON found in assistant response, returning fallback data")
+                    # Return fallback recommendation when JSON parsing fails
+                    return fallback_recommendation("fallback-001")
             
             logger.warning("No assistant messages found, returning fallback data")
-            return {
-                "id": "fallback-003",
-                "title": "プレミアムワイヤレスヘッドホン",
-                "price": 15800,
-                "originalPrice": 19800,
-                "rating": 4.8,
-                "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                "category": "オーディオ",
-                "isRecommended": True
-            }
+            return fallback_recommendation("fallback-003")
         else:
             logger.warning(f"Unexpected run status: {run.status}, returning fallback data")
-            return {
-                "id": "fallback-004",
-                "title": "プレミアムワイヤレスヘッドホン",
-                "price": 15800,
-                "originalPrice": 19800,
-                "rating": 4.8,
-                "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-                "category": "オーディオ",
-                "isRecommended": True
-            }
+            return fallback_recommendation("fallback-004")
             
     except Exception as e:
         logger.error(f"Error in main function: {e}, returning fallback data")
-        return {
-            "id": "fallback-005",
-            "title": "プレミアムワイヤレスヘッドホン",
-            "price": 15800,
-            "originalPrice": 19800,
-            "rating": 4.8,
-            "imageUrl": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=400&fit=crop",
-            "category": "オーディオ",
-            "isRecommended": True
-        }
+        invalidate_agent()
+        return fallback_recommendation("fallback-005")
+    finally:
+        if thread is not None:
+            thread_pool.release(thread, reusable=completed)
+        agent_request_seconds.observe(time.perf_counter() - started)
 
 def get_recommendation(query: str = None):
     return main(query)
@@ -176,3 +479,4 @@ if __name__ == "__main__":
     result = get_recommendation()
     if result:
         print(json.dumps(result, indent=2, ensure_ascii=False))
+    thread_pool.stop()
@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+import main as api
+from catalog import render_content
+from catalog_store import load_mapped_catalog
+from load_test import percentile
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# Results within this fraction of the baseline are noise, not a regression
+DEFAULT_TOLERANCE = 0.2
+
+CATEGORIES = (
+    "オーディオ", "ウェアラブル", "キッチン", "アウトドア", "ファッション", "ビューティー",
+    "ホーム", "スポーツ", "ゲーム", "カメラ", "ステーショナリー", "ペット",
+)
+ADJECTIVES = ("プレミアム", "ポータブル", "スマート", "エコフレンドリー", "ワイヤレス", "真空断熱", "軽量", "プロ仕様")
+NOUNS = ("ヘッドホン", "水筒", "ウォッチ", "スピーカー", "バッグ", "ランプ", "マグ", "チェア", "カメラ", "ノート")
+
+
+def generate_content(size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """``size`` content items shaped like data/content.json, the same for the same seed"""
+    rng = random.Random(seed)
+    items = []
+    for index in range(1, size + 1):
+        price = rng.randrange(500, 80_000, 10)
+        item = {
+            "id": str(index),
+            "title": f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)} {rng.choice('ABCDEFGHJK')}{index % 1000}",
+            "price": price,
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "imageUrl": f"https://images.example.com/items/{index}.jpg?w=400&h=400&fit=crop",
+            "category": rng.choice(CATEGORIES),
+        }
+        if rng.random() < 0.3:
+            item["originalPrice"] = price + rng.randrange(100, 20_000, 100)
+            item["isSale"] = True
+        if rng.random() < 0.15:
+            item["isNew"] = True
+        if rng.random() < 0.2:
+            item["isRecommended"] = True
+        items.append(item)
+    return items
+
+
+def write_catalog(data_dir: Path, size: int, seed: int = 0) -> None:
+    """Write a synthetic content.json with ``size`` items, plus the real banners.json"""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_dir / "content.json", "w", encoding="utf-8") as f:
+        json.dump(generate_content(size, seed), f, ensure_ascii=False)
+    banners = (api.DATA_DIR / "banners.json").read_bytes()
+    (data_dir / "banners.json").write_bytes(banners)
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[float, Any]:
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def measure_load(data_dir: Path, work_dir: Path) -> Dict[str, float]:
+    """Startup cost: parse, validate and index the JSON catalog, or map a built snapshot
+
+    A mapped worker only opens the file: its columns, sort orders and search
+    index are views of the mapping, so ``load_mapped_ms`` is its whole cost.
+    """
+    load_seconds, _ = timed(lambda: api.load_catalog_snapshot(data_dir))
+    snapshot_path = work_dir / "catalog.snapshot"
+    build_seconds, _ = timed(lambda: load_mapped_catalog(data_dir, snapshot_path))
+    mapped_seconds, _ = timed(lambda: load_mapped_catalog(data_dir, snapshot_path))
+    return {
+        "load_ms": round(load_seconds * 1000, 2),
+        "snapshot_build_ms": round(build_seconds * 1000, 2),
+        "load_mapped_ms": round(mapped_seconds * 1000, 2),
+    }
+
+
+def measure_memory(data_dir: Path, size: int) -> Dict[str, float]:
+    """Python heap held by a loaded snapshot, and the peak while loading it"""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        snapshot = api.load_catalog_snapshot(data_dir)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del snapshot
+    return {
+        "memory_bytes_per_item": round((retained - before) / size, 1),
+        "load_peak_bytes_per_item": round((peak - before) / size, 1),
+    }
+
+
+def measure_serialization(snapshot, size: int) -> Dict[str, float]:
+    """Cost of rendering the full /api/content body once per snapshot"""
+    seconds, rendered = timed(lambda: render_content(snapshot.columns))
+    return {
+        "render_content_ms": round(seconds * 1000, 2),
+        "render_ns_per_item": round(seconds * 1e9 / size, 1),
+        "body_bytes_per_item": round(len(rendered.body) / size, 1),
+    }
+
+
+def endpoint_paths(snapshot) -> Dict[str, str]:
+    category = snapshot.columns.category_names[0] if snapshot.columns.category_names else "none"
+    return {
+        "content": "/api/content",
+        "content_by_category": f"/api/content/{category}",
+        "banners": "/api/banners",
+        "content_page": "/api/content?limit=50&sort=-rating&min_rating=4",
+        "search": "/api/search?q=水筒",
+    }
+
+
+async def measure_endpoints(snapshot, min_seconds: float, min_requests: int) -> Dict[str, Dict[str, float]]:
+    """Sequential latency and throughput of each endpoint through the ASGI app"""
+    previous = api.catalog
+    api.set_catalog(snapshot)
+    transport = httpx.ASGITransport(app=api.app)
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name, path in endpoint_paths(snapshot).items():
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies: List[float] = []
+                started = time.perf_counter()
+                while len(latencies) < min_requests or time.perf_counter() - started < min_seconds:
+                    request_started = time.perf_counter()
+                    response = await client.get(path)
+                    latencies.append(time.perf_counter() - request_started)
+                elapsed = time.perf_counter() - started
+                results[name] = {
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                    "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                    "rps": round(len(latencies) / elapsed, 1),
+                    "response_bytes": len(response.content),
+                }
+    finally:
+        api.set_catalog(previous)
+    return results
+
+
+def run_size(size: int, seed: int = 0, min_seconds: float = 1.0, min_requests: int = 5,
+             memory: bool = True) -> Dict[str, Any]:
+    """Every measurement for one synthetic catalog of ``size`` items"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        data_dir = work_dir / "data"
+        write_catalog(data_dir, size, seed)
+        result: Dict[str, Any] = {"items": size}
+        result.update(measure_load(data_dir, work_dir))
+        if memory:
+            result.update(measure_memory(data_dir, size))
+        snapshot = api.load_catalog_snapshot(data_dir)
+        result.update(measure_serialization(snapshot, size))
+        result["endpoints"] = asyncio.run(measure_endpoints(snapshot, min_seconds, min_requests))
+    return result
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """``{"1000/endpoints/content/p50_ms": 1.2, ...}`` for every number in ``results``"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Metrics that got worse than ``baseline`` by more than ``tolerance``
+
+    Throughput (``rps``) regresses when it drops; times and sizes regress when
+    they grow. Response sizes and item counts are informational only.
+    """
+    before = flatten(baseline.get("results", {}))
+    after = flatten(report.get("results", {}))
+    regressions = []
+    for name, old in sorted(before.items()):
+        new = after.get(name)
+        metric = name.rsplit("/", 1)[-1]
+        if new is None or metric in ("items", "response_bytes") or old <= 0:
+            continue
+        if metric == "rps":
+            if new < old * (1 - tolerance):
+                regressions.append(f"{name}: {new} < {old} ({new / old - 1:+.0%})")
+        elif new > old * (1 + tolerance):
+            regressions.append(f"{name}: {new} > {old} ({new / old - 1:+.0%})")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, seed: int = 0, min_seconds: float = 1.0, memory: bool = True) -> Dict[str, Any]:
+    results = {}
+    for size in sizes:
+        logger.warning(f"Benchmarking {size} items")
+        results[str(size)] = run_size(size, seed, min_seconds, memory=memory)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark catalog loading and the catalog endpoints")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated catalog sizes, 1000 to 1000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time", type=float, default=1.0, help="seconds spent on each endpoint")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc pass")
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = run(sizes, args.seed, args.time, memory=not args.no_memory)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
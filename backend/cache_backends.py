@@ -0,0 +1,302 @@
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional
+from urllib.parse import urlparse
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"value": self.value, "fresh_until": self.fresh_until, "stale_until": self.stale_until},
+            ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data) -> "CacheEntry":
+        entry = json.loads(data)
+        return cls(entry["value"], entry["fresh_until"], entry["stale_until"])
+
+
+class MemoryBackend:
+    """Per-process LRU store; the default backend"""
+
+    # Calls never wait on I/O, so the cache runs them on the event loop
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            logger.debug(f"Evicted recommendation cache entry: {evicted_key!r}")
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBackend:
+    """Store shared by every worker on the node through one SQLite file
+
+    WAL mode lets workers read while another writes, and the file survives
+    restarts and deploys, so a new process starts warm. Past
+    ``max_entries`` the least recently stored entries are evicted. Database
+    errors are logged and treated as misses.
+    """
+
+    # Calls may wait up to the busy timeout; the cache runs them off the event loop
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                "key TEXT PRIMARY KEY, entry TEXT NOT NULL, stored_at REAL NOT NULL)")
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS recommendations_stored_at ON recommendations (stored_at)")
+            self._db = db
+        return self._db
+
+    def _execute(self, *statements) -> Optional[list]:
+        """Run ``(sql, params)`` statements in order; return the last one's rows, None on error"""
+        with self._lock:
+            try:
+                db = self._connection()
+                for sql, params in statements:
+                    rows = db.execute(sql, params).fetchall()
+                return rows
+            except sqlite3.Error as e:
+                logger.error(f"SQLite recommendation cache unavailable: {e}")
+                return None
+
+    def __len__(self) -> int:
+        rows = self._execute(("SELECT COUNT(*) FROM recommendations", ()))
+        return rows[0][0] if rows else 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        rows = self._execute(("SELECT entry FROM recommendations WHERE key = ?", (key,)))
+        return CacheEntry.from_json(rows[0][0]) if rows else None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self._execute(
+            ("INSERT OR REPLACE INTO recommendations (key, entry, stored_at) VALUES (?, ?, ?)",
+             (key, entry.to_json(), time.time())),
+            ("DELETE FROM recommendations WHERE key IN ("
+             "SELECT key FROM recommendations ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+             (self.max_entries,)))
+
+    def delete(self, key: str) -> None:
+        self._execute(("DELETE FROM recommendations WHERE key = ?", (key,)))
+
+    def clear(self) -> None:
+        self._execute(("DELETE FROM recommendations", ()))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """Store in any server speaking the Redis protocol (RESP2)
+
+    Uses a small built-in client, so no extra dependency is needed. Entries
+    expire on the server once they are past their stale window. Connection
+    errors are logged and treated as misses, so an unavailable server only
+    costs hit rate.
+    """
+
+    # Calls wait on the network; the cache runs them off the event loop
+    blocking = True
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        prefix: str = "recommendation:",
+        timeout: float = 0.5,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        try:
+            if self.password:
+                self._call("AUTH", self.password)
+            if self.db:
+                self._call("SELECT", str(self.db))
+        except RedisError:
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _call(self, *args: str) -> Any:
+        encoded = [arg.encode("utf-8") for arg in args]
+        request = b"*%d\r\n" % len(encoded) + b"".join(
+            b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded)
+        self._sock.sendall(request)
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def command(self, *args: str) -> Any:
+        """Send one command, reconnecting once if the connection went away"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def _safe(self, *args: str) -> Any:
+        try:
+            return self.command(*args)
+        except (OSError, RedisError) as e:
+            logger.error(f"Redis recommendation cache unavailable: {e}")
+            return None
+
+    def _keys(self) -> Iterator[str]:
+        cursor = "0"
+        while True:
+            reply = self._safe("SCAN", cursor, "MATCH", f"{self.prefix}*", "COUNT", "1000")
+            if reply is None:
+                return
+            cursor, keys = reply
+            yield from keys
+            if cursor == "0":
+                return
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._keys())
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        data = self._safe("GET", self.prefix + key)
+        return CacheEntry.from_json(data) if data is not None else None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        expire_ms = max(1, int((entry.stale_until - time.time()) * 1000))
+        self._safe("SET", self.prefix + key, entry.to_json(), "PX", str(expire_ms))
+
+    def delete(self, key: str) -> None:
+        self._safe("DEL", self.prefix + key)
+
+    def clear(self) -> None:
+        keys: List[str] = list(self._keys())
+        for start in range(0, len(keys), 500):
+            self._safe("DEL", *keys[start:start + 500])
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+def create_backend(url: str, max_entries: int = 1024):
+    """Backend for a RECOMMENDATION_CACHE_BACKEND value
+
+    ``memory`` (or empty) keeps a per-process cache, ``sqlite:///path/to.db``
+    shares a SQLite file between workers and ``redis://[:password@]host:port/db``
+    uses a Redis-compatible server.
+    """
+    if not url or url == "memory":
+        return MemoryBackend(max_entries)
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///tmp/cache.db is absolute, sqlite://cache.db relative
+        return SQLiteBackend(url[len("sqlite://"):], max_entries)
+    if parsed.scheme == "redis":
+        return RedisBackend(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password)
+    raise ValueError(f"Unsupported recommendation cache backend: {url}")
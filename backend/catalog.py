@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from array import array
+from functools import cached_property
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+
+from content_columns import ContentColumns
+from models import BannerItem, ContentItem
+from search_index import SearchIndex
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+banner_list_adapter = TypeAdapter(List[BannerItem])
+content_list_adapter = TypeAdapter(List[ContentItem])
+
+
+class RenderedJson:
+    """A JSON response body serialized once, with a strong ETag over its bytes"""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes, etag: Optional[str] = None):
+        self.body = body
+        self.etag = etag or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def render_banners(items: Sequence[BannerItem]) -> RenderedJson:
+    return RenderedJson(banner_list_adapter.dump_json(list(items)))
+
+
+def render_content(items: Sequence[ContentItem]) -> RenderedJson:
+    return RenderedJson(content_list_adapter.dump_json(list(items)))
+
+
+EMPTY_CONTENT = render_content([])
+
+# Serializes lazy index builds, so threads asking at once build them only once
+_index_lock = threading.RLock()
+
+
+class CategoryIndex:
+    """Content item positions grouped by casefolded category, built once at load time
+
+    ``get`` is a single dict lookup plus materializing that category's items,
+    so a category request never scans the catalog. ``rendered`` returns that
+    category's response body, serialized once here. ``categories`` lists the
+    known categories as written in the data, in first-seen order.
+
+    Groups come from the interned category codes of ``columns``; bodies are
+    rendered from ``items``, the already validated models, so no item is
+    rebuilt from the columns.
+    """
+
+    def __init__(self, items: Sequence[ContentItem] = (), columns: Optional[ContentColumns] = None):
+        if columns is None:
+            columns = items if isinstance(items, ContentColumns) else ContentColumns(items)
+        keys = [name.casefold() for name in columns.category_names]
+        by_code: List[array] = [array("I") for _ in keys]
+        for index, code in enumerate(columns.category_code):
+            by_code[code].append(index)
+        grouped: Dict[str, array] = {}
+        for key in columns.categories:
+            codes = [code for code, code_key in enumerate(keys) if code_key == key]
+            grouped[key] = by_code[codes[0]] if len(codes) == 1 else array(
+                "I", sorted(chain.from_iterable(by_code[code] for code in codes)))
+        self._items = columns
+        self.by_category: Dict[str, array] = grouped
+        self.categories: Tuple[str, ...] = tuple(columns.categories.values())
+        self.bodies: Dict[str, RenderedJson] = {
+            key: render_content([items[index] for index in indexes])
+            for key, indexes in grouped.items()
+        }
+
+    def get(self, category: str) -> Tuple[ContentItem, ...]:
+        return tuple(self._items[index] for index in self.by_category.get(category.casefold(), ()))
+
+    def rendered(self, category: str) -> RenderedJson:
+        return self.bodies.get(category.casefold(), EMPTY_CONTENT)
+
+
+class CatalogSnapshot:
+    """Immutable catalog plus everything derived from it
+
+    A snapshot is built completely before it is published, and a request
+    reads the current snapshot once, so a reload can swap in a new snapshot
+    while in-flight requests keep using the old one. Content is held in a
+    ContentColumns store; ContentItem objects are only built when read.
+    """
+
+    def __init__(
+        self,
+        banners: Sequence[BannerItem] = (),
+        content: Sequence[ContentItem] = (),
+        last_modified: Optional[float] = None,
+    ):
+        self.banners: Tuple[BannerItem, ...] = tuple(banners)
+        items = list(content)
+        self.content: Sequence[ContentItem] = ContentColumns(items)
+        self.last_modified = last_modified if last_modified is not None else time.time()
+        self.content_index = CategoryIndex(items, self.content)
+        # Static catalog responses are serialized once here, from the validated
+        # models, and served as bytes
+        self.banners_body = render_banners(self.banners)
+        self.content_body = render_content(items)
+
+    @cached_property
+    def columns(self) -> ContentColumns:
+        """Columnar view of the content for filtering and sorting"""
+        if isinstance(self.content, ContentColumns):
+            return self.content
+        with _index_lock:
+            # Store it before releasing the lock so a waiting thread reuses it
+            if "columns" not in self.__dict__:
+                self.__dict__["columns"] = ContentColumns(self.content)
+            return self.__dict__["columns"]
+
+    @cached_property
+    def search_index(self) -> SearchIndex:
+        """Full-text index over content titles and categories"""
+        with _index_lock:
+            if "search_index" not in self.__dict__:
+                self.__dict__["search_index"] = SearchIndex(self.columns)
+            return self.__dict__["search_index"]
+
+    @property
+    def indexes_built(self) -> bool:
+        return "columns" in self.__dict__ and "search_index" in self.__dict__
+
+    def build_indexes(self) -> None:
+        """Build ``columns`` and ``search_index`` now (blocking; run off the event loop)"""
+        self.columns
+        self.search_index
+
+
+def catalog_paths(data_dir: Path) -> Tuple[Path, Path]:
+    return data_dir / "banners.json", data_dir / "content.json"
+
+
+def catalog_signature(data_dir: Path) -> Tuple:
+    """(mtime, size) of each catalog file, None for missing files"""
+    signature = []
+    for path in catalog_paths(data_dir):
+        try:
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def load_catalog(data_dir: Path) -> CatalogSnapshot:
+    """Parse and validate the catalog files into a new snapshot
+
+    Missing files load as empty. Invalid JSON or items that fail model
+    validation raise, so a broken file never replaces a good snapshot.
+    """
+    banners_path, content_path = catalog_paths(data_dir)
+    banners: List[BannerItem] = []
+    content: List[ContentItem] = []
+
+    # Load banners
+    if banners_path.exists():
+        with open(banners_path, "r", encoding="utf-8") as f:
+            banners = [BannerItem(**item) for item in json.load(f)]
+
+    # Load content
+    if content_path.exists():
+        with open(content_path, "r", encoding="utf-8") as f:
+            content = [ContentItem(**item) for item in json.load(f)]
+
+    last_modified = max(
+        [path.stat().st_mtime for path in (banners_path, content_path) if path.exists()],
+        default=None)
+    return CatalogSnapshot(banners, content, last_modified)
+
+
+class CatalogWatcher:
+    """Reload the catalog when its files change, without a restart
+
+    The files are polled every ``interval_seconds``. On a change the new
+    catalog is parsed, validated and indexed in a worker thread, then handed
+    to ``on_reload`` to be swapped in. If loading fails the current snapshot
+    stays in place until the files change again.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        on_reload: Callable[[CatalogSnapshot], None],
+        interval_seconds: float = 2.0,
+        loader: Callable[[Path], CatalogSnapshot] = load_catalog,
+    ):
+        self.data_dir = data_dir
+        self.on_reload = on_reload
+        self.interval_seconds = interval_seconds
+        self.loader = loader
+        self._signature: Optional[Tuple] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> CatalogSnapshot:
+        """Load the current files and remember their signature for later checks"""
+        self._signature = await asyncio.to_thread(catalog_signature, self.data_dir)
+        return await asyncio.to_thread(self.loader, self.data_dir)
+
+    async def check(self) -> bool:
+        """Reload if the files changed since the last check; return True if swapped"""
+        signature = await asyncio.to_thread(catalog_signature, self.data_dir)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            snapshot = await asyncio.to_thread(self.loader, self.data_dir)
+        except Exception as e:
+            logger.error(f"Catalog reload failed, keeping current catalog: {e}")
+            return False
+        self.on_reload(snapshot)
+        logger.info(f"Catalog reloaded: {len(snapshot.banners)} banners, {len(snapshot.content)} content items")
+        return True
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Catalog watch failed: {e}")
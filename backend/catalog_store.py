@@ -0,0 +1,240 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from catalog import (
+    EMPTY_CONTENT,
+    CatalogSnapshot,
+    RenderedJson,
+    banner_list_adapter,
+    catalog_signature,
+    load_catalog,
+)
+from content_columns import ContentColumns
+from models import ContentItem
+from search_index import SearchIndex
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# File layout: header (magic, manifest length), JSON manifest, then 8-byte aligned
+# sections. Offsets in the manifest are relative to the first section. Column
+# and index sections are native-endian arrays, so the manifest records the
+# byte order they were written in.
+MAGIC = b"CATSNAP1"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sQ")
+
+content_item_adapter = TypeAdapter(ContentItem)
+
+
+def _align(offset: int) -> int:
+    return offset + (-offset) % 8
+
+
+def _signature_json(signature: Tuple) -> List:
+    return [list(entry) if entry is not None else None for entry in signature]
+
+
+class _SectionWriter:
+    def __init__(self):
+        self.blobs: List[bytes] = []
+        self.position = 0
+
+    def add(self, data: bytes) -> Dict[str, int]:
+        padding = _align(self.position) - self.position
+        if padding:
+            self.blobs.append(b"\0" * padding)
+            self.position += padding
+        section = {"offset": self.position, "length": len(data)}
+        self.blobs.append(data)
+        self.position += len(data)
+        return section
+
+    def add_all(self, parts: Tuple[Dict[str, Any], Dict[str, bytes]]) -> Dict[str, Any]:
+        """Add the named buffers of a ``to_sections()`` result, next to its metadata"""
+        meta, buffers = parts
+        return {"meta": meta, "sections": {name: self.add(data) for name, data in buffers.items()}}
+
+
+def _compatible(manifest: Optional[dict]) -> bool:
+    return (
+        manifest is not None
+        and manifest.get("version") == FORMAT_VERSION
+        and manifest.get("byteorder") == sys.byteorder
+    )
+
+
+def write_catalog_snapshot(snapshot: CatalogSnapshot, path: Path, source_signature: Tuple = ()) -> None:
+    """Write ``snapshot`` in the binary snapshot format, replacing ``path`` atomically
+
+    Every content item is serialized once; the full content body and each
+    category body are concatenations of those item bytes. The typed columns,
+    sort orders, range checkpoints and search postings are written as they
+    are laid out in memory, so a reader maps them instead of rebuilding them.
+    """
+    sections = _SectionWriter()
+    item_bodies = [content_item_adapter.dump_json(item) for item in snapshot.content]
+    content_body = b"[" + b",".join(item_bodies) + b"]"
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "last_modified": snapshot.last_modified,
+        "source_signature": _signature_json(source_signature),
+        "banners": {**sections.add(snapshot.banners_body.body), "etag": snapshot.banners_body.etag},
+        "content": {**sections.add(content_body), "etag": RenderedJson(content_body).etag},
+        "columns": sections.add_all(snapshot.columns.to_sections()),
+        "search_index": sections.add_all(snapshot.search_index.to_sections()),
+        "categories": [],
+    }
+
+    for name in snapshot.content_index.categories:
+        key = name.casefold()
+        indexes = array("I", snapshot.content_index.by_category[key])
+        body = b"[" + b",".join(item_bodies[index] for index in indexes) + b"]"
+        manifest["categories"].append({
+            "key": key,
+            "name": name,
+            "body": {**sections.add(body), "etag": RenderedJson(body).etag},
+            "items": sections.add(indexes.tobytes()),
+        })
+
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+    header = HEADER.pack(MAGIC, len(manifest_bytes)) + manifest_bytes
+    header += b"\0" * (_align(len(header)) - len(header))
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for blob in sections.blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path: Path) -> Optional[dict]:
+    """Return the manifest of a snapshot file, or None if it is missing or not a snapshot"""
+    try:
+        with open(path, "rb") as f:
+            magic, manifest_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(manifest_length))
+    except (FileNotFoundError, struct.error, ValueError):
+        return None
+
+
+class MappedCategoryIndex:
+    """CategoryIndex over the mapped file: bodies are served from the mapping"""
+
+    def __init__(
+        self,
+        items: ContentColumns,
+        categories: Dict[str, Tuple[RenderedJson, memoryview]],
+        names: Tuple[str, ...],
+    ):
+        self._items = items
+        self._categories = categories
+        self.categories = names
+
+    def get(self, category: str) -> Tuple[ContentItem, ...]:
+        entry = self._categories.get(category.casefold())
+        if entry is None:
+            return ()
+        return tuple(self._items[index] for index in entry[1])
+
+    def rendered(self, category: str) -> RenderedJson:
+        entry = self._categories.get(category.casefold())
+        return entry[0] if entry is not None else EMPTY_CONTENT
+
+
+class MappedCatalogSnapshot(CatalogSnapshot):
+    """CatalogSnapshot backed by a read-only memory-mapped snapshot file
+
+    Opening only parses the small manifest and the banners; response bodies
+    are served straight from the mapping, and the columns, sort orders and
+    search postings are typed views of it (only the filter bitsets, one bit
+    per item, are read into memory). The mapping is shared through the page
+    cache by every worker that opens the same file, so per-worker memory and
+    startup time barely grow with the catalog, and nothing is built per worker.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, manifest_length = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        manifest = json.loads(bytes(view[HEADER.size:HEADER.size + manifest_length]))
+        if not _compatible(manifest):
+            raise ValueError(
+                f"Unsupported catalog snapshot: version {manifest.get('version')}, {manifest.get('byteorder')} endian")
+        base = _align(HEADER.size + manifest_length)
+
+        def section(entry: dict) -> memoryview:
+            start = base + entry["offset"]
+            return view[start:start + entry["length"]]
+
+        def sections(entry: dict) -> Dict[str, memoryview]:
+            return {name: section(part) for name, part in entry["sections"].items()}
+
+        self.path = path
+        self.last_modified = manifest["last_modified"]
+        self.banners = tuple(banner_list_adapter.validate_json(bytes(section(manifest["banners"]))))
+        self.banners_body = RenderedJson(section(manifest["banners"]), manifest["banners"]["etag"])
+        self.content_body = RenderedJson(section(manifest["content"]), manifest["content"]["etag"])
+        columns = ContentColumns.from_sections(manifest["columns"]["meta"], sections(manifest["columns"]))
+        self.content = columns
+        # Already built: store them where the cached properties would
+        self.__dict__["columns"] = columns
+        self.__dict__["search_index"] = SearchIndex.from_sections(
+            columns, manifest["search_index"]["meta"], sections(manifest["search_index"]))
+        categories = {
+            entry["key"]: (
+                RenderedJson(section(entry["body"]), entry["body"]["etag"]),
+                section(entry["items"]).cast("I"),
+            )
+            for entry in manifest["categories"]
+        }
+        names = tuple(entry["name"] for entry in manifest["categories"])
+        self.content_index = MappedCategoryIndex(self.content, categories, names)
+
+
+def load_mapped_catalog(data_dir: Path, snapshot_path: Path) -> MappedCatalogSnapshot:
+    """Map the shared snapshot file, rebuilding it first if the JSON files changed
+
+    An exclusive lock next to the snapshot makes sure only one worker rebuilds
+    it; the others wait and then map the file that worker wrote.
+    """
+    signature = catalog_signature(data_dir)
+    lock_path = snapshot_path.with_name(snapshot_path.name + ".lock")
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = read_manifest(snapshot_path)
+            if not _compatible(manifest) or manifest.get("source_signature") != _signature_json(signature):
+                logger.info(f"Building catalog snapshot {snapshot_path}")
+                write_catalog_snapshot(load_catalog(data_dir), snapshot_path, signature)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return MappedCatalogSnapshot(snapshot_path)
+
+
+if __name__ == "__main__":
+    # Build the snapshot ahead of time: python catalog_store.py [data_dir] [snapshot_path]
+    data_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "data"
+    snapshot_path = Path(sys.argv[2]) if len(sys.argv) > 2 else data_dir / "catalog.snap"
+    snapshot = load_mapped_catalog(data_dir, snapshot_path)
+    print(f"{snapshot_path}: {len(snapshot.banners)} banners, {len(snapshot.content)} content items")
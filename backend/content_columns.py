@@ -0,0 +1,348 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models import ContentItem
+
+
+# Columns with presorted orders; "-name" is the descending order of "name"
+SORT_COLUMNS = ("price", "rating", "discount")
+# Columns that support range filters; each keeps prefix bitsets of its sorted
+# order at evenly spaced checkpoints, as many as fit in the byte budget
+RANGE_COLUMNS = ("price", "rating")
+RANGE_CHECKPOINTS = (128, 1024)
+RANGE_CHECKPOINT_BYTES = 4 * 1024 * 1024
+# Bits of the per-item ``flags`` column
+HAS_ORIGINAL_PRICE, IS_NEW, IS_SALE, IS_RECOMMENDED = 1, 2, 4, 8
+# Typed array columns and their typecodes, string columns and flag bitsets,
+# as written by ``to_sections``
+ARRAY_COLUMNS = {
+    "price": "q", "original_price": "q", "rating": "d", "discount": "d", "category_code": "I", "flags": "B",
+}
+STRING_COLUMNS = ("ids", "titles", "image_urls")
+FLAG_BITSETS = ("has_original_price", "is_new", "is_sale", "is_recommended")
+
+
+def mask_from_indexes(indexes: Iterable[int], size: int) -> int:
+    """Build a bitset with the given item indexes set, in O(size / 8 + len(indexes))"""
+    # One bit per item in a little-endian buffer; int.from_bytes is a copy, not a parse
+    bits = bytearray((size + 7) >> 3)
+    for index in indexes:
+        bits[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bits, "little")
+
+
+def indexes_from_mask(mask: int) -> List[int]:
+    """Item indexes set in ``mask``, ascending, in O(bits + set bits)"""
+    bits = bin(mask)[:1:-1]  # least significant bit first
+    indexes = []
+    position = bits.find("1")
+    while position != -1:
+        indexes.append(position)
+        position = bits.find("1", position + 1)
+    return indexes
+
+
+class StringColumn(Sequence):
+    """Read-only sequence of strings stored as one UTF-8 buffer plus end offsets
+
+    Strings are decoded when indexed, so the buffer can be a view of a
+    memory-mapped file.
+    """
+
+    def __init__(self, data, ends):
+        self._data = data
+        self._ends = ends
+
+    @staticmethod
+    def pack(strings: Iterable[str]) -> Tuple[bytes, bytes]:
+        """Encode ``strings`` as (UTF-8 buffer, native "Q" end offsets)"""
+        encoded = [string.encode("utf-8") for string in strings]
+        ends = array("Q")
+        end = 0
+        for data in encoded:
+            end += len(data)
+            ends.append(end)
+        return b"".join(encoded), ends.tobytes()
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string column index out of range")
+        start = self._ends[index - 1] if index else 0
+        return str(self._data[start:self._ends[index]], "utf-8")
+
+
+class ContentColumns(Sequence):
+    """Compact columnar store for the content catalog
+
+    Numeric fields live in typed arrays, the boolean flags in integer bitsets
+    (bit ``i`` is item ``i``) and the category as an interned code, so filters
+    combine with a few big-int operations instead of per-item Python work.
+    The same flags are kept per item in the ``flags`` byte column, so reading
+    one item never touches the catalog-wide bitsets.
+    It behaves as a read-only ``Sequence[ContentItem]``: an item is only
+    materialized when it is indexed, e.g. at the response boundary. Optional
+    flags that were ``None`` in the source read back as ``False``.
+
+    Every sort order in ``orders`` is an index array presorted at build time
+    by (value, id), so a page in any order starts with one binary search.
+    Range filters binary-search the sorted order and combine precomputed
+    prefix bitsets, so only the items between a bound and its nearest
+    checkpoint are visited. The prefix bitsets are stored back to back in
+    one byte buffer per column and decoded only when a filter uses them.
+
+    ``to_sections`` and ``from_sections`` store the built columns as plain
+    byte buffers, so a snapshot file can be mapped and used as is.
+    """
+
+    def __init__(self, items: Iterable[ContentItem] = ()):
+        ids: List[str] = []
+        titles: List[str] = []
+        image_urls: List[str] = []
+        self.price = array("q")
+        self.original_price = array("q")
+        self.rating = array("d")
+        self.discount = array("d")
+        self.category_code = array("I")
+        self.flags = array("B")
+        self.category_names: List[str] = []
+        self._category_codes: Dict[str, int] = {}
+        has_original: List[int] = []
+        is_new: List[int] = []
+        is_sale: List[int] = []
+        is_recommended: List[int] = []
+
+        for index, item in enumerate(items):
+            ids.append(item.id)
+            titles.append(item.title)
+            image_urls.append(item.imageUrl)
+            self.price.append(item.price)
+            self.original_price.append(item.originalPrice or 0)
+            self.rating.append(item.rating)
+            self.discount.append(
+                (item.originalPrice - item.price) / item.originalPrice
+                if item.originalPrice and item.originalPrice > item.price else 0.0)
+            self.category_code.append(self._intern_category(item.category))
+            self.flags.append(
+                (HAS_ORIGINAL_PRICE if item.originalPrice is not None else 0)
+                | (IS_NEW if item.isNew else 0)
+                | (IS_SALE if item.isSale else 0)
+                | (IS_RECOMMENDED if item.isRecommended else 0))
+            if item.originalPrice is not None:
+                has_original.append(index)
+            if item.isNew:
+                is_new.append(index)
+            if item.isSale:
+                is_sale.append(index)
+            if item.isRecommended:
+                is_recommended.append(index)
+
+        self.ids: Tuple[str, ...] = tuple(ids)
+        self.titles: Tuple[str, ...] = tuple(titles)
+        self.image_urls: Tuple[str, ...] = tuple(image_urls)
+        size = len(self.ids)
+        self.all = (1 << size) - 1
+        # Item indexes sorted by (id, index), so the first item wins if an id repeats
+        self.id_order = array("I", sorted(range(size), key=lambda i: self.ids[i]))
+        self.has_original_price = mask_from_indexes(has_original, size)
+        self.is_new = mask_from_indexes(is_new, size)
+        self.is_sale = mask_from_indexes(is_sale, size)
+        self.is_recommended = mask_from_indexes(is_recommended, size)
+        grouped: Dict[str, List[int]] = {}
+        categories: Dict[str, str] = {}
+        for index, code in enumerate(self.category_code):
+            key = self.category_names[code].casefold()
+            grouped.setdefault(key, []).append(index)
+            categories.setdefault(key, self.category_names[code])
+        self.category_masks: Dict[str, int] = {
+            key: mask_from_indexes(indexes, size) for key, indexes in grouped.items()
+        }
+        # Category spelling first seen in the data, per casefolded key
+        self.categories: Dict[str, str] = categories
+
+        # "" is catalog order; ids break ties so every order is total and stable
+        self.orders: Dict[str, array] = {"": array("I", range(size))}
+        ids = self.ids
+        for name in SORT_COLUMNS:
+            column = getattr(self, name)
+            self.orders[name] = array("I", sorted(range(size), key=lambda i: (column[i], ids[i])))
+            self.orders[f"-{name}"] = array("I", sorted(range(size), key=lambda i: (-column[i], ids[i])))
+
+        # prefix_bits[name] holds the bitset of orders[name][:c * checkpoint_step]
+        # for every checkpoint c, each ``mask_bytes`` long
+        self.mask_bytes = (size + 7) >> 3
+        low, high = RANGE_CHECKPOINTS
+        checkpoints = min(high, max(low, RANGE_CHECKPOINT_BYTES // max(1, self.mask_bytes)))
+        self.checkpoint_step = max(1, -(-size // checkpoints))
+        self.prefix_bits: Dict[str, bytes] = {}
+        for name in RANGE_COLUMNS:
+            order = self.orders[name]
+            bits = bytearray(self.mask_bytes)
+            prefixes = [bytes(bits)]
+            for start in range(0, size - self.checkpoint_step + 1, self.checkpoint_step):
+                for index in order[start:start + self.checkpoint_step]:
+                    bits[index >> 3] |= 1 << (index & 7)
+                prefixes.append(bytes(bits))
+            self.prefix_bits[name] = b"".join(prefixes)
+
+    def to_sections(self) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+        """The columns as (JSON-serializable metadata, named byte buffers) for ``from_sections``"""
+        meta = {
+            "category_names": self.category_names,
+            "categories": self.categories,
+            "checkpoint_step": self.checkpoint_step,
+            "mask_bytes": self.mask_bytes,
+        }
+        sections = {name: getattr(self, name).tobytes() for name in ARRAY_COLUMNS}
+        for name in STRING_COLUMNS:
+            sections[f"{name}.data"], sections[f"{name}.ends"] = StringColumn.pack(getattr(self, name))
+        sections["id_order"] = self.id_order.tobytes()
+        for name in FLAG_BITSETS:
+            sections[name] = getattr(self, name).to_bytes(self.mask_bytes, "little")
+        for key, mask in self.category_masks.items():
+            sections[f"category:{key}"] = mask.to_bytes(self.mask_bytes, "little")
+        for sort, order in self.orders.items():
+            sections[f"order:{sort}"] = order.tobytes()
+        for name, bits in self.prefix_bits.items():
+            sections[f"prefix_bits:{name}"] = bits
+        return meta, sections
+
+    @classmethod
+    def from_sections(cls, meta: Dict[str, Any], sections: Dict[str, memoryview]) -> "ContentColumns":
+        """Columns over the buffers written by ``to_sections``, without copying them
+
+        Arrays and sort orders become typed memoryview casts and strings are
+        decoded on access; only the bitsets, a bit per item each, are read
+        into ints.
+        """
+        columns = cls.__new__(cls)
+        for name, typecode in ARRAY_COLUMNS.items():
+            setattr(columns, name, sections[name].cast(typecode))
+        for name in STRING_COLUMNS:
+            setattr(columns, name, StringColumn(sections[f"{name}.data"], sections[f"{name}.ends"].cast("Q")))
+        columns.id_order = sections["id_order"].cast("I")
+        columns.all = (1 << len(columns.ids)) - 1
+        for name in FLAG_BITSETS:
+            setattr(columns, name, int.from_bytes(sections[name], "little"))
+        columns.category_names = list(meta["category_names"])
+        columns._category_codes = {name: code for code, name in enumerate(columns.category_names)}
+        columns.categories = dict(meta["categories"])
+        columns.category_masks = {
+            key: int.from_bytes(sections[f"category:{key}"], "little") for key in columns.categories
+        }
+        columns.orders = {
+            sort: sections[f"order:{sort}"].cast("I")
+            for sort in ("",) + SORT_COLUMNS + tuple(f"-{name}" for name in SORT_COLUMNS)
+        }
+        columns.checkpoint_step = meta["checkpoint_step"]
+        columns.mask_bytes = meta["mask_bytes"]
+        columns.prefix_bits = {name: sections[f"prefix_bits:{name}"] for name in RANGE_COLUMNS}
+        return columns
+
+    def sort_key(self, sort: str, index: int) -> Tuple:
+        """Position of item ``index`` in the ``sort`` order, as a comparable key"""
+        if not sort:
+            return (index, self.ids[index])
+        if sort.startswith("-"):
+            return (-getattr(self, sort[1:])[index], self.ids[index])
+        return (getattr(self, sort)[index], self.ids[index])
+
+    def order_position_after(self, sort: str, key: Tuple) -> int:
+        """Position in ``orders[sort]`` of the first item sorting after ``key``"""
+        return bisect_right(self.orders[sort], tuple(key), key=lambda i: self.sort_key(sort, i))
+
+    def range_bounds(self, name: str, low=None, high=None) -> Tuple[int, int]:
+        """Positions [start, end) in ``orders[name]`` of items with low <= value <= high"""
+        order = self.orders[name]
+        column = getattr(self, name)
+        start = 0 if low is None else bisect_left(order, low, key=column.__getitem__)
+        end = len(order) if high is None else bisect_right(order, high, key=column.__getitem__)
+        return start, max(start, end)
+
+    def _prefix_mask(self, name: str, position: int) -> int:
+        """Bitset of ``orders[name][:position]``, from the nearest checkpoint
+
+        The checkpoint's bytes are copied and only the items between it and
+        ``position`` (at most half a step) are set or cleared, bit by bit,
+        before the one conversion to an int.
+        """
+        step, width = self.checkpoint_step, self.mask_bytes
+        prefix_bits = self.prefix_bits[name]
+        checkpoint = min((position + step // 2) // step, len(prefix_bits) // max(1, width) - 1)
+        bits = bytearray(prefix_bits[checkpoint * width:(checkpoint + 1) * width])
+        at = checkpoint * step
+        order = self.orders[name]
+        if at <= position:
+            for index in order[at:position]:
+                bits[index >> 3] |= 1 << (index & 7)
+        else:
+            for index in order[position:at]:
+                bits[index >> 3] &= ~(1 << (index & 7))
+        return int.from_bytes(bits, "little")
+
+    def range_mask(self, name: str, low=None, high=None) -> int:
+        """Bitset of the items whose ``name`` column is within [low, high]"""
+        start, end = self.range_bounds(name, low, high)
+        if end - start <= self.checkpoint_step:
+            return mask_from_indexes(self.orders[name][start:end], len(self))
+        mask = self._prefix_mask(name, end)
+        return mask ^ self._prefix_mask(name, start) if start else mask
+
+    def _intern_category(self, category: str) -> int:
+        code = self._category_codes.get(category)
+        if code is None:
+            code = len(self.category_names)
+            self._category_codes[category] = code
+            self.category_names.append(category)
+        return code
+
+    def category_mask(self, category: str) -> int:
+        """Bitset of the items in ``category`` (case-insensitive), 0 if unknown"""
+        return self.category_masks.get(category.casefold(), 0)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("content item index out of range")
+        # Values were validated when the columns were built
+        return ContentItem.model_construct(**self.row(index))
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Item ``index`` as the dict ``model_dump()`` would return, without building a model"""
+        # The flags column, not the bitsets: masking a bitset costs O(index)
+        flags = self.flags[index]
+        return {
+            "id": self.ids[index],
+            "title": self.titles[index],
+            "price": self.price[index],
+            "originalPrice": self.original_price[index] if flags & HAS_ORIGINAL_PRICE else None,
+            "rating": self.rating[index],
+            "imageUrl": self.image_urls[index],
+            "category": self.category_names[self.category_code[index]],
+            "isNew": bool(flags & IS_NEW),
+            "isSale": bool(flags & IS_SALE),
+            "isRecommended": bool(flags & IS_RECOMMENDED),
+        }
+
+    def get_by_id(self, item_id: str) -> Optional[ContentItem]:
+        position = bisect_left(self.id_order, item_id, key=self.ids.__getitem__)
+        if position < len(self.id_order) and self.ids[self.id_order[position]] == item_id:
+            return self[self.id_order[position]]
+        return None
+
+    def materialize(self, indexes: Iterable[int]) -> List[ContentItem]:
+        return [self[index] for index in indexes]
@@ -0,0 +1,200 @@
+import base64
+import binascii
+import json
+import math
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from catalog import RenderedJson
+from content_columns import SORT_COLUMNS, ContentColumns, indexes_from_mask
+from models import ContentItem
+
+SORTS = ("",) + SORT_COLUMNS + tuple(f"-{name}" for name in SORT_COLUMNS)
+
+
+class ContentQueryError(ValueError):
+    """A content query parameter that cannot be served (reported as 400)"""
+
+
+def parse_sort(sort: Optional[str]) -> str:
+    sort = (sort or "").strip()
+    if sort not in SORTS:
+        raise ContentQueryError(f"Unsupported sort: {sort!r}; use one of {', '.join(filter(None, SORTS))}")
+    return sort
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Parse a comma-separated ``fields=`` projection; None selects every field"""
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in ContentItem.model_fields]
+    if unknown:
+        raise ContentQueryError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def encode_cursor(sort: str, key: Tuple) -> str:
+    raw = json.dumps([sort, *key], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    """Decode a cursor into the sort key of the last item already returned"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, *key = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ContentQueryError("Invalid cursor")
+    if cursor_sort != sort or len(key) != 2:
+        raise ContentQueryError("Cursor does not belong to this sort order")
+    # (position, id) in catalog order, (value, id) in a column order; anything
+    # else would not compare with the keys of the order it is searched in
+    value, item_id = key
+    number = int if not sort else (int, float)
+    if (not isinstance(value, number) or isinstance(value, bool) or not isinstance(item_id, str)
+            or not math.isfinite(value)):
+        raise ContentQueryError("Invalid cursor")
+    return value, item_id
+
+
+# Below this share of matching items in the scanned window, matches are sorted
+# directly instead of walking the presorted order and skipping non-matches
+WALK_MIN_DENSITY = 1 / 16
+
+
+class ContentFilters:
+    """Server-side content filters, evaluated as bitset operations
+
+    Price and rating ranges come from the sorted range indexes, flags and
+    categories from precomputed bitsets; combining them is a handful of
+    big-int ANDs regardless of how many items match. ``None`` means the
+    filter is not applied; a flag set to False selects items without it.
+    """
+
+    def __init__(
+        self,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_rating: Optional[float] = None,
+        is_new: Optional[bool] = None,
+        is_sale: Optional[bool] = None,
+        is_recommended: Optional[bool] = None,
+        categories: Iterable[str] = (),
+    ):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.min_rating = min_rating
+        self.flags = {"is_new": is_new, "is_sale": is_sale, "is_recommended": is_recommended}
+        self.categories = tuple(categories)
+
+    def masks(self, columns: ContentColumns) -> Tuple[int, int]:
+        """Return (matching items, matching items ignoring the category filter)"""
+        mask = columns.all
+        if self.min_price is not None or self.max_price is not None:
+            mask &= columns.range_mask("price", self.min_price, self.max_price)
+        if self.min_rating is not None:
+            mask &= columns.range_mask("rating", self.min_rating)
+        for name, wanted in self.flags.items():
+            if wanted is not None:
+                flag = getattr(columns, name)
+                mask &= flag if wanted else columns.all & ~flag
+        if not self.categories:
+            return mask, mask
+        selected = 0
+        for category in self.categories:
+            selected |= columns.category_mask(category)
+        return mask & selected, mask
+
+    def window(self, columns: ContentColumns, sort: str) -> Tuple[int, int]:
+        """Positions in ``orders[sort]`` that can hold matches, narrowed by a range on the sort column"""
+        name = sort.lstrip("-")
+        if name == "price" and (self.min_price is not None or self.max_price is not None):
+            start, end = columns.range_bounds("price", self.min_price, self.max_price)
+        elif name == "rating" and self.min_rating is not None:
+            start, end = columns.range_bounds("rating", self.min_rating)
+        else:
+            return 0, len(columns)
+        if sort.startswith("-"):
+            # The same items, counted from the other end of the descending order
+            return len(columns) - end, len(columns) - start
+        return start, end
+
+
+def facet_counts(columns: ContentColumns, mask: int, category_base: int) -> Dict[str, Any]:
+    """Counts per category and flag; category counts ignore the category filter"""
+    return {
+        "category": {
+            columns.categories[key]: (category_base & category).bit_count()
+            for key, category in columns.category_masks.items()
+        },
+        "isNew": (mask & columns.is_new).bit_count(),
+        "isSale": (mask & columns.is_sale).bit_count(),
+        "isRecommended": (mask & columns.is_recommended).bit_count(),
+    }
+
+
+def _select(
+    columns: ContentColumns, sort: str, after: Optional[Tuple], limit: int,
+    mask: int, total: int, window: Tuple[int, int],
+) -> List[int]:
+    """Up to ``limit + 1`` matching item indexes following ``after`` in the ``sort`` order"""
+    order = columns.orders[sort]
+    start = columns.order_position_after(sort, after) if after is not None else 0
+    start, end = max(start, window[0]), window[1]
+    if mask == columns.all:
+        return list(order[start:min(end, start + limit + 1)])
+
+    if total < (window[1] - window[0]) * WALK_MIN_DENSITY:
+        matches = sorted(indexes_from_mask(mask), key=lambda i: columns.sort_key(sort, i))
+        first = bisect_right(matches, after, key=lambda i: columns.sort_key(sort, i)) if after is not None else 0
+        return matches[first:first + limit + 1]
+
+    bits = mask.to_bytes((len(columns) + 7) // 8, "little")
+    selected = []
+    # Index positions directly: islice would step through the first ``start`` entries
+    for position in range(start, end):
+        index = order[position]
+        if bits[index >> 3] >> (index & 7) & 1:
+            selected.append(index)
+            if len(selected) > limit:
+                break
+    return selected
+
+
+def page_content(
+    columns: ContentColumns,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    filters: Optional[ContentFilters] = None,
+) -> RenderedJson:
+    """Render one page of content as ``{"items", "nextCursor", "total", "facets"}``
+
+    Pages are keyset-paginated over the presorted order for ``sort``: the
+    cursor carries the sort key of the last item returned, so the next page
+    starts with a binary search and only ``limit`` items are materialized and
+    serialized, however large the catalog is. Reloads between pages do not
+    skip or repeat items that kept their sort key.
+    """
+    sort = parse_sort(sort)
+    projection = parse_fields(fields)
+    after = decode_cursor(cursor, sort) if cursor else None
+    filters = filters or ContentFilters()
+    mask, category_base = filters.masks(columns)
+    total = mask.bit_count()
+    limit = len(columns) if limit is None else limit
+
+    indexes = _select(columns, sort, after, limit, mask, total, filters.window(columns, sort))
+    next_cursor = encode_cursor(sort, columns.sort_key(sort, indexes[limit - 1])) if len(indexes) > limit else None
+    items = [columns.row(index) for index in indexes[:limit]]
+    if projection:
+        items = [{name: item[name] for name in projection} for item in items]
+    body = json.dumps({
+        "items": items,
+        "nextCursor": next_cursor,
+        "total": total,
+        "facets": facet_counts(columns, mask, category_base),
+    }, ensure_ascii=False, separators=(",", ":"))
+    return RenderedJson(body.encode("utf-8"))
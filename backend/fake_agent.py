@@ -0,0 +1,224 @@
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+from azure.ai.agents.models import AgentStreamEvent
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Item ids inlined in the prompt by azure_agent.build_prompt
+_CANDIDATE_ID = re.compile(r'"id":"([^"]+)"')
+# Answered when the prompt offers no candidates (the agent searched content.json)
+DEFAULT_ANSWER_ID = "1"
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Sampler of agent run latencies in seconds for a latency spec in milliseconds
+
+    ``800`` is a fixed latency, ``uniform:200:1500`` is uniform between the
+    two bounds and ``lognormal:800:0.5`` is log-normal with an 800ms median
+    and shape 0.5, which gives the long tail real agent runs have.
+    """
+    kind, _, params = spec.strip().partition(":")
+    try:
+        if not params:
+            fixed = float(kind) / 1000
+            return lambda rng: fixed
+        values = [float(value) for value in params.split(":")]
+        if kind == "uniform" and len(values) == 2:
+            low, high = values[0] / 1000, values[1] / 1000
+            return lambda rng: rng.uniform(low, high)
+        if kind == "lognormal" and len(values) == 2:
+            median, sigma = values[0] / 1000, values[1]
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Unsupported latency spec: {spec!r}")
+
+
+class _Agents:
+    """The ``project.agents`` operations azure_agent uses"""
+
+    def __init__(self, client: "FakeProjectClient"):
+        self.threads = SimpleNamespace(create=client.create_thread, delete=client.delete_thread)
+        self.messages = SimpleNamespace(create=client.create_message, list=client.list_messages)
+        self.runs = SimpleNamespace(
+            create_and_process=client.create_and_process, stream=client.stream, cancel=client.cancel)
+        self.get_agent = client.get_agent
+
+
+class FakeProjectClient:
+    """Local stand-in for ``AIProjectClient`` with configurable agent behaviour
+
+    Implements the thread, message and run calls azure_agent makes, without
+    network or credentials. Each run sleeps for a latency drawn from
+    ``latency`` (see ``parse_latency``), then answers with the first candidate
+    id offered in the prompt, wrapped in prose like a real reply. A share of
+    runs end ``failed`` (``failure_rate``) and a share of calls raise like a
+    dropped connection (``error_rate``). Streamed runs deliver the reply in
+    ``stream_chunks`` deltas spread over the run latency.
+
+    Counters (``runs``, ``failures``, ``errors``, ``cancelled``,
+    ``max_concurrent_runs``) let load tests see what reached the agent.
+    """
+
+    def __init__(
+        self,
+        latency: str = "800",
+        failure_rate: float = 0.0,
+        error_rate: float = 0.0,
+        stream_chunks: int = 8,
+        seed: Optional[int] = None,
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self.agents = _Agents(self)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._prompts: Dict[str, str] = {}
+        self._answers: Dict[str, str] = {}
+        self._active_runs = 0
+        self.runs = 0
+        self.failures = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.max_concurrent_runs = 0
+
+    @classmethod
+    def from_env(cls) -> "FakeProjectClient":
+        """Client configured from the FAKE_AGENT_* environment variables"""
+        seed = os.getenv("FAKE_AGENT_SEED")
+        return cls(
+            latency=os.getenv("FAKE_AGENT_LATENCY_MS", "800"),
+            failure_rate=float(os.getenv("FAKE_AGENT_FAILURE_RATE", "0")),
+            error_rate=float(os.getenv("FAKE_AGENT_ERROR_RATE", "0")),
+            stream_chunks=int(os.getenv("FAKE_AGENT_STREAM_CHUNKS", "8")),
+            seed=int(seed) if seed else None)
+
+    def _next_id(self, prefix: str) -> str:
+        return f"{prefix}_fake{next(self._ids)}"
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def _maybe_error(self) -> None:
+        if self._draw() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise ConnectionError("Fake agent connection dropped")
+
+    @contextmanager
+    def _run(self):
+        with self._lock:
+            self.runs += 1
+            self._active_runs += 1
+            self.max_concurrent_runs = max(self.max_concurrent_runs, self._active_runs)
+            latency = self.sample_latency(self._random)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        try:
+            yield latency, failed
+        finally:
+            with self._lock:
+                self._active_runs -= 1
+
+    def answer_for(self, prompt: str) -> str:
+        """The reply text for ``prompt``: prose around one JSON object"""
+        offered = _CANDIDATE_ID.findall(prompt)
+        if '{"ids": [""]}' in prompt:
+            answer = {"ids": offered[:3] or [DEFAULT_ANSWER_ID]}
+        else:
+            answer = {"id": offered[0] if offered else DEFAULT_ANSWER_ID}
+        return f"おすすめはこちらです。\n{json.dumps(answer, ensure_ascii=False)}\nご検討ください。"
+
+    def get_agent(self, agent_id: Optional[str] = None):
+        self._maybe_error()
+        return SimpleNamespace(id=agent_id or "asst_fake")
+
+    def create_thread(self):
+        self._maybe_error()
+        return SimpleNamespace(id=self._next_id("thread"))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._prompts.pop(thread_id, None)
+            self._answers.pop(thread_id, None)
+
+    def create_message(self, thread_id: str, role: str, content: str):
+        self._maybe_error()
+        with self._lock:
+            self._prompts[thread_id] = content
+        return SimpleNamespace(id=self._next_id("msg"))
+
+    def create_and_process(self, thread_id: str, agent_id: str):
+        self._maybe_error()
+        run_id = self._next_id("run")
+        with self._run() as (latency, failed):
+            time.sleep(latency)
+        if failed:
+            return SimpleNamespace(
+                id=run_id, status="failed", last_error={"code": "server_error", "message": "Fake run failed"})
+        with self._lock:
+            self._answers[thread_id] = self.answer_for(self._prompts.get(thread_id, ""))
+        return SimpleNamespace(id=run_id, status="completed", last_error=None)
+
+    def list_messages(self, thread_id: str, run_id: Optional[str] = None, order=None, limit: Optional[int] = None):
+        with self._lock:
+            answer = self._answers.get(thread_id)
+        if answer is None:
+            return []
+        text = SimpleNamespace(text=SimpleNamespace(value=answer))
+        return [SimpleNamespace(id=self._next_id("msg"), role="assistant", text_messages=[text])]
+
+    @contextmanager
+    def stream(self, thread_id: str, agent_id: str):
+        self._maybe_error()
+        yield self._events(thread_id)
+
+    def _events(self, thread_id: str):
+        run = SimpleNamespace(id=self._next_id("run"), status="in_progress", last_error=None)
+        with self._run() as (latency, failed):
+            yield AgentStreamEvent.THREAD_RUN_CREATED, run, None
+            if failed:
+                time.sleep(latency / 2)
+                run.status = "failed"
+                run.last_error = {"code": "server_error", "message": "Fake run failed"}
+                yield AgentStreamEvent.THREAD_RUN_FAILED, run, None
+                return
+            answer = self.answer_for(self._prompts.get(thread_id, ""))
+            step = -(-len(answer) // self.stream_chunks)
+            for start in range(0, len(answer), step):
+                time.sleep(latency / self.stream_chunks)
+                yield AgentStreamEvent.THREAD_MESSAGE_DELTA, SimpleNamespace(text=answer[start:start + step]), None
+            run.status = "completed"
+            yield AgentStreamEvent.THREAD_RUN_COMPLETED, run, None
+            yield AgentStreamEvent.DONE, "[DONE]", None
+
+    def cancel(self, thread_id: str, run_id: str) -> None:
+        with self._lock:
+            self.cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "failures": self.failures,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "max_concurrent_runs": self.max_concurrent_runs,
+            }
+
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from recommendation_cache import RecommendationCache, normalize_query
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class HotQueryTracker:
+    """Learn the most requested recommendation queries from recent traffic
+
+    ``record`` is a single dict update on the request path. Counts are halved
+    on every ``decay`` so the hot set follows recent traffic, and only the
+    ``max_tracked`` busiest keys are kept.
+    """
+
+    def __init__(self, max_tracked: int = 1000):
+        self.max_tracked = max_tracked
+        self._counts: Dict[str, float] = {}
+        # One representative raw query per key, passed to the agent as typed
+        self._queries: Dict[str, Optional[str]] = {}
+
+    def record(self, query: Optional[str]) -> None:
+        key = normalize_query(query)
+        self._counts[key] = self._counts.get(key, 0.0) + 1.0
+        if key not in self._queries:
+            self._queries[key] = query
+
+    def top(self, n: int, min_hits: float = 1.0) -> List[Optional[str]]:
+        """Return up to ``n`` queries with at least ``min_hits`` recent hits, busiest first"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return [self._queries[key] for key, count in ranked[:n] if count >= min_hits]
+
+    def decay(self) -> None:
+        for key in list(self._counts):
+            self._counts[key] /= 2
+            if self._counts[key] < 0.5:
+                del self._counts[key]
+                del self._queries[key]
+        if len(self._counts) > self.max_tracked:
+            ranked = sorted(self._counts, key=self._counts.get, reverse=True)
+            for key in ranked[self.max_tracked:]:
+                del self._counts[key]
+                del self._queries[key]
+
+
+class HotQueryRefresher:
+    """Keep hot recommendation queries fresh in the cache
+
+    Every ``interval_seconds`` (+/- ``jitter`` as a fraction) the configured
+    queries plus the ``top_n`` learned ones are refreshed against the agent,
+    at most ``concurrency`` at a time. A query is only refreshed when its
+    cache entry would turn stale before the next cycle, so user requests for
+    hot queries are always answered from the cache.
+    """
+
+    def __init__(
+        self,
+        cache: RecommendationCache,
+        tracker: HotQueryTracker,
+        static_queries: Iterable[Optional[str]] = (None,),
+        interval_seconds: float = 60.0,
+        jitter: float = 0.1,
+        concurrency: int = 2,
+        top_n: int = 10,
+        min_hits: float = 2.0,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.cache = cache
+        self.tracker = tracker
+        self.static_queries = list(static_queries)
+        self.interval_seconds = interval_seconds
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.top_n = top_n
+        self.min_hits = min_hits
+        self.sleep = sleep
+        self._task: Optional[asyncio.Task] = None
+
+    def hot_queries(self) -> List[Optional[str]]:
+        queries = {}
+        for query in self.static_queries + self.tracker.top(self.top_n, self.min_hits):
+            queries.setdefault(normalize_query(query), query)
+        return list(queries.values())
+
+    async def refresh_once(self) -> int:
+        """Refresh every hot query that is due; return how many were refreshed"""
+        due = [
+            query for query in self.hot_queries()
+            if await self.cache.fresh_for(query) < self.interval_seconds * (1 + self.jitter)
+        ]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(query):
+            async with semaphore:
+                try:
+                    await self.cache.refresh(query)
+                except Exception as e:
+                    logger.error(f"Hot query refresh failed for {query!r}: {e}")
+
+        await asyncio.gather(*(refresh(query) for query in due))
+        self.tracker.decay()
+        if due:
+            logger.info(f"Refreshed {len(due)} hot recommendation queries")
+        return len(due)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        # Small random delay first so the workers do not all hit the agent at once
+        await self.sleep(random.uniform(0, self.jitter * self.interval_seconds))
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.error(f"Hot query refresh cycle failed: {e}")
+            spread = self.jitter * self.interval_seconds
+            await self.sleep(self.interval_seconds + random.uniform(-spread, spread))
@@ -0,0 +1,148 @@
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Characters that change the scanner state outside and inside string values
+_STRUCTURE = re.compile(r'[{}"]')
+_STRING = re.compile(r'["\\]')
+# Longest span kept open waiting for its closing brace; replies carry small objects
+MAX_SPAN_CHARS = 16_384
+
+
+class JsonObjectExtractor:
+    """Incrementally find JSON objects embedded in free text
+
+    Text is fed in chunks (e.g. streamed message deltas) and scanned by a
+    small brace/string-aware state machine, so braces inside string values do
+    not confuse it. The scanner jumps between structural characters with
+    ``str.find``/regex searches, so prose costs almost nothing. Each balanced
+    top-level ``{...}`` span is decoded as soon as its closing brace arrives;
+    spans that are not valid JSON objects, or that ``validate`` rejects by
+    raising ``ValueError``, are counted in ``rejected``.
+
+    A rejected span may have started at a brace in prose (``:-{``) or wrap an
+    object in other text, so scanning resumes at the next ``{`` after the
+    rejected span's opening brace. A span still open after ``max_span``
+    characters, or when ``finish`` is called at the end of the text, is
+    abandoned the same way.
+
+    By default scanning stops at the first accepted object. With
+    ``collect_all`` every accepted object is kept in ``objects``.
+    """
+
+    def __init__(
+        self,
+        validate: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        collect_all: bool = False,
+        max_span: int = MAX_SPAN_CHARS,
+    ):
+        self.validate = validate
+        self.collect_all = collect_all
+        self.max_span = max_span
+        # Text from the open span's opening brace (or not yet scanned) onwards
+        self._text = ""
+        self._position = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self.first: Optional[Dict[str, Any]] = None
+        self.objects: List[Dict[str, Any]] = []
+        self.rejected = 0
+
+    @property
+    def _done(self) -> bool:
+        return self.first is not None and not self.collect_all
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """Scan ``chunk`` and return the first accepted JSON object seen so far"""
+        if self._done:
+            return self.first
+        self._text += chunk
+        self._scan()
+        return self.first
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Mark the end of the text: abandon an unclosed span and scan what follows its opening brace"""
+        while self._start is not None and not self._done:
+            self._position, self._start = self._start + 1, None
+            self._scan()
+        return self.first
+
+    def _scan(self) -> None:
+        text = self._text
+        position = self._position
+        while not self._done:
+            if self._start is None:
+                start = text.find("{", position)
+                if start == -1:
+                    position = len(text)
+                    break
+                self._start, self._depth, self._in_string = start, 1, False
+                position = start + 1
+                continue
+            # An open span is only searched up to its size limit
+            limit = min(len(text), self._start + self.max_span)
+            match = (_STRING if self._in_string else _STRUCTURE).search(text, position, limit)
+            if match is None:
+                if limit < len(text):
+                    position, self._start = self._start + 1, None
+                    continue
+                position = len(text)
+                break
+            char = match.group()
+            position = match.end()
+            if char == "\\":
+                if position == len(text):
+                    # The escaped character has not arrived yet
+                    position = match.start()
+                    break
+                position += 1
+            elif char == '"':
+                self._in_string = not self._in_string
+            elif char == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    start, self._start = self._start, None
+                    if not self._complete(text[start:position]):
+                        position = start + 1
+        # Keep only the text an open span (or a later rescan) still needs
+        if self._start is None:
+            self._text, self._position = "", 0
+        else:
+            self._text = text[self._start:]
+            self._position = position - self._start
+            self._start = 0
+
+    def _complete(self, candidate: str) -> bool:
+        try:
+            value = json.loads(candidate)
+            if not isinstance(value, dict):
+                raise ValueError("not a JSON object")
+            if self.validate is not None:
+                self.validate(value)
+        except ValueError as e:
+            # json.JSONDecodeError and pydantic.ValidationError are ValueErrors
+            self.rejected += 1
+            logger.debug(f"Skipping invalid JSON candidate: {e}")
+            return False
+        self.objects.append(value)
+        if self.first is None:
+            self.first = value
+        return True
+
+
+def extract_json_objects(
+    text: str,
+    validate: Optional[Callable[[Dict[str, Any]], Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Return every JSON object embedded in ``text`` that ``validate`` accepts"""
+    extractor = JsonObjectExtractor(validate, collect_all=True)
+    extractor.feed(text)
+    extractor.finish()
+    return extractor.objects
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BANNERS_PATH = "/api/banners"
+# How often the event loop lag probe wakes up
+LAG_PROBE_INTERVAL_SECONDS = 0.01
+# Latency and lag differences below this many ms are noise, never a regression
+REGRESSION_SLACK_MS = 2.0
+
+# (query) -> (HTTP status, X-AI-Recommendation-Source header)
+Send = Callable[[str], Awaitable[Tuple[int, Optional[str]]]]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of ``values`` (0 when empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """Percentiles and max of ``values`` given in seconds, in milliseconds"""
+    summary = {f"p{p}": round(percentile(values, p) * 1000, 2) for p in points}
+    summary["max"] = round(max(values, default=0.0) * 1000, 2)
+    return summary
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes a task that sleeps on a fixed interval
+
+    Lag is the time a ready callback waits because something else holds the
+    loop, e.g. blocking work in a request handler.
+    """
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._probe())
+
+    async def stop(self) -> List[float]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return self.lags
+
+
+async def drive(send: Send, rps: float, duration: float, queries: List[str], seed: int = 0) -> Dict[str, Any]:
+    """Send requests at a fixed rate for ``duration`` seconds and report what happened
+
+    Load is open-loop: request ``i`` is due at ``i / rps`` regardless of how
+    many are still in flight, and its latency counts from that due time. A
+    slow server therefore shows up as latency instead of quietly lowering the
+    offered rate.
+    """
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sources: Counter = Counter()
+    monitor = LoopLagMonitor()
+
+    async def one(query: str, due: float) -> None:
+        try:
+            status, source = await send(query)
+        except (httpx.HTTPError, OSError) as e:
+            logger.debug(f"Request failed: {e}")
+            status, source = 0, None
+        latencies.append(loop.time() - due)
+        statuses[status] += 1
+        if source is not None:
+            sources[source] += 1
+
+    total = max(1, int(rps * duration))
+    tasks = []
+    monitor.start()
+    started = loop.time()
+    for i in range(total):
+        due = started + i / rps
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(rng.choice(queries), due)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    lags = await monitor.stop()
+
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    return {
+        "requests": total,
+        "offered_rps": rps,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "sources": dict(sorted(sources.items())),
+        "latency_ms": summarize(latencies),
+        "loop_lag_ms": summarize(lags),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """Regressions of ``report`` against ``baseline``; empty when within ``tolerance``
+
+    Latency and loop lag percentiles may grow, and throughput may shrink, by
+    the ``tolerance`` fraction (plus a couple of ms of noise) before it counts.
+    """
+    regressions = []
+    for section in ("latency_ms", "loop_lag_ms"):
+        for point, before in baseline.get(section, {}).items():
+            after = report.get(section, {}).get(point)
+            if point == "max" or after is None:
+                continue
+            limit = before * (1 + tolerance) + REGRESSION_SLACK_MS
+            if after > limit:
+                regressions.append(f"{section} {point}: {after}ms > {limit:.2f}ms (baseline {before}ms)")
+    if "throughput_rps" in baseline:
+        floor = baseline["throughput_rps"] * (1 - tolerance)
+        if report["throughput_rps"] < floor:
+            regressions.append(
+                f"throughput: {report['throughput_rps']} rps < {floor:.2f} rps (baseline {baseline['throughput_rps']})")
+    if "error_rate" in baseline:
+        ceiling = baseline["error_rate"] + tolerance / 10
+        if report["error_rate"] > ceiling:
+            regressions.append(
+                f"error rate: {report['error_rate']} > {ceiling:.4f} (baseline {baseline['error_rate']})")
+    return regressions
+
+
+def banner_sender(client: httpx.AsyncClient) -> Send:
+    async def send(query: str) -> Tuple[int, Optional[str]]:
+        response = await client.get(BANNERS_PATH, params={"use_ai": "true", "query": query})
+        return response.status_code, response.headers.get("X-AI-Recommendation-Source")
+    return send
+
+
+async def run_in_process(args: argparse.Namespace, queries: List[str]) -> Dict[str, Any]:
+    """Load the API in this process against the fake agent
+
+    The app is served through httpx's ASGI transport on the same event loop
+    as the load generator, so loop lag includes everything the app does on
+    the loop. The agent runs on the app's worker threads, as in production.
+    """
+    os.environ["AZURE_AGENT_FAKE"] = "true"
+    os.environ["FAKE_AGENT_LATENCY_MS"] = args.latency
+    os.environ["FAKE_AGENT_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["FAKE_AGENT_ERROR_RATE"] = str(args.error_rate)
+    os.environ["FAKE_AGENT_SEED"] = str(args.seed)
+    os.environ["AZURE_AGENT_STREAMING"] = "true" if args.streaming else "false"
+    import azure_agent
+    import main as api
+
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout) as client:
+            report = await drive(banner_sender(client), args.rps, args.duration, queries, args.seed)
+    report["agent"] = azure_agent.get_project_client().stats()
+    return report
+
+
+async def run_against(url: str, args: argparse.Namespace, queries: List[str]) -> Dict[str, Any]:
+    """Load a running server; loop lag is then the load generator's own"""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        return await drive(banner_sender(client), args.rps, args.duration, queries, args.seed)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load test /api/banners?use_ai=true and gate latency regressions")
+    parser.add_argument("--rps", type=float, default=20, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--queries", type=int, default=50,
+                        help="distinct queries to draw from (fewer = more cache hits)")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="load a running server instead of the app in this process")
+    fake = parser.add_argument_group("fake agent (in-process only)")
+    fake.add_argument("--latency", default="lognormal:800:0.5", help="run latency spec, see fake_agent.py")
+    fake.add_argument("--failure-rate", type=float, default=0.0)
+    fake.add_argument("--error-rate", type=float, default=0.0)
+    fake.add_argument("--streaming", action="store_true", help="stream agent runs")
+    gate = parser.add_argument_group("regression gate")
+    gate.add_argument("--baseline", help="fail when worse than this saved report")
+    gate.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional regression")
+    gate.add_argument("--save-baseline", help="write the report here for later runs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    queries = [f"おすすめの商品を教えてください {i}" for i in range(max(1, args.queries))]
+    if args.url:
+        report = asyncio.run(run_against(args.url, args, queries))
+    else:
+        report = asyncio.run(run_in_process(args, queries))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
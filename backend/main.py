@@ -1,10 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import json
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple, Union
 from dotenv import load_dotenv
 import logging
 
@@ -12,45 +14,296 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from models import BannerItem, ContentItem
+from catalog import CatalogSnapshot, CatalogWatcher, RenderedJson, load_catalog, render_content
+from cache_backends import create_backend
+from catalog_store import load_mapped_catalog
+from content_query import ContentFilters, ContentQueryError, page_content
+from hot_queries import HotQueryRefresher, HotQueryTracker
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsDirectory, registry as metrics_registry
+from models import BannerItem, ContentItem, ContentPage
+from recommendation_cache import RecommendationCache, normalize_query
+from response_log import ResponseLog
+from single_flight import SingleFlight
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Optional import for Azure agent - make it graceful
 try:
-    from azure_agent import get_recommendation
+    import azure_agent
+    from azure_agent import get_recommendation, thread_pool as agent_thread_pool
     AZURE_AGENT_IMPORT_AVAILABLE = True
     logger.info("Azure agent imported successfully")
 except ImportError as e:
     AZURE_AGENT_IMPORT_AVAILABLE = False
     logger.error(f"Azure agent import failed: {e} - AI recommendations will not be available")
 
-# Load data on startup
-banners_data: List[BannerItem] = []
-content_data: List[ContentItem] = []
+# Load data on startup. Handlers read `catalog` once per request; reloads replace
+# it with a fully built snapshot so in-flight requests keep the one they started with.
+DATA_DIR = Path(__file__).parent / "data"
+CATALOG_RELOAD_INTERVAL_SECONDS = float(os.getenv("CATALOG_RELOAD_INTERVAL_SECONDS", "2"))
+# With CATALOG_SNAPSHOT_PATH set, the catalog is written once to a binary snapshot
+# that every uvicorn worker memory-maps and shares instead of parsing its own copy
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "")
+catalog = CatalogSnapshot()
+
+def set_catalog(snapshot: CatalogSnapshot) -> None:
+    global catalog
+    catalog = snapshot
+
+def load_catalog_snapshot(data_dir: Path) -> CatalogSnapshot:
+    if CATALOG_SNAPSHOT_PATH:
+        # Opening the mapping is all a worker pays at startup; the columns, sort
+        # orders and search index are read from the file, not built per worker
+        return load_mapped_catalog(data_dir, Path(CATALOG_SNAPSHOT_PATH))
+    snapshot = load_catalog(data_dir)
+    # Build the search index here, off the event loop, before the snapshot is served
+    snapshot.build_indexes()
+    return snapshot
+
+async def ensure_indexes(snapshot: CatalogSnapshot) -> None:
+    """Build the columns and search index of ``snapshot`` off the event loop if not built yet"""
+    if not snapshot.indexes_built:
+        await asyncio.to_thread(snapshot.build_indexes)
+
+def recommendation_candidates(query: str, k: int) -> List[dict]:
+    """Top ``k`` local catalog items for ``query``, inlined into the agent prompt"""
+    snapshot = catalog
+    indexes = snapshot.search_index.candidates(query, k)
+    return [item.model_dump() for item in snapshot.columns.materialize(indexes)]
+
+def recommended_item(snapshot: CatalogSnapshot, recommendation: dict) -> Optional[ContentItem]:
+    """The catalog item for the first recommended id that exists in ``snapshot``"""
+    for item_id in recommendation.get("ids") or [recommendation.get("id")]:
+        item = snapshot.columns.get_by_id(str(item_id))
+        if item is not None:
+            return item
+    return None
+
+if AZURE_AGENT_IMPORT_AVAILABLE:
+    azure_agent.candidate_provider = recommendation_candidates
+
+catalog_watcher = CatalogWatcher(
+    DATA_DIR, set_catalog, CATALOG_RELOAD_INTERVAL_SECONDS, loader=load_catalog_snapshot)
+
+# Catalog responses may be cached by browsers and the CDN and revalidated with
+# If-None-Match / If-Modified-Since; AI banners are per-user and cached privately
+CATALOG_CACHE_CONTROL = (
+    f"public, max-age={int(os.getenv('CATALOG_CACHE_MAX_AGE_SECONDS', '60'))}, "
+    f"stale-while-revalidate={int(os.getenv('CATALOG_CACHE_STALE_SECONDS', '300'))}")
+AI_BANNER_CACHE_CONTROL = f"private, max-age={int(os.getenv('AI_BANNER_CACHE_MAX_AGE_SECONDS', '60'))}"
+AI_BANNER_FALLBACK_CACHE_CONTROL = "private, no-cache"
+
+# Page sizes for /api/content?limit=&cursor=&sort=&fields=
+CONTENT_PAGE_DEFAULT_LIMIT = int(os.getenv("CONTENT_PAGE_DEFAULT_LIMIT", "50"))
+CONTENT_PAGE_MAX_LIMIT = int(os.getenv("CONTENT_PAGE_MAX_LIMIT", "500"))
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag``"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def not_modified_since(if_modified_since: str, last_modified: float) -> bool:
+    try:
+        return parsedate_to_datetime(if_modified_since).timestamp() >= int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+def rendered_response(request: Request, rendered: RenderedJson, last_modified: float) -> Response:
+    """Serve pre-rendered bytes, or 304 when the client already has this version"""
+    headers = {
+        "ETag": rendered.etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, rendered.etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        not_modified = if_modified_since is not None and not_modified_since(
+            if_modified_since, last_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+# The Azure agent SDK call is blocking (it polls the run until it finishes), so it
+# runs on a bounded worker pool instead of the event loop. This keeps /api/content
+# and /health responsive while several agent runs are in flight.
+AZURE_AGENT_MAX_WORKERS = int(os.getenv("AZURE_AGENT_MAX_WORKERS", "8"))
+agent_executor: Optional[ThreadPoolExecutor] = None
+
+def get_agent_executor() -> ThreadPoolExecutor:
+    global agent_executor
+    if agent_executor is None:
+        agent_executor = ThreadPoolExecutor(
+            max_workers=AZURE_AGENT_MAX_WORKERS,
+            thread_name_prefix="azure-agent")
+    return agent_executor
+
+# Every answer parsed from the agent is appended to RECOMMENDATION_LOG_PATH (JSON
+# Lines). The cache is warmed from it at startup, and with RECOMMENDATION_REPLAY
+# the recorded answers are served without contacting the agent at all.
+RECOMMENDATION_LOG_PATH = os.getenv("RECOMMENDATION_LOG_PATH", "")
+RECOMMENDATION_REPLAY = os.getenv("RECOMMENDATION_REPLAY", "false").lower() == "true"
+response_log = ResponseLog(Path(RECOMMENDATION_LOG_PATH)) if RECOMMENDATION_LOG_PATH else None
+# Latest recorded answer per cache key, read at startup
+recorded_answers: Dict[str, dict] = {}
+
+if response_log is not None and AZURE_AGENT_IMPORT_AVAILABLE:
+    azure_agent.response_recorder = response_log.append
+
+async def fetch_recommendation(query: Optional[str] = None):
+    """Run the blocking Azure agent recommendation off the event loop"""
+    if RECOMMENDATION_REPLAY:
+        record = recorded_answers.get(normalize_query(query))
+        return record["recommendation"] if record is not None else None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_agent_executor(), get_recommendation, query)
+
+# Concurrent requests for the same query share one agent run. Each request waits
+# at most RECOMMENDATION_WAIT_TIMEOUT_SECONDS (0 = no limit) for the shared run.
+recommendation_flight = SingleFlight(
+    timeout=float(os.getenv("RECOMMENDATION_WAIT_TIMEOUT_SECONDS", "60")) or None)
+
+async def load_recommendation(query: Optional[str] = None):
+    """Fetch a recommendation, coalescing identical in-flight queries"""
+    return await recommendation_flight.do(
+        normalize_query(query), lambda: fetch_recommendation(query))
+
+def is_cacheable_recommendation(recommendation) -> bool:
+    """Only cache real agent answers, never the hard-coded fallback data"""
+    return bool(recommendation) and not str(recommendation.get("id", "")).startswith("fallback-")
+
+# Cache AI recommendations by normalized query so repeated queries skip the agent run
+# RECOMMENDATION_CACHE_BACKEND picks where entries live: "memory" (per worker),
+# "sqlite:///path/to/cache.db" or "redis://host:port/db" (shared by all workers)
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "1024"))
+recommendation_cache = RecommendationCache(
+    loader=load_recommendation,
+    ttl_seconds=float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300")),
+    stale_seconds=float(os.getenv("RECOMMENDATION_CACHE_STALE_SECONDS", "3600")),
+    max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+    should_cache=is_cacheable_recommendation,
+    backend=create_backend(
+        os.getenv("RECOMMENDATION_CACHE_BACKEND", "memory"), RECOMMENDATION_CACHE_MAX_ENTRIES),
+)
+
+# With several workers (uvicorn --workers), each writes its metrics to
+# METRICS_MULTIPROC_DIR and /metrics serves their sum, whichever worker answers
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+metrics_directory = MetricsDirectory(
+    Path(METRICS_MULTIPROC_DIR), metrics_registry,
+    interval_seconds=float(os.getenv("METRICS_WRITE_INTERVAL_SECONDS", "5")),
+) if METRICS_MULTIPROC_DIR else None
+
+# The cache and single-flight keep plain counters; /metrics reads them when scraped
+metrics_registry.collect(
+    "recommendation_cache_requests_total", "Recommendation cache lookups by result", "counter",
+    lambda: {
+        "hit": recommendation_cache.hits,
+        "stale": recommendation_cache.stale_hits,
+        "miss": recommendation_cache.misses,
+    },
+    labelname="result")
+metrics_registry.collect(
+    "recommendation_loads_total", "Recommendation loads started on a cache miss or refresh", "counter",
+    lambda: recommendation_flight.started)
+metrics_registry.collect(
+    "recommendation_coalesced_total", "Recommendation loads that joined one in flight for the same query",
+    "counter", lambda: recommendation_flight.coalesced)
+metrics_registry.collect(
+    "recommendation_loads_in_flight", "Recommendation loads currently in flight", "gauge",
+    lambda: len(recommendation_flight))
+
+# Hot queries (the default query, HOT_QUERIES separated by "|", and the busiest
+# recently requested ones) are refreshed in the background on an interval
+hot_query_tracker = HotQueryTracker()
+hot_query_refresher = HotQueryRefresher(
+    cache=recommendation_cache,
+    tracker=hot_query_tracker,
+    static_queries=[None] + [q for q in os.getenv("HOT_QUERIES", "").split("|") if q.strip()],
+    interval_seconds=float(os.getenv("HOT_QUERY_REFRESH_INTERVAL_SECONDS", "60")),
+    jitter=float(os.getenv("HOT_QUERY_REFRESH_JITTER", "0.1")),
+    concurrency=int(os.getenv("HOT_QUERY_REFRESH_CONCURRENCY", "2")),
+    top_n=int(os.getenv("HOT_QUERY_TOP_N", "10")),
+)
+
+# Per-request latency budget for the AI banner (0 = wait for the agent). Past the
+# deadline the endpoint answers without the AI banner while the agent run keeps
+# going in the background and lands in the cache for the next request.
+RECOMMENDATION_DEADLINE_SECONDS = float(os.getenv("RECOMMENDATION_DEADLINE_SECONDS", "5")) or None
+AI_SOURCE_HEADER = "X-AI-Recommendation-Source"
+background_tasks: Set[asyncio.Task] = set()
+
+def track_background_task(task: asyncio.Task) -> None:
+    """Keep a reference to a task that may outlive the request awaiting it"""
+    background_tasks.add(task)
+    def done(task: asyncio.Task):
+        background_tasks.discard(task)
+        # Retrieve the exception so a failure after the deadline is not reported as unhandled
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Background recommendation failed: {task.exception()}")
+    task.add_done_callback(done)
+
+async def get_recommendation_within_deadline(query: Optional[str] = None) -> Tuple[Optional[dict], str]:
+    """Return ``(recommendation, source)`` where source is live, cached or fallback"""
+    recommendation, cached = await recommendation_cache.lookup(query)
+    if cached:
+        return recommendation, "cached"
+
+    task = asyncio.get_running_loop().create_task(recommendation_cache.refresh(query))
+    track_background_task(task)
+    try:
+        recommendation = await asyncio.wait_for(asyncio.shield(task), RECOMMENDATION_DEADLINE_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"AI recommendation missed the {RECOMMENDATION_DEADLINE_SECONDS}s deadline, continuing in background")
+        return None, "fallback"
+    return recommendation, "live" if is_cacheable_recommendation(recommendation) else "fallback"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load data on startup
-    global banners_data, content_data
+    global agent_executor
     
-    # Load banners
-    banners_path = Path(__file__).parent / "data" / "banners.json"
-    if banners_path.exists():
-        with open(banners_path, "r", encoding="utf-8") as f:
-            banners_json = json.load(f)
-            banners_data = [BannerItem(**item) for item in banners_json]
+    set_catalog(await catalog_watcher.load())
+    # Pick up catalog file changes without a restart (0 disables watching)
+    if CATALOG_RELOAD_INTERVAL_SECONDS > 0:
+        catalog_watcher.start()
     
-    # Load content
-    content_path = Path(__file__).parent / "data" / "content.json"
-    if content_path.exists():
-        with open(content_path, "r", encoding="utf-8") as f:
-            content_json = json.load(f)
-            content_data = [ContentItem(**item) for item in content_json]
+    # Start warm from the answers recorded by earlier runs
+    if response_log is not None:
+        recorded_answers.clear()
+        recorded_answers.update(await asyncio.to_thread(response_log.latest))
+        for record in recorded_answers.values():
+            await recommendation_cache.put(record["query"], record["recommendation"], stored_at=record["ts"])
+        logger.info(f"Loaded {len(recorded_answers)} recorded recommendations from {response_log.path}")
+    
+    # Resolve the agent, pre-create threads and keep hot queries warm in the background
+    agent_configured = AZURE_AGENT_IMPORT_AVAILABLE and (
+        bool(os.getenv("PROJECT_ENDPOINT")) or azure_agent.AZURE_AGENT_FAKE)
+    if agent_configured:
+        agent_thread_pool.start()
+        hot_query_refresher.start()
+    if metrics_directory is not None:
+        metrics_directory.start()
     
     yield
     # Cleanup if needed
+    await catalog_watcher.stop()
+    await hot_query_refresher.stop()
+    if agent_configured:
+        await asyncio.to_thread(agent_thread_pool.stop)
+    for task in list(background_tasks):
+        task.cancel()
+    await recommendation_cache.close()
+    if metrics_directory is not None:
+        await metrics_directory.stop()
+    if agent_executor is not None:
+        agent_executor.shutdown(wait=False, cancel_futures=True)
+        agent_executor = None
 
 app = FastAPI(
     title="Content Index API",
@@ -66,6 +319,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[AI_SOURCE_HEADER],
 )
 
 @app.get("/")
@@ -73,19 +327,38 @@ async def root():
     return {"message": "Content Index API is running"}
 
 @app.get("/api/banners", response_model=List[BannerItem])
-async def get_banners(query: Optional[str] = None, use_ai: bool = False):
+async def get_banners(request: Request, response: Response, query: Optional[str] = None, use_ai: bool = False):
     """Get all banner items with optional Azure AI recommendation
     
+    When ``use_ai`` is set, the ``X-AI-Recommendation-Source`` response header
+    tells whether the AI slot came from a live agent run, the cache, or a
+    fallback (deadline passed, error, or agent fallback data).
+    
     Args:
         query: Optional query parameter for AI recommendation content
         use_ai: Boolean flag to enable/disable AI recommendations
     """
-    # Only try to get AI recommendation if explicitly requested and Azure agent is importable
-    if use_ai and AZURE_AGENT_IMPORT_AVAILABLE:
+    snapshot = catalog
+    # Only try to get AI recommendation if explicitly requested and Azure agent is
+    # importable, or recorded answers are being replayed
+    if use_ai and (AZURE_AGENT_IMPORT_AVAILABLE or RECOMMENDATION_REPLAY):
+        response.headers[AI_SOURCE_HEADER] = "fallback"
+        response.headers["Cache-Control"] = AI_BANNER_FALLBACK_CACHE_CONTROL
+        hot_query_tracker.record(query)
         try:
             logger.info("Attempting to get AI recommendation")
             # Get recommendation from Azure AI agent with query parameter
-            recommendation = get_recommendation(query)
+            recommendation, source = await get_recommendation_within_deadline(query)
+            
+            # Banner fields come from the live catalog whenever the recommended id is in it
+            if recommendation:
+                await ensure_indexes(snapshot)
+                item = recommended_item(snapshot, recommendation)
+                if item is not None:
+                    recommendation = item.model_dump()
+                elif "ids" in recommendation:
+                    logger.warning(f"Recommended ids are not in the catalog: {recommendation['ids']}")
+                    recommendation = None
             
             # If we get a recommendation, create a banner from it
             if recommendation:
@@ -98,35 +371,84 @@ async def get_banners(query: Optional[str] = None, use_ai: bool = False):
                     tag="AIモニター募集中",
                     color="oklch(0.7 0.15 40)"  # Coral orange from design system
                 )
+                # The source (and private caching) describe the banner actually sent; without
+                # one the response keeps the fallback headers set above
+                response.headers[AI_SOURCE_HEADER] = source
+                response.headers["Cache-Control"] = (
+                    AI_BANNER_FALLBACK_CACHE_CONTROL if source == "fallback" else AI_BANNER_CACHE_CONTROL)
                 # Insert recommendation banner at the beginning
                 logger.info("Returning banners with AI recommendation")
-                return [rec_banner] + banners_data
+                return [rec_banner, *snapshot.banners]
             else:
                 logger.warning("AI recommendation was None or empty")
         except Exception as e:
             # Log error but continue with regular banners
             logger.error(f"Failed to get AI recommendation: {e}")
     elif use_ai and not AZURE_AGENT_IMPORT_AVAILABLE:
+        response.headers[AI_SOURCE_HEADER] = "fallback"
+        response.headers["Cache-Control"] = AI_BANNER_FALLBACK_CACHE_CONTROL
         logger.warning("AI recommendation requested but Azure agent is not available")
     else:
         logger.info("AI recommendation not requested, returning regular banners only")
     
     logger.info("Returning regular banners without AI recommendation")
-    return banners_data
+    if not use_ai:
+        return rendered_response(request, snapshot.banners_body, snapshot.last_modified)
+    return snapshot.banners
 
-@app.get("/api/content", response_model=List[ContentItem])
-async def get_content():
-    """Get all content items"""
-    return content_data
+@app.get("/api/content", response_model=Union[List[ContentItem], ContentPage])
+async def get_content(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=CONTENT_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    min_rating: Optional[float] = Query(None, ge=0),
+    isNew: Optional[bool] = None,
+    isSale: Optional[bool] = None,
+    isRecommended: Optional[bool] = None,
+    category: Optional[List[str]] = Query(None),
+):
+    """Get all content items, or a filtered page of them with facet counts"""
+    snapshot = catalog
+    filter_params = (min_price, max_price, min_rating, isNew, isSale, isRecommended, category)
+    if all(value is None for value in (limit, cursor, sort, fields, *filter_params)):
+        return rendered_response(request, snapshot.content_body, snapshot.last_modified)
+    filters = ContentFilters(*filter_params[:-1], categories=category or ())
+    await ensure_indexes(snapshot)
+    try:
+        page = page_content(
+            snapshot.columns, limit or CONTENT_PAGE_DEFAULT_LIMIT, cursor, sort, fields, filters)
+    except ContentQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rendered_response(request, page, snapshot.last_modified)
 
 @app.get("/api/content/{category}", response_model=List[ContentItem])
-async def get_content_by_category(category: str):
+async def get_content_by_category(request: Request, category: str):
     """Get content items by category"""
-    filtered_content = [
-        item for item in content_data 
-        if item.category.lower() == category.lower()
-    ]
-    return filtered_content
+    snapshot = catalog
+    return rendered_response(request, snapshot.content_index.rendered(category), snapshot.last_modified)
+
+@app.get("/api/search", response_model=List[ContentItem])
+async def search_content(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=CONTENT_PAGE_MAX_LIMIT),
+):
+    """Search content titles and categories, best matches first"""
+    snapshot = catalog
+    await ensure_indexes(snapshot)
+    results = render_content(snapshot.search_index.search_items(q, limit))
+    return rendered_response(request, results, snapshot.last_modified)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of every worker with METRICS_MULTIPROC_DIR, else of this worker process"""
+    if metrics_directory is not None:
+        return Response(content=await asyncio.to_thread(metrics_directory.render), media_type=METRICS_CONTENT_TYPE)
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/health")
 async def health_check():
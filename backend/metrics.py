@@ -0,0 +1,337 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, from cache-speed stages to slow agent runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _parse_number(text: str) -> Union[int, float]:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class HistogramChild:
+    """Bucket counts and sum for one label combination"""
+
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated when rendered, not on observe
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Histogram:
+    """Distribution of observed values (e.g. seconds) per label combination
+
+    ``labels(...)`` returns the child for one label combination; callers on
+    hot paths can keep it to skip the lookup.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues: str) -> HistogramChild:
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        self.labels(*labelvalues).observe(value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = []
+        for labels, child in children:
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Values read from elsewhere (e.g. counters kept by a cache) when scraped"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        read: Callable[[], Union[float, Dict[str, float]]],
+        labelname: Optional[str] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+        self.labelname = labelname
+
+    def samples(self) -> List[str]:
+        value = self.read()
+        if self.labelname is None:
+            return [f"{self.name} {_number(value)}"]
+        return [
+            f"{self.name}{_labels((self.labelname,), (label,))} {_number(count)}"
+            for label, count in value.items()
+        ]
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram, Collected]] = {}
+
+    def _register(self, metric):
+        # Modules may be reloaded (tests); the first registration wins
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collect(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        read: Callable[[], Union[float, Dict[str, float]]],
+        labelname: Optional[str] = None,
+    ) -> None:
+        """Register ``read``, called on every scrape, as a counter or gauge
+
+        ``read`` returns a number, or a dict of ``labelname`` value -> number.
+        Registering a name again replaces the reader.
+        """
+        self._metrics[name] = Collected(name, help, kind, read, labelname)
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> List[Dict[str, Any]]:
+        """Every metric with its current samples as ``[series, value]`` pairs, for a metrics directory"""
+        return [
+            {
+                "name": metric.name,
+                "help": metric.help,
+                "kind": metric.kind,
+                "samples": [line.rsplit(" ", 1) for line in metric.samples()],
+            }
+            for metric in self._metrics.values()
+        ]
+
+
+class StageTimer:
+    """Observe the time since the previous lap as one stage of a pipeline
+
+    ``lap("stage")`` after each step records how long that step took, so a
+    sequence of steps is timed without wrapping each one in a block.
+    """
+
+    __slots__ = ("histogram", "last")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.histogram.labels(stage).observe(now - self.last)
+        self.last = now
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsDirectory:
+    """Metrics of every worker process on the node, shared through a directory
+
+    Each worker writes its registry to ``worker-<pid>.json`` every
+    ``interval_seconds`` (and when it answers a scrape), and ``render`` sums
+    the files, so whichever worker is scraped serves the same node-wide
+    series. Counters and histograms of exited workers are kept, so the sums
+    never go down when a worker is replaced; their gauges are dropped. Other
+    workers' values are at most ``interval_seconds`` old. The directory
+    should start empty with the server (e.g. under /tmp in a container).
+    """
+
+    def __init__(self, path: Path, registry: "Registry", interval_seconds: float = 5.0):
+        self.path = Path(path)
+        self.registry = registry
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def file(self) -> Path:
+        # The pid is read on use, not at import, so forked workers get their own file
+        return self.path / f"worker-{os.getpid()}.json"
+
+    def write(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.file.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.registry.dump(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.file)
+
+    def render(self) -> str:
+        """This worker's current metrics summed with the last ones every other worker wrote"""
+        self.write()
+        merged: Dict[str, Dict[str, Any]] = {}
+        for path in sorted(self.path.glob("worker-*.json")):
+            try:
+                pid = int(path.stem.split("-", 1)[1])
+                metrics = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+                continue
+            alive = pid == os.getpid() or _process_alive(pid)
+            for metric in metrics:
+                if metric["kind"] == "gauge" and not alive:
+                    continue
+                family = merged.setdefault(
+                    metric["name"], {"help": metric["help"], "kind": metric["kind"], "samples": {}})
+                samples = family["samples"]
+                for series, value in metric["samples"]:
+                    samples[series] = samples.get(series, 0) + _parse_number(value)
+        lines = []
+        for name, family in merged.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(f"{series} {_number(value)}" for series, value in family["samples"].items())
+        return "\n".join(lines) + "\n"
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Leave the final counts for the sums after this worker exits
+        await asyncio.to_thread(self.write)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.error(f"Writing worker metrics failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+# Process-wide registry served by /metrics
+registry = Registry()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class BannerItem(BaseModel):
     id: str
@@ -19,4 +19,16 @@ class ContentItem(BaseModel):
     category: str
     isNew: Optional[bool] = False
     isSale: Optional[bool] = False
-    isRecommended: Optional[bool] = False
\ No newline at end of file
+    isRecommended: Optional[bool] = False
+
+class ContentFacets(BaseModel):
+    category: Dict[str, int]
+    isNew: int
+    isSale: int
+    isRecommended: int
+
+class ContentPage(BaseModel):
+    items: List[Dict[str, Any]]
+    nextCursor: Optional[str] = None
+    total: int
+    facets: ContentFacets
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from cache_backends import CacheEntry, MemoryBackend
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# Threads running calls to a blocking backend; a stalled backend ties these up, not the event loop
+BACKEND_THREADS = 4
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Normalize a recommendation query into a cache key
+
+    Full-width/half-width variants, surrounding and repeated whitespace and
+    letter case all map to the same key. ``None`` and blank queries map to
+    the empty key, which stands for the agent's default query.
+    """
+    if not query:
+        return ""
+    normalized = unicodedata.normalize("NFKC", query)
+    return _WHITESPACE.sub(" ", normalized).strip().casefold()
+
+
+class RecommendationCache:
+    """Bounded in-process cache in front of the recommendation loader
+
+    Entries are fresh for ``ttl_seconds``. After that they are served stale for
+    up to ``stale_seconds`` more while a single background refresh runs for the
+    key. The least recently used entry is evicted once ``max_entries`` is
+    exceeded. Results rejected by ``should_cache`` (e.g. fallback data) are
+    returned but never stored.
+
+    Entries live in ``backend`` (see cache_backends), in process memory by
+    default. A shared backend lets every worker on the node use one cache;
+    entry times then come from the wall clock so all workers agree on them.
+    Calls to a backend that does I/O (``backend.blocking``) run on a small
+    dedicated thread pool, so a slow or stalled SQLite file or Redis server
+    delays the requests waiting on it but never holds the event loop.
+
+    ``hits``, ``stale_hits`` and ``misses`` count how ``get`` calls were
+    answered, for metrics.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Optional[str]], Awaitable[Any]],
+        ttl_seconds: float = 300.0,
+        stale_seconds: float = 3600.0,
+        max_entries: int = 1024,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+        clock: Callable[[], float] = time.time,
+        backend=None,
+    ):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.should_cache = should_cache or (lambda value: value is not None)
+        self.clock = clock
+        self.backend = backend if backend is not None else MemoryBackend(max_entries)
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    async def _call(self, method: Callable, *args) -> Any:
+        """Run a backend call, off the event loop when the backend blocks"""
+        if not getattr(self.backend, "blocking", False):
+            return method(*args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(BACKEND_THREADS, thread_name_prefix="recommendation-cache")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def peek(self, query: Optional[str]) -> Optional[Any]:
+        """Return the cached value for ``query`` (fresh or stale) without loading"""
+        entry = await self._call(self.backend.get, normalize_query(query))
+        if entry is None or entry.stale_until <= self.clock():
+            return None
+        return entry.value
+
+    async def fresh_for(self, query: Optional[str]) -> float:
+        """Seconds until the entry for ``query`` turns stale (0 if missing or stale)"""
+        entry = await self._call(self.backend.get, normalize_query(query))
+        if entry is None:
+            return 0.0
+        return max(0.0, entry.fresh_until - self.clock())
+
+    async def lookup(self, query: Optional[str]) -> Tuple[Optional[Any], bool]:
+        """Return ``(value, cached)`` for ``query`` from one backend read, without loading
+
+        A stale value is returned (and a background refresh scheduled) as cached.
+        On a miss ``(None, False)`` is returned and the caller loads the value,
+        e.g. with ``refresh``.
+        """
+        key = normalize_query(query)
+        entry = await self._call(self.backend.get, key)
+        now = self.clock()
+
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.value, True
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                self._schedule_refresh(key, query)
+                return entry.value, True
+            await self._call(self.backend.delete, key)
+
+        self.misses += 1
+        return None, False
+
+    async def get(self, query: Optional[str]) -> Any:
+        """Return the recommendation for ``query``, loading it on a miss"""
+        value, cached = await self.lookup(query)
+        if cached:
+            return value
+        return await self.refresh(query)
+
+    async def refresh(self, query: Optional[str]) -> Any:
+        """Load ``query`` now and store the result, regardless of what is cached"""
+        value = await self.loader(query)
+        await self.put(query, value)
+        return value
+
+    async def put(self, query: Optional[str], value: Any, stored_at: Optional[float] = None) -> None:
+        """Store ``value`` for ``query`` if it passes ``should_cache``
+
+        ``stored_at`` backdates the entry, e.g. when warming up from answers
+        recorded earlier; entries already past their stale window are dropped.
+        """
+        if self.max_entries <= 0 or not self.should_cache(value):
+            return
+        stored_at = self.clock() if stored_at is None else stored_at
+        stale_until = stored_at + self.ttl_seconds + self.stale_seconds
+        if stale_until <= self.clock():
+            return
+        await self._call(self.backend.set, normalize_query(query), CacheEntry(
+            value, fresh_until=stored_at + self.ttl_seconds, stale_until=stale_until))
+
+    def clear(self) -> None:
+        """Drop every entry (blocking; for tests and maintenance, not request paths)"""
+        self.backend.clear()
+
+    async def close(self) -> None:
+        """Cancel any background refreshes still running and close the backend"""
+        tasks = list(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._refreshing.clear()
+        await self._call(self.backend.close)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _schedule_refresh(self, key: str, query: Optional[str]) -> None:
+        if key in self._refreshing:
+            return
+        task = asyncio.get_running_loop().create_task(self._refresh(key, query))
+        self._refreshing[key] = task
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh(self, key: str, query: Optional[str]) -> None:
+        try:
+            logger.info(f"Refreshing stale recommendation for {key!r} in background")
+            await self.refresh(query)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Keep serving the stale entry; the next request past TTL retries
+            logger.error(f"Background recommendation refresh failed: {e}")
+        finally:
+            self._refreshing.pop(key, None)
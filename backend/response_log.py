@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from recommendation_cache import normalize_query
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def is_complete_record(record: Any) -> bool:
+    """Whether ``record`` has everything needed to replay it into the cache"""
+    return (
+        isinstance(record, dict)
+        and isinstance(record.get("recommendation"), dict)
+        and "query" in record
+        and isinstance(record.get("ts"), (int, float))
+        and not isinstance(record["ts"], bool)
+    )
+
+
+class ResponseLog:
+    """Append-only JSON Lines log of parsed agent answers
+
+    One line per answer: time, raw query, cache key, recommendation, agent
+    latency and run status. Lines are short single writes to a file opened
+    in append mode, so several workers can share one log. Unreadable lines
+    (e.g. a write cut short by a crash) and records missing the time, query
+    or recommendation (e.g. edited by hand) are skipped when reading.
+    """
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def append(
+        self,
+        query: Optional[str],
+        recommendation: Dict[str, Any],
+        latency_seconds: float,
+        run_status: str,
+    ) -> None:
+        record = {
+            "ts": round(self.clock(), 3),
+            "query": query,
+            "key": normalize_query(query),
+            "recommendation": recommendation,
+            "latency_ms": round(latency_seconds * 1000, 1),
+            "status": run_status,
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping unreadable line {number} of {self.path}")
+                        continue
+                    if not is_complete_record(record):
+                        logger.warning(f"Skipping incomplete record on line {number} of {self.path}")
+                        continue
+                    yield record
+        except FileNotFoundError:
+            return
+
+    def latest(self, max_age_seconds: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """The most recent record per cache key, optionally only recent ones"""
+        oldest = self.clock() - max_age_seconds if max_age_seconds is not None else None
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record in self.records():
+            if oldest is not None and record.get("ts", 0) < oldest:
+                continue
+            latest[record.get("key", normalize_query(record.get("query")))] = record
+        return latest
+
+    def compact(self) -> int:
+        """Rewrite the log with only the latest record per key; return how many remain"""
+        with self._lock:
+            latest = self.latest()
+            tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in sorted(latest.values(), key=lambda record: record.get("ts", 0)):
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.path)
+        return len(latest)
+
+
+if __name__ == "__main__":
+    # Keep only the latest answer per query: python response_log.py compact <path>
+    if len(sys.argv) != 3 or sys.argv[1] != "compact":
+        sys.exit("usage: python response_log.py compact <path>")
+    kept = ResponseLog(Path(sys.argv[2])).compact()
+    print(f"{sys.argv[2]}: {kept} records")
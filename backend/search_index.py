@@ -0,0 +1,141 @@
+import heapq
+import math
+import unicodedata
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from content_columns import ContentColumns, StringColumn
+from models import ContentItem
+
+# BM25 parameters, and how much a 5.0 rating boosts a match (0.2 = +20%)
+BM25_K1 = 1.2
+BM25_B = 0.75
+RATING_WEIGHT = 0.2
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str, n: int = 2) -> List[str]:
+    """Character n-grams of each whitespace-separated word of ``text``
+
+    N-grams need no dictionary or morphological analyzer, so Japanese titles
+    and queries match on shared substrings (e.g. "水筒" in "真空断熱水筒").
+    Words shorter than ``n`` become a single token.
+    """
+    tokens = []
+    for word in _normalize(text).split():
+        if len(word) <= n:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return tokens
+
+
+class SearchIndex:
+    """In-memory inverted index over content titles and categories
+
+    Built once per catalog snapshot. Each document is an item's title plus
+    its category; both unigrams and bigrams are indexed so one-character
+    queries still match. Results are ranked by BM25 blended with rating.
+
+    Postings are flat: ``tokens`` sorted, and the documents of ``tokens[t]``
+    at ``docs[starts[t]:starts[t + 1]]`` with their term frequencies at the
+    same positions of ``frequencies``. A token is found by binary search, so
+    the same layout works over a memory-mapped snapshot (``from_sections``).
+    """
+
+    def __init__(self, columns: ContentColumns):
+        self.columns = columns
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = array("I")
+        for index, title in enumerate(columns.titles):
+            text = f"{title} {columns.category_names[columns.category_code[index]]}"
+            tokens = tokenize(text, 1) + tokenize(text, 2)
+            lengths.append(len(tokens))
+            for token in tokens:
+                docs = postings.setdefault(token, {})
+                docs[index] = docs.get(index, 0) + 1
+        self.tokens: Sequence[str] = sorted(postings)
+        self.starts = array("Q", [0])
+        # Item indexes and term frequencies per token, both ascending by item
+        self.docs = array("I")
+        self.frequencies = array("I")
+        for token in self.tokens:
+            self.docs.extend(postings[token].keys())
+            self.frequencies.extend(postings[token].values())
+            self.starts.append(len(self.docs))
+        self.lengths = lengths
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    def to_sections(self) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+        """The index as (JSON-serializable metadata, named byte buffers) for ``from_sections``"""
+        data, ends = StringColumn.pack(self.tokens)
+        sections = {"tokens.data": data, "tokens.ends": ends}
+        for name in ("starts", "docs", "frequencies", "lengths"):
+            sections[name] = getattr(self, name).tobytes()
+        return {"average_length": self.average_length}, sections
+
+    @classmethod
+    def from_sections(
+        cls, columns: ContentColumns, meta: Dict[str, Any], sections: Dict[str, memoryview],
+    ) -> "SearchIndex":
+        """Index over the buffers written by ``to_sections``, without copying them"""
+        index = cls.__new__(cls)
+        index.columns = columns
+        index.tokens = StringColumn(sections["tokens.data"], sections["tokens.ends"].cast("Q"))
+        index.starts = sections["starts"].cast("Q")
+        index.docs = sections["docs"].cast("I")
+        index.frequencies = sections["frequencies"].cast("I")
+        index.lengths = sections["lengths"].cast("I")
+        index.average_length = meta["average_length"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def _find(self, token: str) -> Optional[int]:
+        position = bisect_left(self.tokens, token)
+        if position < len(self.tokens) and self.tokens[position] == token:
+            return position
+        return None
+
+    def _query_tokens(self, query: str) -> List[int]:
+        """Positions in ``tokens`` of the distinct indexed tokens of ``query``"""
+        found = (self._find(token) for token in dict.fromkeys(tokenize(query, 2)))
+        return [position for position in found if position is not None]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Return up to ``limit`` (item index, score) pairs, best first"""
+        scores: Dict[int, float] = {}
+        size = len(self.lengths)
+        for token in self._query_tokens(query):
+            start, end = self.starts[token], self.starts[token + 1]
+            docs, frequencies = self.docs[start:end], self.frequencies[start:end]
+            idf = math.log(1 + (size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for index, tf in zip(docs, frequencies):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[index] / self.average_length)
+                scores[index] = scores.get(index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        rating = self.columns.rating
+        ranked = (
+            (score * (1 + RATING_WEIGHT * rating[index] / 5), index)
+            for index, score in scores.items()
+        )
+        # Ties go to the item that comes first in the catalog
+        best = heapq.nsmallest(limit, ranked, key=lambda entry: (-entry[0], entry[1]))
+        return [(index, score) for score, index in best]
+
+    def candidates(self, query: str, k: int) -> List[int]:
+        """Up to ``k`` item indexes for ``query``, topped up with the best rated items"""
+        indexes = [index for index, _ in self.search(query, k)]
+        if len(indexes) < k:
+            matched = set(indexes)
+            top_rated = (index for index in self.columns.orders["-rating"] if index not in matched)
+            indexes.extend(islice(top_rated, k - len(indexes)))
+        return indexes
+
+    def search_items(self, query: str, limit: int = 10) -> List[ContentItem]:
+        return self.columns.materialize(index for index, _ in self.search(query, limit))
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call
+
+    The first caller for a key starts ``fn()`` as a task; every caller that
+    arrives while it is running awaits the same task and gets the same result
+    or exception. Each waiter can give up on its own (``timeout`` or
+    cancellation) without affecting the others: the shared call is shielded
+    and keeps running. If ``cancel_abandoned`` is set, the shared call is
+    cancelled once every waiter has gone away.
+
+    ``started`` and ``coalesced`` count calls that started ``fn()`` and calls
+    that joined one already in flight.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, cancel_abandoned: bool = False):
+        self.timeout = timeout
+        self.cancel_abandoned = cancel_abandoned
+        self._flights: Dict[Hashable, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Return the result of ``fn()``, sharing it with concurrent callers of ``key``"""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.get_running_loop().create_task(fn())
+            flight = Flight(task)
+            self._flights[key] = flight
+            task.add_done_callback(lambda _: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight call for {key!r}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(flight.task),
+                timeout if timeout is not None else self.timeout)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and self.cancel_abandoned and not flight.task.done():
+                logger.info(f"All waiters left, cancelling in-flight call for {key!r}")
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the exception as retrieved when every waiter already gave up
+        if not flight.task.cancelled():
+            flight.task.exception()
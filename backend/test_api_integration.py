@@ -1,14 +1,26 @@
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, Mock
+import asyncio
+import os
 import json
+import tempfile
+import time
+from pathlib import Path
 
+import httpx
+
+import main
 from main import app
+from content_query import encode_cursor
 
 client = TestClient(app)
 
 class TestAPIIntegration:
     
+    def setup_method(self):
+        main.recommendation_cache.clear()
+    
     def test_root_endpoint(self):
         """Test root endpoint returns expected message"""
         response = client.get("/")
@@ -21,10 +33,38 @@ class TestAPIIntegration:
         assert response.status_code == 200
         assert response.json() == {"status": "healthy"}
     
+    def test_metrics_endpoint(self):
+        """Test Prometheus metrics are served in the text exposition format"""
+        client.get("/api/banners?use_ai=true&query=メトリクス")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE recommendation_cache_requests_total counter" in response.text
+        assert 'recommendation_cache_requests_total{result="miss"}' in response.text
+        assert "# TYPE azure_agent_stage_seconds histogram" in response.text
+        assert "recommendation_coalesced_total " in response.text
+    
+    def test_metrics_endpoint_sums_workers(self):
+        """Test /metrics serves the sum over workers when METRICS_MULTIPROC_DIR is set"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = main.MetricsDirectory(Path(tmp_dir), main.metrics_registry)
+            with patch('main.metrics_directory', directory):
+                before = client.get("/metrics").text
+                (Path(tmp_dir) / f"worker-{os.getppid()}.json").write_text(json.dumps([{
+                    "name": "recommendation_loads_total", "help": "Loads", "kind": "counter",
+                    "samples": [["recommendation_loads_total", "1000"]],
+                }]), encoding="utf-8")
+                after = client.get("/metrics").text
+        
+        loads = main.recommendation_flight.started
+        assert f"recommendation_loads_total {loads}\n" in before
+        assert f"recommendation_loads_total {loads + 1000}\n" in after
+    
     def test_get_banners_without_ai(self):
         """Test get banners without AI recommendation (default behavior)"""
         response = client.get("/api/banners")
         assert response.status_code == 200
+        assert "X-AI-Recommendation-Source" not in response.headers
         banners = response.json()
         assert isinstance(banners, list)
         # Should return regular banners without AI recommendation
@@ -116,12 +156,119 @@ class TestAPIIntegration:
         assert isinstance(banners, list)
         
         # Should return regular banners without AI recommendation on error
+        assert response.headers["X-AI-Recommendation-Source"] == "fallback"
         for banner in banners:
             assert not banner["id"].startswith("rec_")
         
         # Verify the AI agent was called
         mock_get_recommendation.assert_called_once_with(None)
     
+    @pytest.mark.asyncio
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    async def test_get_banners_with_ai_does_not_block_event_loop(self):
+        """Test a slow agent run does not stall other endpoints on the same worker"""
+        def slow_recommendation(query):
+            time.sleep(0.5)
+            return {"id": "slow-001", "title": "遅い商品", "price": 100, "rating": 4.0}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            with patch('main.get_recommendation', side_effect=slow_recommendation):
+                banners_task = asyncio.create_task(async_client.get("/api/banners?use_ai=true"))
+                await asyncio.sleep(0.05)
+
+                started = time.perf_counter()
+                health_response = await async_client.get("/health")
+                health_elapsed = time.perf_counter() - started
+
+                banners_response = await banners_task
+
+        assert health_response.status_code == 200
+        assert health_elapsed < 0.3
+        assert banners_response.json()[0]["id"] == "rec_slow-001"
+
+    @pytest.mark.asyncio
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    async def test_get_banners_with_ai_coalesces_concurrent_requests(self):
+        """Test concurrent identical AI banner requests share one agent run"""
+        def slow_recommendation(query):
+            time.sleep(0.2)
+            return {"id": "fallback-005", "title": "プレミアムワイヤレスヘッドホン", "price": 15800, "rating": 4.8}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            with patch('main.get_recommendation', side_effect=slow_recommendation) as mock_get_recommendation:
+                responses = await asyncio.gather(*[
+                    async_client.get("/api/banners?use_ai=true&query=キャンペーン")
+                    for _ in range(20)
+                ])
+
+        assert all(response.json()[0]["id"] == "rec_fallback-005" for response in responses)
+        mock_get_recommendation.assert_called_once_with("キャンペーン")
+    
+    @pytest.mark.asyncio
+    @patch('main.RECOMMENDATION_DEADLINE_SECONDS', 0.05)
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    async def test_get_banners_with_ai_deadline_fallback_then_cached(self):
+        """Test a slow agent run misses the deadline but warms the cache"""
+        def slow_recommendation(query):
+            time.sleep(0.3)
+            return {"id": "bottle-001", "title": "保温水筒 500ml", "price": 2980, "rating": 4.5}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            with patch('main.get_recommendation', side_effect=slow_recommendation) as mock_get_recommendation:
+                started = time.perf_counter()
+                first = await async_client.get("/api/banners?use_ai=true")
+                first_elapsed = time.perf_counter() - started
+
+                await asyncio.sleep(0.4)
+                second = await async_client.get("/api/banners?use_ai=true")
+
+        assert first_elapsed < 0.25
+        assert first.headers["X-AI-Recommendation-Source"] == "fallback"
+        assert not any(banner["id"].startswith("rec_") for banner in first.json())
+        assert second.headers["X-AI-Recommendation-Source"] == "cached"
+        assert second.json()[0]["id"] == "rec_bottle-001"
+        mock_get_recommendation.assert_called_once_with(None)
+    
+    @patch('main.get_recommendation')
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    def test_get_banners_with_ai_uses_cache(self, mock_get_recommendation):
+        """Test repeated AI banner requests for the same query hit the cache"""
+        mock_get_recommendation.return_value = {
+            "id": "bottle-001",
+            "title": "保温水筒 500ml",
+            "price": 2980,
+            "rating": 4.5,
+        }
+        
+        first = client.get("/api/banners?use_ai=true&query=水筒")
+        second = client.get("/api/banners?use_ai=true&query=%20水筒%20")
+        
+        assert first.json()[0]["id"] == "rec_bottle-001"
+        assert first.headers["X-AI-Recommendation-Source"] == "live"
+        assert second.json()[0]["id"] == "rec_bottle-001"
+        assert second.headers["X-AI-Recommendation-Source"] == "cached"
+        mock_get_recommendation.assert_called_once_with("水筒")
+    
+    @patch('main.get_recommendation')
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    def test_get_banners_with_ai_does_not_cache_fallback(self, mock_get_recommendation):
+        """Test fallback recommendations are not cached"""
+        mock_get_recommendation.return_value = {
+            "id": "fallback-005",
+            "title": "プレミアムワイヤレスヘッドホン",
+            "price": 15800,
+            "rating": 4.8,
+        }
+        
+        client.get("/api/banners?use_ai=true")
+        response = client.get("/api/banners?use_ai=true")
+        
+        assert mock_get_recommendation.call_count == 2
+        assert response.headers["X-AI-Recommendation-Source"] == "fallback"
+    
     @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', False)
     def test_get_banners_with_ai_unavailable(self):
         """Test get banners when AI agent is not available"""
@@ -168,3 +315,227 @@ class TestAPIIntegration:
         # If there are items, they should all be from the requested category
         for item in content:
             assert item["category"].lower() == "general"
+    
+    def test_get_content_by_category_with_loaded_data(self):
+        """Test category lookup against the catalog loaded at startup"""
+        with TestClient(app) as loaded_client:
+            response = loaded_client.get("/api/content/オーディオ")
+            unknown = loaded_client.get("/api/content/unknown")
+        
+        assert response.status_code == 200
+        content = response.json()
+        assert [item["id"] for item in content] == ["1", "7"]
+        assert unknown.status_code == 200
+        assert unknown.json() == []
+    
+    def test_static_catalog_responses_are_pre_rendered(self):
+        """Test catalog endpoints serve the bytes rendered at startup with an ETag"""
+        with TestClient(app) as loaded_client:
+            content = loaded_client.get("/api/content")
+            banners = loaded_client.get("/api/banners")
+            category = loaded_client.get("/api/content/キッチン")
+        
+        assert content.content == main.catalog.content_body.body
+        assert content.headers["ETag"] == main.catalog.content_body.etag
+        assert content.headers["content-type"] == "application/json"
+        assert len(content.json()) == 12
+        assert banners.content == main.catalog.banners_body.body
+        assert banners.headers["ETag"] == main.catalog.banners_body.etag
+        assert [item["id"] for item in category.json()] == ["5", "10"]
+        assert category.headers["ETag"] == main.catalog.content_index.rendered("キッチン").etag
+    
+    def test_content_pagination_and_projection(self):
+        """Test /api/content pages with a cursor, sorts and projects fields"""
+        with TestClient(app) as loaded_client:
+            first = loaded_client.get("/api/content?limit=5&sort=-price&fields=id,price")
+            second = loaded_client.get(
+                f"/api/content?limit=5&sort=-price&fields=id,price&cursor={first.json()['nextCursor']}")
+            invalid_sort = loaded_client.get("/api/content?sort=title")
+            invalid_limit = loaded_client.get("/api/content?limit=0")
+        
+        assert first.status_code == 200
+        assert "ETag" in first.headers
+        page = first.json()
+        assert len(page["items"]) == 5
+        assert set(page["items"][0]) == {"id", "price"}
+        prices = [item["price"] for item in page["items"] + second.json()["items"]]
+        assert prices == sorted(prices, reverse=True)
+        assert not {item["id"] for item in page["items"]} & {item["id"] for item in second.json()["items"]}
+        assert invalid_sort.status_code == 400
+        assert invalid_limit.status_code == 422
+    
+    def test_content_cursor_with_wrong_key_types(self):
+        """Test /api/content rejects cursors whose key types do not match the sort, with and without filters"""
+        for cursor in (
+            encode_cursor("price", ("abc", 5)),
+            encode_cursor("price", (None, None)),
+            encode_cursor("price", ({"a": 1}, 2)),
+        ):
+            plain = client.get(f"/api/content?sort=price&cursor={cursor}")
+            filtered = client.get(f"/api/content?sort=price&min_rating=4&is_sale=true&cursor={cursor}")
+            assert plain.status_code == 400
+            assert filtered.status_code == 400
+            assert plain.json()["detail"] == "Invalid cursor"
+        default_order = client.get(f"/api/content?cursor={encode_cursor('', ('abc', 5))}")
+        assert default_order.status_code == 400
+    
+    def test_content_filters_and_facets(self):
+        """Test /api/content filters on the server and returns facet counts"""
+        with TestClient(app) as loaded_client:
+            response = loaded_client.get(
+                "/api/content?min_price=5000&max_price=16000&min_rating=4.5"
+                "&category=オーディオ&category=キッチン&sort=price")
+            sale = loaded_client.get("/api/content?isSale=true&fields=id")
+        
+        assert response.status_code == 200
+        page = response.json()
+        assert [item["id"] for item in page["items"]] == ["10", "7", "1"]
+        assert page["total"] == 3
+        assert page["facets"]["category"]["ウェアラブル"] == 1
+        assert page["facets"]["isSale"] == 3
+        assert [item["id"] for item in sale.json()["items"]] == ["1", "3", "6", "7", "10"]
+    
+    def test_search_endpoint(self):
+        """Test /api/search answers keyword queries from the local index"""
+        with TestClient(app) as loaded_client:
+            response = loaded_client.get("/api/search?q=水筒")
+            empty = loaded_client.get("/api/search?q=存在しない商品名")
+            missing = loaded_client.get("/api/search")
+        
+        assert response.status_code == 200
+        assert response.json()[0]["title"] == "エコフレンドリー水筒"
+        assert empty.json() == []
+        assert missing.status_code == 422
+    
+    @patch('main.get_recommendation')
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    def test_ai_banner_joined_against_catalog_by_id(self, mock_get_recommendation):
+        """Test the AI banner uses live catalog data for the recommended id"""
+        with TestClient(app) as loaded_client:
+            mock_get_recommendation.return_value = {"id": "missing", "ids": ["missing", "10"]}
+            id_only = loaded_client.get("/api/banners?use_ai=true&query=コーヒー")
+            mock_get_recommendation.return_value = {"id": "3", "title": "古い商品名", "price": 1}
+            echoed = loaded_client.get("/api/banners?use_ai=true&query=バッグ")
+            mock_get_recommendation.return_value = {"id": "x", "ids": ["x"]}
+            unknown = loaded_client.get("/api/banners?use_ai=true&query=不明")
+            unknown_cached = loaded_client.get("/api/banners?use_ai=true&query=不明")
+        
+        assert id_only.json()[0]["id"] == "rec_10"
+        assert id_only.headers["X-AI-Recommendation-Source"] == "live"
+        assert id_only.headers["Cache-Control"].startswith("private, max-age=")
+        assert id_only.json()[0]["title"] == "ポータブルコーヒーメーカー"
+        assert "価格: ¥9800" in id_only.json()[0]["subtitle"]
+        assert echoed.json()[0]["title"] == "ミニマリストバックパック"
+        assert "価格: ¥8900" in echoed.json()[0]["subtitle"]
+        assert not unknown.json()[0]["id"].startswith("rec_")
+        # No AI banner was sent, so neither response claims one
+        for response in (unknown, unknown_cached):
+            assert response.headers["X-AI-Recommendation-Source"] == "fallback"
+            assert response.headers["Cache-Control"] == "private, no-cache"
+    
+    @patch('main.get_recommendation')
+    def test_replay_serves_recorded_answers(self, mock_get_recommendation):
+        """Test replay mode answers from the response log without the agent"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log = main.ResponseLog(Path(tmp_dir) / "responses.jsonl")
+            log.append("コーヒー", {"id": "10"}, 2.5, "completed")
+            with patch('main.response_log', log), patch('main.RECOMMENDATION_REPLAY', True), \
+                    patch('main.AZURE_AGENT_IMPORT_AVAILABLE', False):
+                with TestClient(app) as loaded_client:
+                    main.recommendation_cache.clear()
+                    recorded = loaded_client.get("/api/banners?use_ai=true&query=コーヒー")
+                    unrecorded = loaded_client.get("/api/banners?use_ai=true&query=未記録")
+        
+        mock_get_recommendation.assert_not_called()
+        assert recorded.headers["X-AI-Recommendation-Source"] == "live"
+        assert recorded.json()[0]["title"] == "ポータブルコーヒーメーカー"
+        assert not unrecorded.json()[0]["id"].startswith("rec_")
+    
+    def test_cache_warmed_from_response_log(self):
+        """Test recorded answers are loaded into the cache at startup"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log = main.ResponseLog(Path(tmp_dir) / "responses.jsonl")
+            log.append(None, {"id": "3"}, 2.5, "completed")
+            # A line from an older format without "ts" must not stop startup
+            with open(log.path, "a", encoding="utf-8") as f:
+                f.write('{"query": "古い形式", "recommendation": {"id": "4"}}\n')
+            with patch('main.response_log', log):
+                with TestClient(app) as loaded_client:
+                    warmed = loaded_client.portal.call(main.recommendation_cache.peek, None)
+        
+        assert warmed == {"id": "3"}
+    
+    def test_recommendation_candidates_come_from_catalog(self):
+        """Test the agent prompt candidates are ranked from the loaded catalog"""
+        with TestClient(app):
+            candidates = main.recommendation_candidates("水筒", 3)
+        
+        assert len(candidates) == 3
+        assert candidates[0]["title"] == "エコフレンドリー水筒"
+        assert {"id", "title", "price", "rating", "category", "imageUrl"} <= set(candidates[0])
+    
+    def test_conditional_get_returns_not_modified(self):
+        """Test If-None-Match with the current ETag answers 304 without a body"""
+        with TestClient(app) as loaded_client:
+            first = loaded_client.get("/api/content")
+            etag = first.headers["ETag"]
+            not_modified = loaded_client.get("/api/content", headers={"If-None-Match": etag})
+            weak = loaded_client.get("/api/content", headers={"If-None-Match": f'"other", W/{etag}'})
+            changed = loaded_client.get("/api/content", headers={"If-None-Match": '"stale-version"'})
+        
+        assert first.headers["Cache-Control"].startswith("public, max-age=")
+        assert "stale-while-revalidate=" in first.headers["Cache-Control"]
+        assert "Last-Modified" in first.headers
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag
+        assert weak.status_code == 304
+        assert changed.status_code == 200
+        assert changed.content == first.content
+    
+    def test_conditional_get_if_modified_since(self):
+        """Test If-Modified-Since is honoured when no If-None-Match is sent"""
+        with TestClient(app) as loaded_client:
+            first = loaded_client.get("/api/banners")
+            last_modified = first.headers["Last-Modified"]
+            not_modified = loaded_client.get("/api/banners", headers={"If-Modified-Since": last_modified})
+            older = loaded_client.get(
+                "/api/banners", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+            invalid = loaded_client.get("/api/banners", headers={"If-Modified-Since": "not a date"})
+        
+        assert not_modified.status_code == 304
+        assert older.status_code == 200
+        assert invalid.status_code == 200
+    
+    @patch('main.get_recommendation')
+    @patch('main.AZURE_AGENT_IMPORT_AVAILABLE', True)
+    def test_ai_banners_use_private_cache_policy(self, mock_get_recommendation):
+        """Test AI-personalized banners are cached privately and are not conditional"""
+        mock_get_recommendation.return_value = {"id": "bottle-001", "title": "保温水筒", "price": 2980, "rating": 4.5}
+        
+        live = client.get("/api/banners?use_ai=true", headers={"If-None-Match": "*"})
+        mock_get_recommendation.return_value = None
+        fallback = client.get("/api/banners?use_ai=true&query=なし", headers={"If-None-Match": "*"})
+        
+        assert live.status_code == 200
+        assert live.headers["Cache-Control"].startswith("private, max-age=")
+        assert "ETag" not in live.headers
+        assert fallback.status_code == 200
+        assert fallback.headers["Cache-Control"] == "private, no-cache"
+    
+    def test_catalog_served_from_mapped_snapshot(self):
+        """Test endpoints serve identical responses from the shared mmap snapshot"""
+        with TestClient(app) as loaded_client:
+            expected_content = loaded_client.get("/api/content")
+            expected_category = loaded_client.get("/api/content/オーディオ")
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with patch('main.CATALOG_SNAPSHOT_PATH', str(Path(tmp_dir) / "catalog.snap")):
+                with TestClient(app) as loaded_client:
+                    content = loaded_client.get("/api/content")
+                    category = loaded_client.get("/api/content/オーディオ")
+                    assert type(main.catalog).__name__ == "MappedCatalogSnapshot"
+        
+        assert content.content == expected_content.content
+        assert content.headers["ETag"] == expected_content.headers["ETag"]
+        assert category.content == expected_category.content
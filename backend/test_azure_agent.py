@@ -1,12 +1,24 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
 import json
+import threading
 import pytest
-from azure_agent import get_recommendation, main
+import azure_agent
+from azure_agent import AgentThreadPool, get_recommendation, main
+from azure.ai.agents.models import ListSortOrder
 
 
 class TestAzureAgent(unittest.TestCase):
     
+    def setUp(self):
+        azure_agent.invalidate_agent()
+        azure_agent.thread_pool.reset()
+        # The API module installs catalog-backed hooks when it is imported
+        for hook in ('azure_agent.candidate_provider', 'azure_agent.response_recorder'):
+            patcher = patch(hook, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
     @patch('azure_agent.get_project_client')
     def test_successful_recommendation_parsing(self, mock_get_project_client):
         """Test successful JSON parsing from assistant response"""
@@ -309,5 +321,342 @@ class TestAzureAgent(unittest.TestCase):
                 
 
 
+    @patch('azure_agent.get_project_client')
+    def test_only_latest_assistant_message_is_fetched(self, mock_get_project_client):
+        """Test one descending, limit-1 messages.list call scoped to the run"""
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        mock_project.agents.threads.create.return_value.id = "test-thread-id"
+        mock_run = Mock()
+        mock_run.id = "test-run-id"
+        mock_run.status = "completed"
+        mock_project.agents.runs.create_and_process.return_value = mock_run
+        
+        mock_assistant_message = Mock()
+        mock_assistant_message.role = "assistant"
+        mock_text_message = Mock()
+        mock_text_message.text.value = '{"id": "bottle-002", "title": "新しい水筒"}'
+        mock_assistant_message.text_messages = [mock_text_message]
+        mock_project.agents.messages.list.return_value = [mock_assistant_message]
+        
+        result = get_recommendation()
+        
+        self.assertEqual(result["id"], "bottle-002")
+        mock_project.agents.messages.list.assert_called_once_with(
+            thread_id="test-thread-id",
+            run_id="test-run-id",
+            order=ListSortOrder.DESCENDING,
+            limit=1)
+    
+    @patch('azure_agent.get_project_client')
+    def test_agent_handle_is_reused(self, mock_get_project_client):
+        """Test the agent is fetched once and reused across recommendations"""
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        mock_run = Mock()
+        mock_run.status = "completed"
+        mock_project.agents.runs.create_and_process.return_value = mock_run
+        mock_project.agents.messages.list.return_value = []
+        
+        get_recommendation()
+        get_recommendation()
+        
+        mock_project.agents.get_agent.assert_called_once()
+    
+    @patch('azure_agent.get_project_client')
+    def test_agent_handle_refreshed_after_error(self, mock_get_project_client):
+        """Test the cached agent is dropped after a failure and fetched again"""
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        mock_project.agents.messages.create.side_effect = [Exception("Network error"), Mock()]
+        mock_run = Mock()
+        mock_run.status = "completed"
+        mock_project.agents.runs.create_and_process.return_value = mock_run
+        mock_project.agents.messages.list.return_value = []
+        
+        self.assertEqual(get_recommendation()["id"], "fallback-005")
+        self.assertEqual(get_recommendation()["id"], "fallback-003")
+        
+        self.assertEqual(mock_project.agents.get_agent.call_count, 2)
+
+    def _streaming_project(self, mock_get_project_client, events):
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        mock_project.agents.threads.create.return_value.id = "test-thread-id"
+        stream = MagicMock()
+        stream.__enter__.return_value = iter(events)
+        mock_project.agents.runs.stream.return_value = stream
+        return mock_project
+    
+    @patch('azure_agent.AZURE_AGENT_STREAMING', True)
+    @patch('azure_agent.get_project_client')
+    def test_streaming_returns_first_complete_object(self, mock_get_project_client):
+        """Test streaming stops reading once a complete JSON object arrives"""
+        run = Mock(id="test-run-id", status="in_progress")
+        events = [
+            ("thread.run.created", run, None),
+            ("thread.message.delta", Mock(text='おすすめは {"id": "bottle-001", '), None),
+            ("thread.message.delta", Mock(text='"title": "保温水筒"} です。'), None),
+            ("thread.message.delta", Mock(text='長い説明が続きます...'), None),
+        ]
+        remaining = iter(events)
+        mock_project = self._streaming_project(mock_get_project_client, remaining)
+        
+        result = get_recommendation()
+        
+        self.assertEqual(result, {"id": "bottle-001", "title": "保温水筒"})
+        self.assertEqual(next(remaining)[1].text, '長い説明が続きます...')
+        mock_project.agents.runs.create_and_process.assert_not_called()
+        retired = azure_agent.thread_pool._retired[-1]
+        self.assertEqual(retired.active_run_id, "test-run-id")
+    
+    @patch('azure_agent.AZURE_AGENT_STREAMING', True)
+    @patch('azure_agent.get_project_client')
+    def test_streaming_failed_run_fallback(self, mock_get_project_client):
+        """Test a failed streamed run returns fallback-006"""
+        events = [
+            ("thread.run.created", Mock(id="test-run-id"), None),
+            ("thread.run.failed", Mock(status="failed", last_error="quota"), None),
+        ]
+        self._streaming_project(mock_get_project_client, events)
+        
+        self.assertEqual(get_recommendation()["id"], "fallback-006")
+    
+    @patch('azure_agent.AZURE_AGENT_STREAMING', True)
+    @patch('azure_agent.get_project_client')
+    def test_streaming_completed_without_json_fallback(self, mock_get_project_client):
+        """Test a completed streamed run without JSON returns fallback-001"""
+        events = [
+            ("thread.run.created", Mock(id="test-run-id"), None),
+            ("thread.message.delta", Mock(text="申し訳ございません"), None),
+            ("thread.run.completed", Mock(status="completed"), None),
+            ("done", "[DONE]", None),
+        ]
+        self._streaming_project(mock_get_project_client, events)
+        
+        self.assertEqual(get_recommendation()["id"], "fallback-001")
+        self.assertIsNone(azure_agent.thread_pool._retired[-1].active_run_id)
+    
+    @patch('azure_agent.AZURE_AGENT_STREAMING', True)
+    @patch('azure_agent.get_project_client')
+    def test_streaming_object_after_unclosed_brace(self, mock_get_project_client):
+        """Test an object after an unclosed brace in the prose is used once the stream ends"""
+        events = [
+            ("thread.run.created", Mock(id="test-run-id"), None),
+            ("thread.message.delta", Mock(text="おすすめ :-{ です。 "), None),
+            ("thread.message.delta", Mock(text='{"id": "bottle-001", "title": "保温水筒"}'), None),
+            ("thread.run.completed", Mock(status="completed"), None),
+            ("done", "[DONE]", None),
+        ]
+        self._streaming_project(mock_get_project_client, events)
+        
+        self.assertEqual(get_recommendation(), {"id": "bottle-001", "title": "保温水筒"})
+
+    def _completed_project(self, mock_get_project_client, reply):
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        mock_project.agents.runs.create_and_process.return_value = Mock(status="completed")
+        mock_message = Mock(role="assistant")
+        mock_message.text_messages = [Mock()]
+        mock_message.text_messages[0].text.value = reply
+        mock_project.agents.messages.list.return_value = [mock_message]
+        return mock_project
+    
+    @patch('azure_agent.get_project_client')
+    def test_candidates_inlined_in_prompt(self, mock_get_project_client):
+        """Test local candidates replace the content.json lookup in the prompt"""
+        candidates = [
+            {"id": "10", "title": "エコフレンドリー水筒", "price": 2980, "rating": 4.7,
+             "category": "キッチン", "imageUrl": "/images/10.jpg", "isRecommended": True},
+            {"id": "5", "title": "コーヒーメーカー", "price": 3200, "rating": 4.5,
+             "category": "キッチン", "imageUrl": "/images/5.jpg", "isRecommended": False},
+        ]
+        provider = Mock(return_value=candidates)
+        mock_project = self._completed_project(mock_get_project_client, '{"id": "10", "title": "エコフレンドリー水筒"}')
+        
+        with patch('azure_agent.candidate_provider', provider):
+            result = get_recommendation("水筒")
+        
+        provider.assert_called_once_with("水筒", azure_agent.AZURE_AGENT_CANDIDATES)
+        prompt = mock_project.agents.messages.create.call_args.kwargs["content"]
+        self.assertNotIn("content.json", prompt)
+        self.assertIn('{"id":"10","title":"エコフレンドリー水筒","price":2980,"rating":4.7,"category":"キッチン"}', prompt)
+        self.assertNotIn("/images/10.jpg", prompt)
+        # Fields not sent to the agent are filled in from the catalog
+        self.assertEqual(result["imageUrl"], "/images/10.jpg")
+    
+    @patch('azure_agent.get_project_client')
+    def test_unknown_candidate_id_resolves_to_catalog_item(self, mock_get_project_client):
+        """Test an id outside the candidates is replaced by the best candidate"""
+        candidates = [{"id": "10", "title": "水筒", "price": 2980, "rating": 4.7, "category": "キッチン"}]
+        self._completed_project(mock_get_project_client, '{"id": "invented-1", "title": "架空の水筒"}')
+        
+        with patch('azure_agent.candidate_provider', Mock(return_value=candidates)):
+            result = get_recommendation("水筒")
+        
+        self.assertEqual(result, candidates[0])
+    
+    @patch('azure_agent.get_project_client')
+    def test_candidate_provider_failure_uses_content_json(self, mock_get_project_client):
+        """Test the original prompt is used when candidate retrieval fails"""
+        mock_project = self._completed_project(mock_get_project_client, '{"id": "1"}')
+        
+        with patch('azure_agent.candidate_provider', Mock(side_effect=RuntimeError("no catalog"))):
+            self.assertEqual(get_recommendation()["id"], "1")
+        
+        self.assertIn("content.json", mock_project.agents.messages.create.call_args.kwargs["content"])
+
+    @patch('azure_agent.get_project_client')
+    def test_first_valid_object_among_several(self, mock_get_project_client):
+        """Test prose braces and ill-typed objects are skipped instead of falling back"""
+        self._completed_project(
+            mock_get_project_client,
+            '条件 {"budget": "3000円"} を考慮し {"id": "bottle-009", "price": "高い"} ではなく '
+            '{"id": "bottle-010", "title": "保温水筒", "price": 2980} をおすすめします。{補足}')
+        
+        result = get_recommendation()
+        
+        self.assertEqual(result, {"id": "bottle-010", "title": "保温水筒", "price": 2980})
+    
+    @patch('azure_agent.get_project_client')
+    def test_stage_timings_and_fallback_counts(self, mock_get_project_client):
+        """Test each stage of a run is timed and fallback answers are counted by id"""
+        stages = ("get_agent", "thread_acquire", "threads_create", "candidates",
+                  "messages_create", "create_and_process", "messages_list", "parse")
+        before = {stage: azure_agent.agent_stage_seconds.labels(stage).count for stage in stages}
+        fallbacks = azure_agent.agent_fallbacks.value("fallback-001")
+        self._completed_project(mock_get_project_client, "JSON はありません")
+        
+        self.assertEqual(get_recommendation("水筒")["id"], "fallback-001")
+        
+        for stage in stages:
+            self.assertEqual(azure_agent.agent_stage_seconds.labels(stage).count, before[stage] + 1, stage)
+        self.assertEqual(azure_agent.agent_fallbacks.value("fallback-001"), fallbacks + 1)
+    
+    @patch('azure_agent.get_project_client')
+    def test_parsed_answers_are_recorded(self, mock_get_project_client):
+        """Test parsed answers reach the recorder with latency and status, fallbacks do not"""
+        recorder = Mock()
+        self._completed_project(mock_get_project_client, '{"id": "bottle-001"}')
+        
+        with patch('azure_agent.response_recorder', recorder):
+            get_recommendation("水筒")
+            mock_get_project_client.side_effect = Exception("Network error")
+            get_recommendation("水筒")
+        
+        recorder.assert_called_once()
+        query, result, latency, status = recorder.call_args.args
+        self.assertEqual((query, result, status), ("水筒", {"id": "bottle-001"}, "completed"))
+        self.assertGreaterEqual(latency, 0)
+    
+    @patch('azure_agent.AZURE_AGENT_ID_ONLY', True)
+    @patch('azure_agent.get_project_client')
+    def test_id_only_mode(self, mock_get_project_client):
+        """Test id-only mode asks for ranked ids and keeps only offered ones"""
+        candidates = [
+            {"id": "10", "title": "水筒", "price": 2980, "rating": 4.7, "category": "キッチン"},
+            {"id": "5", "title": "マグ", "price": 1200, "rating": 4.5, "category": "キッチン"},
+        ]
+        mock_project = self._completed_project(mock_get_project_client, '{"ids": ["99", "5", "10"]}')
+        
+        with patch('azure_agent.candidate_provider', Mock(return_value=candidates)):
+            result = get_recommendation("水筒")
+        
+        prompt = mock_project.agents.messages.create.call_args.kwargs["content"]
+        self.assertIn('{"ids": [""]}', prompt)
+        self.assertNotIn('"imageUrl"', prompt)
+        self.assertEqual(result, {"id": "5", "ids": ["5", "10"]})
+    
+    @patch('azure_agent.AZURE_AGENT_ID_ONLY', True)
+    @patch('azure_agent.get_project_client')
+    def test_id_only_without_ids_fallback(self, mock_get_project_client):
+        """Test an id-only answer with no id returns fallback-008"""
+        self._completed_project(mock_get_project_client, '{"ids": []}')
+        
+        self.assertEqual(get_recommendation()["id"], "fallback-008")
+
+
+class TestAgentThreadPool(unittest.TestCase):
+    
+    def test_acquire_creates_thread_when_pool_empty(self):
+        """Test a thread is created inline when nothing is pre-created"""
+        pool = AgentThreadPool(size=2)
+        mock_project = Mock()
+        mock_project.agents.threads.create.return_value.id = "thread-1"
+        
+        pooled = pool.acquire(mock_project)
+        
+        self.assertEqual(pooled.id, "thread-1")
+        mock_project.agents.threads.create.assert_called_once()
+    
+    def test_thread_reused_until_max_runs(self):
+        """Test completed threads return to the pool until max_runs, then retire"""
+        pool = AgentThreadPool(size=0, max_runs=2)
+        mock_project = Mock()
+        mock_project.agents.threads.create.return_value.id = "thread-1"
+        
+        first = pool.acquire(mock_project)
+        pool.release(first, reusable=True)
+        second = pool.acquire(mock_project)
+        pool.release(second, reusable=True)
+        
+        self.assertIs(first, second)
+        mock_project.agents.threads.create.assert_called_once()
+        self.assertEqual(len(pool._idle), 0)
+        self.assertEqual(len(pool._retired), 1)
+    
+    def test_failed_thread_is_retired(self):
+        """Test a thread whose run did not complete is never reused"""
+        pool = AgentThreadPool(size=0, max_runs=5)
+        mock_project = Mock()
+        
+        pooled = pool.acquire(mock_project)
+        pool.release(pooled, reusable=False)
+        
+        self.assertEqual(len(pool._idle), 0)
+        self.assertEqual(len(pool._retired), 1)
+    
+    @patch('azure_agent.get_project_client')
+    def test_active_run_cancelled_before_delete(self, mock_get_project_client):
+        """Test a retired thread with a still-running streamed run is cancelled first"""
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        pool = AgentThreadPool(size=0)
+        
+        pooled = pool.acquire(mock_project)
+        pooled.active_run_id = "run-1"
+        pool.release(pooled, reusable=False)
+        pool.stop()
+        
+        mock_project.agents.runs.cancel.assert_called_once_with(thread_id=pooled.id, run_id="run-1")
+        mock_project.agents.threads.delete.assert_called_once_with(pooled.id)
+    
+    @patch('azure_agent.get_project_client')
+    def test_background_worker_prefills_and_deletes(self, mock_get_project_client):
+        """Test the worker pre-creates threads and deletes them on stop"""
+        mock_project = Mock()
+        mock_get_project_client.return_value = mock_project
+        created = iter(f"thread-{i}" for i in range(100))
+        mock_project.agents.threads.create.side_effect = lambda: Mock(id=next(created))
+        pool = AgentThreadPool(size=2)
+        
+        pool.start()
+        for _ in range(100):
+            if len(pool._idle) == 2:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(len(pool._idle), 2)
+        
+        pooled = pool.acquire(mock_project)
+        self.assertEqual(pooled.id, "thread-0")
+        pool.release(pooled, reusable=True)
+        pool.stop()
+        
+        deleted = {call.args[0] for call in mock_project.agents.threads.delete.call_args_list}
+        self.assertIn("thread-0", deleted)
+        self.assertIn("thread-1", deleted)
+        self.assertEqual(len(pool._idle), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from benchmark import compare, generate_content, run_size
+from models import ContentItem
+
+
+class TestGenerateContent(unittest.TestCase):
+
+    def test_valid_and_reproducible(self):
+        """Test generated items validate as ContentItem and depend only on the seed"""
+        items = generate_content(500, seed=3)
+        self.assertEqual(len(items), 500)
+        self.assertEqual(len({item["id"] for item in items}), 500)
+        for item in items:
+            ContentItem(**item)
+        self.assertEqual(items, generate_content(500, seed=3))
+        self.assertNotEqual(items, generate_content(500, seed=4))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run_size_reports_every_measurement(self):
+        """Test one small run fills in load, memory, serialization and endpoint numbers"""
+        result = run_size(200, min_seconds=0, min_requests=2)
+        for key in ("load_ms", "load_mapped_ms", "memory_bytes_per_item", "render_content_ms", "body_bytes_per_item"):
+            self.assertGreater(result[key], 0, key)
+        self.assertEqual(
+            set(result["endpoints"]),
+            {"content", "content_by_category", "banners", "content_page", "search"})
+        self.assertGreater(result["endpoints"]["content"]["response_bytes"], 200 * 100)
+
+    def test_compare(self):
+        """Test slower times and lower throughput beyond the tolerance are regressions"""
+        baseline = {"results": {"1000": {
+            "items": 1000, "load_ms": 100.0, "memory_bytes_per_item": 1000.0,
+            "endpoints": {"content": {"p50_ms": 1.0, "rps": 1000.0, "response_bytes": 10}},
+        }}}
+        report = {"results": {"1000": {
+            "items": 1000, "load_ms": 150.0, "memory_bytes_per_item": 1100.0,
+            "endpoints": {"content": {"p50_ms": 0.5, "rps": 700.0, "response_bytes": 99}},
+        }}}
+        self.assertEqual(compare(report, baseline, tolerance=0.2), [
+            "1000/endpoints/content/rps: 700.0 < 1000.0 (-30%)",
+            "1000/load_ms: 150.0 > 100.0 (+50%)",
+        ])
+        self.assertEqual(compare(baseline, baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
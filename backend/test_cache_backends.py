@@ -0,0 +1,270 @@
+import asyncio
+import fnmatch
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from cache_backends import (
+    CacheEntry,
+    MemoryBackend,
+    RedisBackend,
+    SQLiteBackend,
+    create_backend,
+)
+from load_test import LoopLagMonitor
+from recommendation_cache import RecommendationCache
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Minimal in-process server speaking the Redis protocol, for tests"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        data = value.encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name, rest = args[0].upper(), args[1:]
+            with server.lock:
+                now = time.time()
+                for key in [key for key, at in server.expires.items() if at <= now]:
+                    server.data.pop(key, None)
+                    server.expires.pop(key, None)
+                if name in ("PING", "SELECT", "AUTH"):
+                    reply = b"+OK\r\n"
+                elif name == "GET":
+                    reply = self.bulk(server.data.get(rest[0]))
+                elif name == "SET":
+                    server.data[rest[0]] = rest[1]
+                    if len(rest) == 4 and rest[2].upper() == "PX":
+                        server.expires[rest[0]] = now + int(rest[3]) / 1000
+                    reply = b"+OK\r\n"
+                elif name == "DEL":
+                    removed = sum(server.data.pop(key, None) is not None for key in rest)
+                    reply = b":%d\r\n" % removed
+                elif name == "SCAN":
+                    keys = [key for key in server.data if fnmatch.fnmatch(key, rest[2])]
+                    reply = b"*2\r\n" + self.bulk("0") + b"*%d\r\n" % len(keys) + b"".join(map(self.bulk, keys))
+                else:
+                    reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+class BackendContract:
+    """Behaviour every backend must share"""
+
+    def make_backend(self, max_entries=1024):
+        raise NotImplementedError
+
+    def entry(self, value, ttl=60):
+        now = time.time()
+        return CacheEntry(value, now + ttl, now + ttl * 2)
+
+    def test_round_trip(self):
+        """Test entries come back with their value and times"""
+        backend = self.make_backend()
+        entry = self.entry({"id": "1", "title": "保温水筒"})
+        backend.set("水筒", entry)
+        stored = backend.get("水筒")
+        self.assertEqual(stored.value, {"id": "1", "title": "保温水筒"})
+        self.assertAlmostEqual(stored.fresh_until, entry.fresh_until)
+        self.assertAlmostEqual(stored.stale_until, entry.stale_until)
+        self.assertIsNone(backend.get("missing"))
+
+    def test_delete_and_clear(self):
+        """Test single and full removal"""
+        backend = self.make_backend()
+        backend.set("a", self.entry(1))
+        backend.set("b", self.entry(2))
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(len(backend), 1)
+        backend.clear()
+        self.assertEqual(len(backend), 0)
+
+
+class TestMemoryBackend(BackendContract, unittest.TestCase):
+
+    def make_backend(self, max_entries=1024):
+        return MemoryBackend(max_entries)
+
+
+class TestSQLiteBackend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = str(Path(self.tmp_dir.name) / "cache.db")
+
+    def make_backend(self, max_entries=1024):
+        backend = SQLiteBackend(self.path, max_entries)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_shared_between_workers(self):
+        """Test two backends on one file see each other's entries"""
+        first, second = self.make_backend(), self.make_backend()
+        first.set("水筒", self.entry({"id": "1"}))
+        self.assertEqual(second.get("水筒").value, {"id": "1"})
+
+    def test_evicts_oldest_past_max_entries(self):
+        """Test only the most recently stored entries are kept"""
+        backend = self.make_backend(max_entries=2)
+        for key in ("a", "b", "c"):
+            backend.set(key, self.entry(key))
+            time.sleep(0.001)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(len(backend), 2)
+
+    def test_reopens_after_close(self):
+        """Test a closed backend reconnects on the next call"""
+        backend = self.make_backend()
+        backend.set("a", self.entry(1))
+        backend.close()
+        self.assertEqual(backend.get("a").value, 1)
+
+
+class TestRedisBackend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.server = RespStandIn()
+        self.addCleanup(self.server.close)
+
+    def make_backend(self, max_entries=1024):
+        backend = create_backend(f"redis://127.0.0.1:{self.server.server_address[1]}/0", max_entries)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_entries_expire_after_stale_window(self):
+        """Test entries are stored with a server-side expiry"""
+        backend = self.make_backend()
+        backend.set("a", CacheEntry(1, time.time(), time.time() + 0.05))
+        self.assertEqual(backend.get("a").value, 1)
+        time.sleep(0.1)
+        self.assertIsNone(backend.get("a"))
+
+    def test_keys_are_prefixed(self):
+        """Test only prefixed keys are used, so clear leaves other data alone"""
+        backend = self.make_backend()
+        self.server.data["other"] = "keep"
+        backend.set("a", self.entry(1))
+        self.assertIn("recommendation:a", self.server.data)
+        backend.clear()
+        self.assertEqual(self.server.data, {"other": "keep"})
+
+    def test_unavailable_server_is_a_miss(self):
+        """Test connection errors are treated as misses instead of failing"""
+        backend = RedisBackend(port=self.server.server_address[1])
+        self.server.close()
+        backend.close()
+        backend.set("a", self.entry(1))
+        self.assertIsNone(backend.get("a"))
+
+
+class TestCreateBackend(unittest.TestCase):
+
+    def test_backend_urls(self):
+        """Test backend selection from RECOMMENDATION_CACHE_BACKEND values"""
+        self.assertIsInstance(create_backend("memory"), MemoryBackend)
+        self.assertIsInstance(create_backend(""), MemoryBackend)
+        self.assertEqual(create_backend("sqlite:///tmp/cache.db").path, "/tmp/cache.db")
+        redis = create_backend("redis://:secret@cache:6380/2")
+        self.assertEqual((redis.host, redis.port, redis.db, redis.password), ("cache", 6380, 2, "secret"))
+        with self.assertRaises(ValueError):
+            create_backend("memcached://localhost")
+
+
+class TestSharedRecommendationCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_workers_share_hits_and_restart_warm(self):
+        """Test a value loaded by one worker is a hit for another and after a restart"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "cache.db")
+            calls = []
+
+            async def loader(query):
+                calls.append(query)
+                return {"id": "1", "query": query}
+
+            worker_a = RecommendationCache(loader, backend=SQLiteBackend(path))
+            worker_b = RecommendationCache(loader, backend=SQLiteBackend(path))
+            await worker_a.get("水筒")
+            self.assertEqual(await worker_b.get(" 水筒 "), {"id": "1", "query": "水筒"})
+            await worker_a.close()
+            await worker_b.close()
+
+            restarted = RecommendationCache(loader, backend=SQLiteBackend(path))
+            self.assertEqual(await restarted.peek("水筒"), {"id": "1", "query": "水筒"})
+            await restarted.close()
+            self.assertEqual(calls, ["水筒"])
+
+    async def test_stalled_backend_does_not_block_event_loop(self):
+        """Test a Redis server that never replies delays the lookup but not the event loop"""
+        # Connections complete in the listen backlog, but nothing ever answers
+        stalled = socket.socket()
+        stalled.bind(("127.0.0.1", 0))
+        stalled.listen(8)
+        self.addCleanup(stalled.close)
+
+        async def loader(query):
+            return {"id": "1"}
+
+        cache = RecommendationCache(
+            loader, backend=RedisBackend(port=stalled.getsockname()[1], timeout=0.2))
+        monitor = LoopLagMonitor(0.005)
+        monitor.start()
+        # Let the probe take its first reading before the lookup starts
+        await asyncio.sleep(0.02)
+        started = time.perf_counter()
+        self.assertEqual(await cache.get("水筒"), {"id": "1"})
+        elapsed = time.perf_counter() - started
+        # ... and its reading for the time the lookup ran
+        await asyncio.sleep(0.02)
+        lags = await monitor.stop()
+        await cache.close()
+
+        # Two timed-out reads for the lookup, two more for the store
+        self.assertGreaterEqual(elapsed, 0.8)
+        self.assertLess(max(lags), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
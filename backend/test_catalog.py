@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+
+from catalog import CatalogSnapshot, CatalogWatcher, CategoryIndex, RenderedJson, load_catalog, render_content
+from test_helpers import make_item
+
+
+class TestCategoryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            make_item("1", "オーディオ"),
+            make_item("2", "Kitchen"),
+            make_item("3", "オーディオ"),
+            make_item("4", "kitchen"),
+        ]
+        self.index = CategoryIndex(self.items)
+
+    def test_get_returns_items_in_catalog_order(self):
+        """Test items of a category are returned in their original order"""
+        self.assertEqual([item.id for item in self.index.get("オーディオ")], ["1", "3"])
+
+    def test_get_is_case_insensitive(self):
+        """Test category lookup ignores case on both sides"""
+        self.assertEqual([item.id for item in self.index.get("KITCHEN")], ["2", "4"])
+
+    def test_unknown_category(self):
+        """Test an unknown category returns an empty tuple"""
+        self.assertEqual(self.index.get("unknown"), ())
+
+    def test_categories_in_first_seen_order(self):
+        """Test the known categories keep the spelling first seen in the data"""
+        self.assertEqual(self.index.categories, ("オーディオ", "Kitchen"))
+
+    def test_rendered_category_bodies(self):
+        """Test each category body is pre-rendered and unknown categories render []"""
+        body = json.loads(self.index.rendered("KITCHEN").body)
+        self.assertEqual([item["id"] for item in body], ["2", "4"])
+        self.assertEqual(self.index.rendered("unknown").body, b"[]")
+
+    def test_snapshot_build_does_not_rebuild_items(self):
+        """Test bodies and groups come from the validated models and the column codes"""
+        with patch('content_columns.ContentColumns.__getitem__', side_effect=AssertionError("rebuilt item")):
+            snapshot = CatalogSnapshot([], self.items)
+        self.assertEqual([item["id"] for item in json.loads(snapshot.content_body.body)], ["1", "2", "3", "4"])
+        self.assertEqual(list(snapshot.content_index.by_category["kitchen"]), [1, 3])
+        self.assertEqual(json.loads(snapshot.content_index.rendered("オーディオ").body)[1]["id"], "3")
+
+    def test_empty_index(self):
+        """Test an index built from no items answers every lookup with nothing"""
+        index = CategoryIndex()
+        self.assertEqual(index.get("オーディオ"), ())
+        self.assertEqual(index.categories, ())
+
+
+class TestRenderedJson(unittest.TestCase):
+
+    def test_render_matches_fastapi_serialization(self):
+        """Test pre-rendered bytes equal what FastAPI would serialize"""
+        items = [make_item("1", "オーディオ"), make_item("2", "キッチン")]
+        expected = json.dumps(
+            jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        self.assertEqual(render_content(items).body, expected)
+
+    def test_etag_is_strong_and_content_addressed(self):
+        """Test the ETag is quoted, stable for equal bytes and changes with content"""
+        first = RenderedJson(b'[{"id":"1"}]')
+        same = RenderedJson(b'[{"id":"1"}]')
+        other = RenderedJson(b'[{"id":"2"}]')
+
+        self.assertTrue(first.etag.startswith('"') and first.etag.endswith('"'))
+        self.assertFalse(first.etag.startswith('W/'))
+        self.assertEqual(first.etag, same.etag)
+        self.assertNotEqual(first.etag, other.etag)
+
+
+class CatalogDataDirMixin:
+
+    def make_data_dir(self) -> Path:
+        data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, data_dir)
+        source = Path(__file__).parent / "data"
+        shutil.copy(source / "banners.json", data_dir / "banners.json")
+        shutil.copy(source / "content.json", data_dir / "content.json")
+        return data_dir
+
+    def write_content(self, data_dir: Path, items, bump_mtime: bool = True) -> None:
+        path = data_dir / "content.json"
+        previous = path.stat().st_mtime if path.exists() else 0
+        path.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+        if bump_mtime:
+            os.utime(path, (previous + 10, previous + 10))
+
+
+class TestLoadCatalog(CatalogDataDirMixin, unittest.TestCase):
+
+    def test_load_builds_derived_data(self):
+        """Test a loaded snapshot carries items, indexes and rendered bodies"""
+        snapshot = load_catalog(self.make_data_dir())
+
+        self.assertEqual(len(snapshot.banners), 3)
+        self.assertEqual(len(snapshot.content), 12)
+        self.assertEqual([item.id for item in snapshot.content_index.get("キッチン")], ["5", "10"])
+        self.assertEqual(len(json.loads(snapshot.content_body.body)), 12)
+
+    def test_missing_files_load_empty(self):
+        """Test a directory without catalog files yields an empty snapshot"""
+        data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, data_dir)
+
+        snapshot = load_catalog(data_dir)
+
+        self.assertEqual(snapshot.banners, ())
+        self.assertEqual(snapshot.content_body.body, b"[]")
+
+    def test_invalid_item_raises(self):
+        """Test items failing model validation are rejected"""
+        data_dir = self.make_data_dir()
+        self.write_content(data_dir, [{"id": "1", "title": "価格なし"}])
+
+        with self.assertRaises(ValidationError):
+            load_catalog(data_dir)
+
+
+class TestCatalogWatcher(CatalogDataDirMixin, unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.data_dir = self.make_data_dir()
+        self.published = []
+        self.watcher = CatalogWatcher(self.data_dir, self.published.append)
+        self.initial = await self.watcher.load()
+
+    async def test_unchanged_files_do_not_reload(self):
+        """Test nothing is published while the files stay the same"""
+        self.assertFalse(await self.watcher.check())
+        self.assertEqual(self.published, [])
+
+    async def test_changed_file_publishes_new_snapshot(self):
+        """Test a changed file is loaded and swapped in as a new snapshot"""
+        self.write_content(self.data_dir, [{
+            "id": "99", "title": "新商品", "price": 100, "rating": 5.0,
+            "imageUrl": "/new.jpg", "category": "新カテゴリ",
+        }])
+
+        self.assertTrue(await self.watcher.check())
+
+        snapshot = self.published[-1]
+        self.assertIsNot(snapshot, self.initial)
+        self.assertEqual([item.id for item in snapshot.content_index.get("新カテゴリ")], ["99"])
+        self.assertNotEqual(snapshot.content_body.etag, self.initial.content_body.etag)
+        # The old snapshot is untouched for requests still using it
+        self.assertEqual(len(self.initial.content), 12)
+
+    async def test_invalid_file_keeps_current_snapshot(self):
+        """Test a broken file is not published and a later fix is"""
+        path = self.data_dir / "content.json"
+        path.write_text("[{not json", encoding="utf-8")
+        os.utime(path, (path.stat().st_mtime + 10,) * 2)
+
+        self.assertFalse(await self.watcher.check())
+        self.assertEqual(self.published, [])
+
+        self.write_content(self.data_dir, [])
+        self.assertTrue(await self.watcher.check())
+        self.assertEqual(list(self.published[-1].content), [])
+
+
+class TestCatalogSnapshot(unittest.TestCase):
+
+    def test_empty_snapshot(self):
+        """Test the default snapshot serves empty catalog responses"""
+        snapshot = CatalogSnapshot()
+        self.assertEqual(snapshot.banners_body.body, b"[]")
+        self.assertEqual(snapshot.content_index.get("any"), ())
+
+
+if __name__ == '__main__':
+    unittest.main()
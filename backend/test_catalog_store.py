@@ -0,0 +1,156 @@
+import asyncio
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import main
+
+from catalog import CatalogSnapshot, load_catalog
+from catalog_store import (
+    MappedCatalogSnapshot,
+    load_mapped_catalog,
+    read_manifest,
+    write_catalog_snapshot,
+)
+from content_columns import ContentColumns
+from content_query import ContentFilters, page_content
+from search_index import SearchIndex
+
+
+class TestCatalogStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.data_dir = self.tmp_dir / "data"
+        shutil.copytree(Path(__file__).parent / "data", self.data_dir)
+        self.snapshot_path = self.tmp_dir / "catalog.snap"
+        self.source = load_catalog(self.data_dir)
+
+    def test_round_trip_matches_json_snapshot(self):
+        """Test the mapped snapshot serves the same bodies, ETags and items"""
+        write_catalog_snapshot(self.source, self.snapshot_path)
+        mapped = MappedCatalogSnapshot(self.snapshot_path)
+
+        self.assertEqual(bytes(mapped.content_body.body), self.source.content_body.body)
+        self.assertEqual(mapped.content_body.etag, self.source.content_body.etag)
+        self.assertEqual(bytes(mapped.banners_body.body), self.source.banners_body.body)
+        self.assertEqual(mapped.banners_body.etag, self.source.banners_body.etag)
+        self.assertEqual(mapped.banners, self.source.banners)
+        self.assertEqual(list(mapped.content), list(self.source.content))
+        self.assertEqual(mapped.last_modified, self.source.last_modified)
+
+    def test_items_decoded_lazily_by_index(self):
+        """Test single items, negative indexes and slices decode from the mapping"""
+        write_catalog_snapshot(self.source, self.snapshot_path)
+        mapped = MappedCatalogSnapshot(self.snapshot_path)
+
+        self.assertEqual(len(mapped.content), 12)
+        self.assertEqual(mapped.content[0], self.source.content[0])
+        self.assertEqual(mapped.content[-1].id, "12")
+        self.assertEqual([item.id for item in mapped.content[2:4]], ["3", "4"])
+        with self.assertRaises(IndexError):
+            mapped.content[12]
+
+    def test_category_index(self):
+        """Test category bodies and items match the in-memory index"""
+        write_catalog_snapshot(self.source, self.snapshot_path)
+        mapped = MappedCatalogSnapshot(self.snapshot_path)
+
+        for name in self.source.content_index.categories:
+            expected = self.source.content_index.rendered(name)
+            self.assertEqual(bytes(mapped.content_index.rendered(name.upper()).body), expected.body)
+            self.assertEqual(mapped.content_index.rendered(name).etag, expected.etag)
+            self.assertEqual(mapped.content_index.get(name), self.source.content_index.get(name))
+        self.assertEqual(mapped.content_index.categories, self.source.content_index.categories)
+        self.assertEqual(mapped.content_index.get("unknown"), ())
+        self.assertEqual(mapped.content_index.rendered("unknown").body, b"[]")
+
+    def test_empty_catalog(self):
+        """Test an empty catalog round-trips"""
+        write_catalog_snapshot(CatalogSnapshot(), self.snapshot_path)
+        mapped = MappedCatalogSnapshot(self.snapshot_path)
+
+        self.assertEqual(len(mapped.content), 0)
+        self.assertEqual(bytes(mapped.content_body.body), b"[]")
+
+    def test_not_a_snapshot(self):
+        """Test opening a file that is not a snapshot fails clearly"""
+        self.snapshot_path.write_bytes(b"not a snapshot file")
+        self.assertIsNone(read_manifest(self.snapshot_path))
+        with self.assertRaises(ValueError):
+            MappedCatalogSnapshot(self.snapshot_path)
+
+    def test_load_builds_once_and_rebuilds_on_change(self):
+        """Test the file is reused while the JSON is unchanged and rebuilt after a change"""
+        first = load_mapped_catalog(self.data_dir, self.snapshot_path)
+        built_at = self.snapshot_path.stat().st_mtime_ns
+
+        second = load_mapped_catalog(self.data_dir, self.snapshot_path)
+        self.assertEqual(self.snapshot_path.stat().st_mtime_ns, built_at)
+        self.assertEqual(second.content_body.etag, first.content_body.etag)
+
+        content_path = self.data_dir / "content.json"
+        items = json.loads(content_path.read_text(encoding="utf-8"))[:2]
+        content_path.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+
+        third = load_mapped_catalog(self.data_dir, self.snapshot_path)
+        self.assertEqual(len(third.content), 2)
+        # A snapshot mapped before the rebuild keeps reading the old file
+        self.assertEqual(len(first.content), 12)
+        self.assertEqual(first.content[11].id, "12")
+
+    def test_mapped_snapshot_reads_indexes_from_file(self):
+        """Test workers map the columns, sort orders and search index instead of building them"""
+        self.source.build_indexes()
+        with patch.object(main, "CATALOG_SNAPSHOT_PATH", str(self.snapshot_path)):
+            main.load_catalog_snapshot(self.data_dir)
+            with patch.object(ContentColumns, "__init__", side_effect=AssertionError("built")), \
+                    patch.object(SearchIndex, "__init__", side_effect=AssertionError("built")):
+                mapped = main.load_catalog_snapshot(self.data_dir)
+                self.assertIsInstance(mapped, MappedCatalogSnapshot)
+                self.assertTrue(mapped.indexes_built)
+                asyncio.run(main.ensure_indexes(mapped))
+
+                columns, source = mapped.columns, self.source.columns
+                self.assertIsInstance(columns.price, memoryview)
+                self.assertEqual(list(columns), list(source))
+                self.assertEqual(columns.get_by_id("3"), self.source.content[2])
+                self.assertIsNone(columns.get_by_id("unknown"))
+                for sort in source.orders:
+                    self.assertEqual(list(columns.orders[sort]), list(source.orders[sort]))
+                self.assertEqual(columns.range_mask("price", 1000, 20000), source.range_mask("price", 1000, 20000))
+                self.assertEqual(columns.range_mask("rating", 4.5), source.range_mask("rating", 4.5))
+                self.assertEqual(columns.category_masks, source.category_masks)
+                filters = ContentFilters(min_rating=4.0, is_sale=False)
+                self.assertEqual(
+                    page_content(columns, limit=3, sort="-price", filters=filters).body,
+                    page_content(source, limit=3, sort="-price", filters=filters).body)
+                for query in ("水筒", "オーディオ", "カメラ", "a"):
+                    self.assertEqual(mapped.search_index.search(query), self.source.search_index.search(query))
+                self.assertEqual(mapped.search_index.candidates("水筒", 5), self.source.search_index.candidates("水筒", 5))
+
+    def test_other_byte_order_rebuilt(self):
+        """Test a snapshot written with a different byte order is rejected and rebuilt"""
+        load_mapped_catalog(self.data_dir, self.snapshot_path)
+        other = "big" if sys.byteorder == "little" else "little"
+        with patch("catalog_store.sys.byteorder", other):
+            with self.assertRaises(ValueError):
+                MappedCatalogSnapshot(self.snapshot_path)
+            mapped = load_mapped_catalog(self.data_dir, self.snapshot_path)
+        self.assertEqual(read_manifest(self.snapshot_path)["byteorder"], other)
+        self.assertEqual(len(mapped.content), 12)
+
+    def test_json_snapshot_indexed_at_load(self):
+        """Test a snapshot loaded from JSON is served with its indexes already built"""
+        with patch.object(main, "CATALOG_SNAPSHOT_PATH", ""):
+            snapshot = main.load_catalog_snapshot(self.data_dir)
+        self.assertTrue(snapshot.indexes_built)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+
+from catalog import CatalogSnapshot, render_content
+from content_columns import (
+    HAS_ORIGINAL_PRICE,
+    IS_NEW,
+    IS_RECOMMENDED,
+    IS_SALE,
+    ContentColumns,
+    indexes_from_mask,
+    mask_from_indexes,
+)
+from test_helpers import make_item
+
+
+class TestBitsets(unittest.TestCase):
+
+    def test_round_trip(self):
+        """Test item indexes survive a round trip through a bitset"""
+        indexes = [0, 3, 64, 65, 199]
+        mask = mask_from_indexes(indexes, 200)
+        self.assertEqual(mask, sum(1 << i for i in indexes))
+        self.assertEqual(indexes_from_mask(mask), indexes)
+
+    def test_empty(self):
+        """Test empty bitsets"""
+        self.assertEqual(mask_from_indexes([], 0), 0)
+        self.assertEqual(mask_from_indexes([], 10), 0)
+        self.assertEqual(indexes_from_mask(0), [])
+
+
+class TestContentColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            make_item("1", "オーディオ", price=12800, originalPrice=15800, isSale=True),
+            make_item("2", "Kitchen", rating=4.5, isNew=True),
+            make_item("3", "オーディオ", isRecommended=True, isNew=True),
+            make_item("4", "kitchen", price=500),
+        ]
+        self.columns = ContentColumns(self.items)
+
+    def test_materialized_items_equal_source(self):
+        """Test items read back from the columns equal the validated items"""
+        self.assertEqual(len(self.columns), 4)
+        self.assertEqual(list(self.columns), self.items)
+        self.assertEqual(self.columns[-1], self.items[-1])
+        self.assertEqual(self.columns[1:3], self.items[1:3])
+        with self.assertRaises(IndexError):
+            self.columns[4]
+
+    def test_serialization_matches_source(self):
+        """Test responses rendered from the columns are byte-identical"""
+        self.assertEqual(render_content(self.columns).body, render_content(self.items).body)
+
+    def test_numeric_columns_are_typed_arrays(self):
+        """Test numeric fields are stored in typed arrays"""
+        self.assertEqual(self.columns.price.typecode, "q")
+        self.assertEqual(list(self.columns.price), [12800, 1000, 1000, 500])
+        self.assertEqual(list(self.columns.rating), [4.0, 4.5, 4.0, 4.0])
+        self.assertEqual(indexes_from_mask(self.columns.has_original_price), [0])
+
+    def test_flag_bitsets_combine(self):
+        """Test flag bitsets combine into filters with integer operations"""
+        self.assertEqual(indexes_from_mask(self.columns.is_new), [1, 2])
+        self.assertEqual(indexes_from_mask(self.columns.is_new & self.columns.is_recommended), [2])
+        self.assertEqual(indexes_from_mask(self.columns.all & ~self.columns.is_new), [0, 3])
+
+    def test_items_read_flags_from_flag_column(self):
+        """Test reading an item uses the per-item flags, not the catalog-wide bitsets"""
+        self.assertEqual(list(self.columns.flags), [
+            HAS_ORIGINAL_PRICE | IS_SALE, IS_NEW, IS_NEW | IS_RECOMMENDED, 0])
+        for name in ("has_original_price", "is_new", "is_sale", "is_recommended"):
+            setattr(self.columns, name, None)
+        self.assertEqual(list(self.columns), self.items)
+
+    def test_rows_match_model_dump(self):
+        """Test rows read straight from the columns equal the items' model_dump()"""
+        self.assertEqual([self.columns.row(i) for i in range(4)], [item.model_dump() for item in self.items])
+
+    def test_range_mask_between_checkpoints(self):
+        """Test range bitsets built from the nearest checkpoints match a full scan"""
+        items = [make_item(f"{i:03d}", price=(i * 37) % 500, rating=(i % 50) / 10) for i in range(500)]
+        with patch("content_columns.RANGE_CHECKPOINTS", (16, 16)):
+            columns = ContentColumns(items)
+        self.assertEqual(columns.checkpoint_step, 32)
+        for low, high in [(None, None), (0, 499), (3, 7), (10, 10), (17, 260), (100, None), (None, 333), (400, 20)]:
+            with self.subTest(low=low, high=high):
+                expected = [
+                    i for i, item in enumerate(items)
+                    if (low is None or item.price >= low) and (high is None or item.price <= high)]
+                self.assertEqual(indexes_from_mask(columns.range_mask("price", low, high)), expected)
+        for low in (0.0, 0.5, 2.3, 4.9, 5.0):
+            with self.subTest(min_rating=low):
+                expected = [i for i, item in enumerate(items) if item.rating >= low]
+                self.assertEqual(indexes_from_mask(columns.range_mask("rating", low)), expected)
+
+    def test_categories_are_interned(self):
+        """Test categories are stored as codes and matched case-insensitively"""
+        self.assertEqual(self.columns.category_names, ["オーディオ", "Kitchen", "kitchen"])
+        self.assertEqual(list(self.columns.category_code), [0, 1, 0, 2])
+        self.assertEqual(indexes_from_mask(self.columns.category_mask("KITCHEN")), [1, 3])
+        self.assertEqual(self.columns.category_mask("unknown"), 0)
+
+    def test_snapshot_stores_columns(self):
+        """Test snapshots keep content in columns and index categories by position"""
+        snapshot = CatalogSnapshot(content=self.items)
+        self.assertIsInstance(snapshot.content, ContentColumns)
+        self.assertIs(snapshot.columns, snapshot.content)
+        self.assertEqual(list(snapshot.content_index.by_category["kitchen"]), [1, 3])
+        self.assertEqual(snapshot.content_body.body, render_content(self.items).body)
+
+
+if __name__ == '__main__':
+    unittest.main()
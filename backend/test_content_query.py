@@ -0,0 +1,174 @@
+import base64
+import json
+import unittest
+
+from content_columns import ContentColumns
+from content_query import ContentFilters, ContentQueryError, decode_cursor, encode_cursor, page_content
+from test_helpers import make_item
+
+
+def read_page(columns, **params):
+    return json.loads(page_content(columns, **params).body)
+
+
+class TestPageContent(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            make_item("a", price=3000, rating=4.5, originalPrice=4000),
+            make_item("b", price=1000, rating=4.0),
+            make_item("c", price=2000, rating=4.8, originalPrice=4000),
+            make_item("d", price=1000, rating=3.5),
+            make_item("e", price=5000, rating=4.0),
+        ]
+        self.columns = ContentColumns(self.items)
+
+    def collect(self, **params):
+        """Follow nextCursor to the end and return the ids in page order"""
+        ids, cursor = [], None
+        while True:
+            page = read_page(self.columns, cursor=cursor, **params)
+            ids.extend(item["id"] for item in page["items"])
+            cursor = page["nextCursor"]
+            if cursor is None:
+                return ids
+
+    def test_catalog_order_pages(self):
+        """Test keyset pages in catalog order cover every item exactly once"""
+        first = read_page(self.columns, limit=2)
+        self.assertEqual([item["id"] for item in first["items"]], ["a", "b"])
+        self.assertEqual(self.collect(limit=2), ["a", "b", "c", "d", "e"])
+
+    def test_sorted_pages_break_ties_by_id(self):
+        """Test every sort order pages consistently with ties broken by id"""
+        self.assertEqual(self.collect(limit=2, sort="price"), ["b", "d", "c", "a", "e"])
+        self.assertEqual(self.collect(limit=2, sort="-price"), ["e", "a", "c", "b", "d"])
+        self.assertEqual(self.collect(limit=3, sort="-rating"), ["c", "a", "b", "e", "d"])
+        self.assertEqual(self.collect(limit=1, sort="-discount"), ["c", "a", "b", "d", "e"])
+
+    def test_last_page_has_no_cursor(self):
+        """Test a page that reaches the end returns a null nextCursor"""
+        self.assertIsNone(read_page(self.columns, limit=5)["nextCursor"])
+        self.assertEqual(len(read_page(self.columns)["items"]), 5)
+
+    def test_cursor_survives_reload(self):
+        """Test a cursor resumes after its item even when the catalog changed"""
+        cursor = read_page(self.columns, limit=2, sort="price")["nextCursor"]
+        reloaded = ContentColumns([make_item("bb", price=1500)] + self.items[2:])
+        page = read_page(reloaded, limit=2, sort="price", cursor=cursor)
+        self.assertEqual([item["id"] for item in page["items"]], ["bb", "c"])
+
+    def test_fields_projection(self):
+        """Test fields= keeps only the requested fields, in the requested order"""
+        page = read_page(self.columns, limit=1, fields="price, id")
+        self.assertEqual(page["items"], [{"price": 3000, "id": "a"}])
+
+    def test_invalid_parameters(self):
+        """Test unknown sorts, fields and malformed cursors are rejected"""
+        with self.assertRaises(ContentQueryError):
+            page_content(self.columns, sort="title")
+        with self.assertRaises(ContentQueryError):
+            page_content(self.columns, fields="id,secret")
+        with self.assertRaises(ContentQueryError):
+            page_content(self.columns, cursor="not-a-cursor")
+        with self.assertRaises(ContentQueryError):
+            page_content(self.columns, sort="rating", cursor=encode_cursor("price", (1000, "b")))
+
+    def test_cursor_key_types_validated(self):
+        """Test cursors whose key does not compare with the sort order are rejected"""
+        for sort, key in [
+            ("price", ("abc", 5)),
+            ("price", (None, None)),
+            ("price", ({"a": 1}, 2)),
+            ("price", (1000, 2)),
+            ("-rating", (True, "a")),
+            ("", (1.5, "a")),
+            ("", ("0", "a")),
+        ]:
+            with self.subTest(sort=sort, key=key), self.assertRaises(ContentQueryError):
+                page_content(self.columns, sort=sort, cursor=encode_cursor(sort, key))
+        filters = ContentFilters(min_rating=4.0)
+        with self.assertRaises(ContentQueryError):
+            page_content(self.columns, sort="price", filters=filters, cursor=encode_cursor("price", ("abc", 5)))
+        with self.assertRaises(ContentQueryError):
+            decode_cursor(base64.urlsafe_b64encode(b'["price",NaN,"a"]').decode("ascii"), "price")
+        self.assertEqual(decode_cursor(encode_cursor("rating", (4.5, "a")), "rating"), (4.5, "a"))
+        self.assertEqual(decode_cursor(encode_cursor("", (3, "a")), ""), (3, "a"))
+
+    def test_cursor_round_trip(self):
+        """Test cursors encode the sort and key of the last item"""
+        self.assertEqual(decode_cursor(encode_cursor("-price", (-1000, "水筒")), "-price"), (-1000, "水筒"))
+
+
+
+class TestContentFilters(unittest.TestCase):
+
+    def setUp(self):
+        categories = ["オーディオ", "キッチン", "ホーム"]
+        self.items = [
+            make_item(
+                f"{i:03d}", price=(i * 37) % 1000, rating=(i % 50) / 10,
+                category=categories[i % 3], isNew=i % 4 == 0, isSale=i % 5 == 0, isRecommended=i % 7 == 0)
+            for i in range(300)
+        ]
+        self.columns = ContentColumns(self.items)
+
+    def expected(self, predicate, key=None):
+        matches = [item for item in self.items if predicate(item)]
+        return [item.id for item in sorted(matches, key=key)] if key else [item.id for item in matches]
+
+    def collect(self, filters, **params):
+        ids, cursor = [], None
+        while True:
+            page = read_page(self.columns, cursor=cursor, filters=filters, **params)
+            ids.extend(item["id"] for item in page["items"])
+            cursor = page["nextCursor"]
+            if cursor is None:
+                return ids, page
+
+    def test_combined_filters(self):
+        """Test price, rating, flag and category filters combine"""
+        filters = ContentFilters(
+            min_price=200, max_price=800, min_rating=2.5, is_sale=False, categories=["キッチン", "ホーム"])
+        ids, page = self.collect(filters, limit=7)
+        self.assertEqual(ids, self.expected(
+            lambda item: 200 <= item.price <= 800 and item.rating >= 2.5 and not item.isSale
+            and item.category in ("キッチン", "ホーム")))
+        self.assertEqual(page["total"], len(ids))
+
+    def test_filtered_pages_in_every_order(self):
+        """Test filtered pages follow the sort order, dense and sparse, both directions"""
+        for filters, predicate in (
+            (ContentFilters(min_price=100), lambda item: item.price >= 100),
+            (ContentFilters(max_price=30, is_new=True), lambda item: item.price <= 30 and item.isNew),
+            (ContentFilters(is_recommended=True), lambda item: item.isRecommended),
+        ):
+            for sort, key in (
+                ("price", lambda item: (item.price, item.id)),
+                ("-price", lambda item: (-item.price, item.id)),
+                ("-rating", lambda item: (-item.rating, item.id)),
+            ):
+                ids, _ = self.collect(filters, limit=9, sort=sort)
+                self.assertEqual(ids, self.expected(predicate, key), (sort, filters.__dict__))
+
+    def test_facet_counts(self):
+        """Test flag facets count the results and category facets ignore the category filter"""
+        page = read_page(self.columns, limit=1, filters=ContentFilters(min_rating=4.0, categories=["ホーム"]))
+        rated = [item for item in self.items if item.rating >= 4.0]
+        self.assertEqual(page["facets"]["category"], {
+            category: sum(item.category == category for item in rated)
+            for category in ("オーディオ", "キッチン", "ホーム")
+        })
+        home = [item for item in rated if item.category == "ホーム"]
+        self.assertEqual(page["total"], len(home))
+        self.assertEqual(page["facets"]["isNew"], sum(bool(item.isNew) for item in home))
+
+    def test_empty_ranges(self):
+        """Test inverted or out-of-range filters match nothing"""
+        self.assertEqual(read_page(self.columns, filters=ContentFilters(min_price=900, max_price=100))["total"], 0)
+        self.assertEqual(read_page(self.columns, filters=ContentFilters(min_rating=9))["items"], [])
+        self.assertEqual(read_page(self.columns, filters=ContentFilters(categories=["unknown"]))["total"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import gc
+import random
+import threading
+import unittest
+from unittest.mock import patch
+
+import azure_agent
+from azure_agent import get_recommendation
+from fake_agent import DEFAULT_ANSWER_ID, FakeProjectClient, parse_latency
+
+
+CANDIDATES = [
+    {"id": "10", "title": "エコフレンドリー水筒", "price": 2980, "rating": 4.7,
+     "category": "キッチン", "imageUrl": "/images/10.jpg", "isRecommended": True},
+    {"id": "11", "title": "真空断熱水筒", "price": 3480, "rating": 4.5,
+     "category": "キッチン", "imageUrl": "/images/11.jpg", "isRecommended": False},
+]
+
+
+class TestParseLatency(unittest.TestCase):
+
+    def test_latency_specs(self):
+        """Test fixed, uniform and log-normal latency specs in milliseconds"""
+        rng = random.Random(0)
+        self.assertEqual(parse_latency("250")(rng), 0.25)
+        self.assertTrue(all(0.2 <= parse_latency("uniform:200:400")(rng) <= 0.4 for _ in range(100)))
+        samples = sorted(parse_latency("lognormal:800:0.5")(rng) for _ in range(2001))
+        self.assertAlmostEqual(samples[1000], 0.8, delta=0.08)
+        self.assertGreater(samples[1900], 1.5)
+
+    def test_invalid_spec(self):
+        """Test unknown or malformed specs are rejected"""
+        for spec in ("fast", "uniform:200", "gamma:1:2", "lognormal:a:b"):
+            with self.assertRaises(ValueError):
+                parse_latency(spec)
+
+
+class TestFakeProjectClient(unittest.TestCase):
+    """Run the real agent code path against the fake client"""
+
+    def setUp(self):
+        azure_agent.invalidate_agent()
+        azure_agent.thread_pool.reset()
+        self.addCleanup(azure_agent.invalidate_agent)
+        self.addCleanup(azure_agent.thread_pool.reset)
+        for hook in ('azure_agent.candidate_provider', 'azure_agent.response_recorder'):
+            patcher = patch(hook, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use(self, client):
+        patcher = patch('azure_agent.get_project_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_answers_first_candidate(self):
+        """Test the reply names the best candidate offered in the prompt"""
+        client = self.use(FakeProjectClient(latency="0"))
+        with patch('azure_agent.candidate_provider', lambda query, k: CANDIDATES):
+            result = get_recommendation("水筒")
+        self.assertEqual(result["id"], "10")
+        self.assertEqual(result["imageUrl"], "/images/10.jpg")
+        self.assertEqual(client.stats()["runs"], 1)
+
+    def test_answers_without_candidates(self):
+        """Test the legacy content.json prompt still gets a parsable answer"""
+        self.use(FakeProjectClient(latency="0"))
+        self.assertEqual(get_recommendation()["id"], DEFAULT_ANSWER_ID)
+
+    @patch('azure_agent.AZURE_AGENT_ID_ONLY', True)
+    def test_id_only_answer(self):
+        """Test id-only prompts get a ranked ids list"""
+        self.use(FakeProjectClient(latency="0"))
+        with patch('azure_agent.candidate_provider', lambda query, k: CANDIDATES):
+            result = get_recommendation("水筒")
+        self.assertEqual(result, {"id": "10", "ids": ["10", "11"]})
+
+    @patch('azure_agent.AZURE_AGENT_STREAMING', True)
+    def test_streamed_answer(self):
+        """Test streamed runs deliver the reply in deltas and end when the stream is left"""
+        client = self.use(FakeProjectClient(latency="40", stream_chunks=4))
+        with patch('azure_agent.candidate_provider', lambda query, k: CANDIDATES):
+            result = get_recommendation("水筒")
+        gc.collect()
+        self.assertEqual(result["id"], "10")
+        self.assertEqual(client._active_runs, 0)
+
+    def test_failed_runs_and_dropped_connections(self):
+        """Test failure and error rates surface as the agent's fallback answers"""
+        failing = self.use(FakeProjectClient(latency="0", failure_rate=1.0))
+        self.assertEqual(get_recommendation("水筒")["id"], "fallback-006")
+        self.assertEqual(failing.stats()["failures"], 1)
+
+        erroring = FakeProjectClient(latency="0", error_rate=1.0)
+        with patch('azure_agent.get_project_client', return_value=erroring):
+            self.assertEqual(get_recommendation("水筒")["id"], "fallback-005")
+        self.assertGreaterEqual(erroring.stats()["errors"], 1)
+
+    def test_concurrent_runs_are_counted(self):
+        """Test overlapping runs are visible in max_concurrent_runs"""
+        client = self.use(FakeProjectClient(latency="100"))
+        workers = [threading.Thread(target=get_recommendation, args=(f"水筒 {i}",)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(client.stats()["runs"], 4)
+        self.assertGreaterEqual(client.stats()["max_concurrent_runs"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,15 @@
+from models import ContentItem
+
+
+def make_item(item_id: str, category: str = "オーディオ", **fields) -> ContentItem:
+    """Content item for tests; ``fields`` override the defaults (e.g. ``price=500``)"""
+    values = {
+        "id": item_id,
+        "title": f"商品 {item_id}",
+        "price": 1000,
+        "rating": 4.0,
+        "imageUrl": f"/images/{item_id}.jpg",
+        "category": category,
+    }
+    values.update(fields)
+    return ContentItem(**values)
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from hot_queries import HotQueryRefresher, HotQueryTracker
+from recommendation_cache import RecommendationCache
+
+
+class TestHotQueryTracker(unittest.TestCase):
+
+    def test_top_orders_by_frequency(self):
+        """Test the busiest queries come first and normalize to one key"""
+        tracker = HotQueryTracker()
+        for _ in range(3):
+            tracker.record("水筒")
+        tracker.record(" 水筒 ")
+        tracker.record("傘")
+        tracker.record("傘")
+        tracker.record("帽子")
+
+        self.assertEqual(tracker.top(2), ["水筒", "傘"])
+        self.assertEqual(tracker.top(10, min_hits=2), ["水筒", "傘"])
+
+    def test_decay_forgets_cold_queries(self):
+        """Test counts halve on decay and rarely seen queries drop out"""
+        tracker = HotQueryTracker()
+        tracker.record("水筒")
+        for _ in range(4):
+            tracker.record("傘")
+
+        tracker.decay()
+        tracker.decay()
+
+        self.assertEqual(tracker.top(10), ["傘"])
+
+    def test_max_tracked(self):
+        """Test only the busiest max_tracked queries survive decay"""
+        tracker = HotQueryTracker(max_tracked=2)
+        for count, query in enumerate(["a", "b", "c"], start=2):
+            for _ in range(count * 2):
+                tracker.record(query)
+
+        tracker.decay()
+
+        self.assertEqual(tracker.top(10), ["c", "b"])
+
+
+class TestHotQueryRefresher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_refreshes_static_and_learned_queries(self):
+        """Test configured and learned hot queries are loaded into the cache"""
+        loader = AsyncMock(side_effect=lambda query: {"id": str(query)})
+        cache = RecommendationCache(loader)
+        tracker = HotQueryTracker()
+        tracker.record("水筒")
+        tracker.record("水筒")
+        tracker.record("一度だけ")
+        refresher = HotQueryRefresher(cache, tracker, static_queries=[None, "キャンペーン"])
+
+        refreshed = await refresher.refresh_once()
+
+        self.assertEqual(refreshed, 3)
+        self.assertEqual(await cache.peek(None), {"id": "None"})
+        self.assertEqual(await cache.peek("キャンペーン"), {"id": "キャンペーン"})
+        self.assertEqual(await cache.peek("水筒"), {"id": "水筒"})
+        self.assertIsNone(await cache.peek("一度だけ"))
+
+    async def test_fresh_entries_are_not_refreshed(self):
+        """Test queries that stay fresh past the next cycle are skipped"""
+        loader = AsyncMock(return_value={"id": "1"})
+        cache = RecommendationCache(loader, ttl_seconds=300)
+        refresher = HotQueryRefresher(cache, HotQueryTracker(), interval_seconds=60)
+
+        await refresher.refresh_once()
+        await refresher.refresh_once()
+
+        loader.assert_awaited_once_with(None)
+
+    async def test_concurrency_limit(self):
+        """Test no more than `concurrency` refreshes run at once"""
+        running = 0
+        peak = 0
+
+        async def loader(query):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"id": query}
+
+        cache = RecommendationCache(loader)
+        refresher = HotQueryRefresher(
+            cache, HotQueryTracker(), static_queries=[str(i) for i in range(6)], concurrency=2)
+
+        await refresher.refresh_once()
+
+        self.assertEqual(peak, 2)
+
+    async def test_failed_refresh_does_not_stop_others(self):
+        """Test one failing query does not prevent the rest from refreshing"""
+        async def loader(query):
+            if query == "bad":
+                raise RuntimeError("agent down")
+            return {"id": query}
+
+        cache = RecommendationCache(loader)
+        refresher = HotQueryRefresher(cache, HotQueryTracker(), static_queries=["bad", "good"])
+
+        await refresher.refresh_once()
+
+        self.assertEqual(await cache.peek("good"), {"id": "good"})
+
+    async def test_start_and_stop(self):
+        """Test the background loop refreshes on start and stops cleanly"""
+        loader = AsyncMock(return_value={"id": "1"})
+        cache = RecommendationCache(loader)
+        refresher = HotQueryRefresher(cache, HotQueryTracker(), interval_seconds=0.01, jitter=0)
+
+        refresher.start()
+        await asyncio.sleep(0.05)
+        await refresher.stop()
+
+        self.assertEqual(await cache.peek(None), {"id": "1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
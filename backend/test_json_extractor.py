@@ -0,0 +1,94 @@
+import json
+import unittest
+
+from json_extractor import JsonObjectExtractor, extract_json_objects
+
+
+class TestJsonObjectExtractor(unittest.TestCase):
+
+    def test_object_surrounded_by_prose(self):
+        """Test an object embedded in explanatory text is extracted"""
+        extractor = JsonObjectExtractor()
+        result = extractor.feed('おすすめはこちら {"id": "1", "price": 2980} 以上です。')
+        self.assertEqual(result, {"id": "1", "price": 2980})
+
+    def test_object_split_across_chunks(self):
+        """Test nothing is returned until the closing brace arrives"""
+        extractor = JsonObjectExtractor()
+        self.assertIsNone(extractor.feed('回答: {"id": "1", "ti'))
+        self.assertIsNone(extractor.feed('tle": "水筒", "tags": {"a": 1}'))
+        self.assertEqual(extractor.feed('}と続きの説明'), {"id": "1", "title": "水筒", "tags": {"a": 1}})
+
+    def test_braces_and_quotes_inside_strings(self):
+        """Test braces and escaped quotes inside string values are ignored"""
+        extractor = JsonObjectExtractor()
+        result = extractor.feed('{"title": "ボトル {限定} \\"夏\\"", "id": "2"}')
+        self.assertEqual(result, {"title": "ボトル {限定} \"夏\"", "id": "2"})
+
+    def test_invalid_candidate_is_skipped(self):
+        """Test an invalid object does not stop the scan for the next one"""
+        extractor = JsonObjectExtractor()
+        result = extractor.feed('{"invalid": json} それから {"id": "3"}')
+        self.assertEqual(result, {"id": "3"})
+
+    def test_first_object_wins(self):
+        """Test later objects do not replace the first valid one"""
+        extractor = JsonObjectExtractor()
+        extractor.feed('{"id": "1"}')
+        self.assertEqual(extractor.feed('{"id": "2"}'), {"id": "1"})
+
+    def test_no_object(self):
+        """Test text without any object returns None"""
+        self.assertIsNone(JsonObjectExtractor().feed("JSON はありません"))
+
+    def test_character_by_character_stream(self):
+        """Test feeding one character at a time, including split escapes"""
+        value = {"title": 'バックスラッシュ \\ と "{引用}"', "id": "4"}
+        text = f"前置き {json.dumps(value, ensure_ascii=False)} 後書き"
+        extractor = JsonObjectExtractor()
+        results = [extractor.feed(char) for char in text]
+        self.assertIsNone(results[text.rindex("}") - 1])
+        self.assertEqual(results[text.rindex("}")], value)
+
+    def test_validate_rejects_and_continues(self):
+        """Test objects failing validation are counted and skipped"""
+        def require_id(value):
+            if "id" not in value:
+                raise ValueError("no id")
+
+        extractor = JsonObjectExtractor(validate=require_id)
+        result = extractor.feed('{"note": "説明"} {"id": "5"} {"not": json}')
+        self.assertEqual(result, {"id": "5"})
+        self.assertEqual(extractor.rejected, 1)
+
+    def test_collect_all_objects(self):
+        """Test every valid object is kept in order when collecting all"""
+        text = '一つ目 {"id": "1"} 二つ目 {"id": "2", "nested": {"a": [1, 2]}} 閉じ括弧だけ } と [1]'
+        self.assertEqual(extract_json_objects(text), [{"id": "1"}, {"id": "2", "nested": {"a": [1, 2]}}])
+
+    def test_stray_closing_brace_outside_object(self):
+        """Test closing braces in prose before an object are ignored"""
+        self.assertEqual(JsonObjectExtractor().feed('} :-} {"id": "6"}'), {"id": "6"})
+
+    def test_unmatched_brace_in_prose(self):
+        """Test an object after an unclosed brace in prose is found when the text ends"""
+        extractor = JsonObjectExtractor()
+        self.assertIsNone(extractor.feed('おすすめ :-{ です。 {"id":"1","title":"x"}'))
+        self.assertEqual(extractor.finish(), {"id": "1", "title": "x"})
+        self.assertEqual(extract_json_objects('おすすめ :-{ です。 {"id":"1","title":"x"}'), [{"id": "1", "title": "x"}])
+
+    def test_rejected_span_rescanned_from_next_brace(self):
+        """Test an object nested in a span that is not JSON is found"""
+        extractor = JsonObjectExtractor()
+        self.assertEqual(extractor.feed('Note {see {"id":"2"}} end'), {"id": "2"})
+        self.assertEqual(extractor.rejected, 1)
+
+    def test_open_span_abandoned_past_max_span(self):
+        """Test a span left open longer than max_span no longer hides later objects"""
+        extractor = JsonObjectExtractor(max_span=32)
+        self.assertIsNone(extractor.feed("顔文字 :-{ " + "長い説明" * 20))
+        self.assertEqual(extractor.feed(' {"id": "7"}'), {"id": "7"})
+
+
+if __name__ == '__main__':
+    unittest.main()
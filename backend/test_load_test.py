@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+
+from load_test import LoopLagMonitor, compare, drive, percentile
+
+
+class TestLoadReport(unittest.TestCase):
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_compare_gates_regressions(self):
+        """Test only changes past the tolerance count as regressions"""
+        baseline = {
+            "throughput_rps": 50.0,
+            "error_rate": 0.0,
+            "latency_ms": {"p50": 10.0, "p99": 400.0, "max": 900.0},
+            "loop_lag_ms": {"p99": 3.0},
+        }
+        within = {
+            "throughput_rps": 45.0,
+            "error_rate": 0.01,
+            "latency_ms": {"p50": 13.0, "p99": 470.0, "max": 5000.0},
+            "loop_lag_ms": {"p99": 5.0},
+        }
+        self.assertEqual(compare(within, baseline, tolerance=0.2), [])
+
+        worse = {
+            "throughput_rps": 30.0,
+            "error_rate": 0.1,
+            "latency_ms": {"p50": 10.0, "p99": 900.0},
+            "loop_lag_ms": {"p99": 30.0},
+        }
+        regressions = compare(worse, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 4)
+        self.assertTrue(regressions[0].startswith("latency_ms p99"))
+
+
+class TestDrive(unittest.IsolatedAsyncioTestCase):
+
+    async def test_open_loop_load(self):
+        """Test requests are sent at the offered rate and their outcomes counted"""
+        async def send(query):
+            await asyncio.sleep(0.05)
+            return (200, "cached") if query == "a" else (503, None)
+
+        report = await drive(send, rps=100, duration=0.3, queries=["a", "b"], seed=1)
+
+        self.assertEqual(report["requests"], 30)
+        self.assertEqual(sum(report["statuses"].values()), 30)
+        self.assertEqual(report["sources"]["cached"], report["statuses"]["200"])
+        self.assertAlmostEqual(report["error_rate"], report["statuses"]["503"] / 30, places=4)
+        self.assertGreaterEqual(report["latency_ms"]["p50"], 50)
+
+    async def test_loop_lag_sees_blocking_work(self):
+        """Test blocking the event loop shows up as lag"""
+        monitor = LoopLagMonitor(interval=0.005)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.05)
+        await asyncio.sleep(0.02)
+        lags = await monitor.stop()
+        self.assertGreaterEqual(max(lags), 0.04)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from metrics import Counter, Histogram, MetricsDirectory, Registry, StageTimer
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        """Test counters add up per label combination and escape label values"""
+        counter = Counter("fallbacks_total", "Fallbacks", ("id",))
+        counter.inc("fallback-001")
+        counter.inc("fallback-001", amount=2)
+        counter.inc('a"b\\c')
+        self.assertEqual(counter.value("fallback-001"), 3)
+        self.assertEqual(counter.samples(), [
+            'fallbacks_total{id="a\\"b\\\\c"} 1',
+            'fallbacks_total{id="fallback-001"} 3',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test bucket counts include every smaller bucket, plus sum and count"""
+        histogram = Histogram("stage_seconds", "Stages", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "run")
+        self.assertEqual(histogram.labels("run").count, 4)
+        self.assertEqual(histogram.samples(), [
+            'stage_seconds_bucket{stage="run",le="0.1"} 2',
+            'stage_seconds_bucket{stage="run",le="1.0"} 3',
+            'stage_seconds_bucket{stage="run",le="+Inf"} 4',
+            'stage_seconds_sum{stage="run"} 3.65',
+            'stage_seconds_count{stage="run"} 4',
+        ])
+
+    def test_registry_render(self):
+        """Test rendering with HELP/TYPE lines and values collected on scrape"""
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests")
+        self.assertIs(registry.counter("requests_total", "Requests"), counter)
+        counter.inc()
+        hits = {"hit": 1, "miss": 2}
+        registry.collect("cache_total", "Cache lookups", "counter", lambda: hits, labelname="result")
+        hits["hit"] += 1
+        self.assertEqual(registry.render(), "\n".join([
+            "# HELP requests_total Requests",
+            "# TYPE requests_total counter",
+            "requests_total 1",
+            "# HELP cache_total Cache lookups",
+            "# TYPE cache_total counter",
+            'cache_total{result="hit"} 2',
+            'cache_total{result="miss"} 2',
+        ]) + "\n")
+
+    def test_stage_timer(self):
+        """Test each lap is observed as its own stage"""
+        histogram = Histogram("stage_seconds", "Stages", ("stage",))
+        stages = StageTimer(histogram)
+        stages.lap("get_agent")
+        stages.lap("run")
+        stages.lap("run")
+        self.assertEqual(histogram.labels("get_agent").count, 1)
+        self.assertEqual(histogram.labels("run").count, 2)
+
+
+class TestMetricsDirectory(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name)
+
+    def worker_registry(self, requests: int, in_flight: int) -> Registry:
+        registry = Registry()
+        registry.counter("requests_total", "Requests").inc(amount=requests)
+        histogram = registry.histogram("run_seconds", "Runs", ("stage",), buckets=(0.1, 1.0))
+        for _ in range(requests):
+            histogram.observe(0.5, "run")
+        registry.collect("in_flight", "In flight", "gauge", lambda: in_flight)
+        return registry
+
+    def write_worker(self, pid: int, registry: Registry) -> None:
+        (self.path / f"worker-{pid}.json").write_text(json.dumps(registry.dump()), encoding="utf-8")
+
+    def test_scrape_sums_every_worker(self):
+        """Test any worker serves the same sums, so counters stay monotonic across scrapes"""
+        # The parent process stands in for another live worker
+        self.write_worker(os.getppid(), self.worker_registry(requests=3, in_flight=2))
+        directory = MetricsDirectory(self.path, self.worker_registry(requests=1, in_flight=1))
+
+        rendered = directory.render()
+
+        self.assertTrue((self.path / f"worker-{os.getpid()}.json").exists())
+        self.assertIn("# TYPE requests_total counter\nrequests_total 4\n", rendered)
+        self.assertIn('run_seconds_bucket{stage="run",le="0.1"} 0\n', rendered)
+        self.assertIn('run_seconds_bucket{stage="run",le="1.0"} 4\n', rendered)
+        self.assertIn('run_seconds_sum{stage="run"} 2.0\n', rendered)
+        self.assertIn('run_seconds_count{stage="run"} 4\n', rendered)
+        self.assertIn("in_flight 3\n", rendered)
+
+    def test_exited_worker_keeps_counters_but_not_gauges(self):
+        """Test a replaced worker's counts stay in the sums while its gauges are dropped"""
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        self.write_worker(exited.pid, self.worker_registry(requests=5, in_flight=7))
+        (self.path / "worker-bad.json").write_text("{", encoding="utf-8")
+        directory = MetricsDirectory(self.path, self.worker_registry(requests=1, in_flight=1))
+
+        rendered = directory.render()
+
+        self.assertIn("requests_total 6\n", rendered)
+        self.assertIn("in_flight 1\n", rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from recommendation_cache import RecommendationCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNormalizeQuery(unittest.TestCase):
+
+    def test_blank_queries_map_to_default_key(self):
+        """Test None and whitespace-only queries share the default key"""
+        self.assertEqual(normalize_query(None), "")
+        self.assertEqual(normalize_query(""), "")
+        self.assertEqual(normalize_query("   "), "")
+
+    def test_width_case_and_whitespace_are_normalized(self):
+        """Test full-width characters, case and spacing are folded"""
+        self.assertEqual(normalize_query("  おすすめ　ＢＯＴＴＬＥ  "), "おすすめ bottle")
+        self.assertEqual(normalize_query("水筒\n\tおすすめ"), "水筒 おすすめ")
+
+
+class TestRecommendationCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_put_backdated(self):
+        """Test entries stored with an earlier time age from that time"""
+        clock = FakeClock()
+        cache = RecommendationCache(AsyncMock(), ttl_seconds=10, stale_seconds=100, clock=clock)
+
+        await cache.put("水筒", {"id": "1"}, stored_at=clock.now - 5)
+        await cache.put("マグ", {"id": "2"}, stored_at=clock.now - 500)
+
+        self.assertEqual(await cache.fresh_for("水筒"), 5)
+        self.assertIsNone(await cache.peek("マグ"))
+        self.assertEqual(len(cache), 1)
+
+    async def test_hit_skips_loader(self):
+        """Test a fresh entry is served without calling the loader"""
+        loader = AsyncMock(return_value={"id": "1"})
+        cache = RecommendationCache(loader, clock=FakeClock())
+
+        first = await cache.get("水筒")
+        second = await cache.get(" 水筒 ")
+
+        self.assertEqual(first, {"id": "1"})
+        self.assertEqual(second, {"id": "1"})
+        loader.assert_awaited_once_with("水筒")
+        self.assertEqual((cache.hits, cache.stale_hits, cache.misses), (1, 0, 1))
+
+    async def test_rejected_values_are_not_cached(self):
+        """Test values rejected by should_cache always go to the loader"""
+        loader = AsyncMock(return_value={"id": "fallback-001"})
+        cache = RecommendationCache(
+            loader,
+            should_cache=lambda value: not value["id"].startswith("fallback-"),
+            clock=FakeClock())
+
+        await cache.get("水筒")
+        await cache.get("水筒")
+
+        self.assertEqual(loader.await_count, 2)
+        self.assertEqual(len(cache), 0)
+
+    async def test_lru_eviction(self):
+        """Test the least recently used entry is evicted past max_entries"""
+        loader = AsyncMock(side_effect=lambda query: {"id": query})
+        cache = RecommendationCache(loader, max_entries=2, clock=FakeClock())
+
+        await cache.get("a")
+        await cache.get("b")
+        await cache.get("a")  # touch "a" so "b" becomes least recent
+        await cache.get("c")
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(await cache.peek("a"))
+        self.assertIsNone(await cache.peek("b"))
+        self.assertIsNotNone(await cache.peek("c"))
+
+    async def test_stale_entry_served_while_single_refresh_runs(self):
+        """Test stale entries are returned immediately and refreshed once in background"""
+        clock = FakeClock()
+        release = asyncio.Event()
+        calls = []
+
+        async def loader(query):
+            calls.append(query)
+            if len(calls) > 1:
+                await release.wait()
+            return {"id": f"v{len(calls)}"}
+
+        cache = RecommendationCache(loader, ttl_seconds=10, stale_seconds=100, clock=clock)
+        self.assertEqual(await cache.get("q"), {"id": "v1"})
+
+        clock.now += 20
+        self.assertEqual(await cache.get("q"), {"id": "v1"})
+        self.assertEqual(await cache.get("q"), {"id": "v1"})
+        await asyncio.sleep(0)
+        self.assertEqual(len(calls), 2)
+
+        release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(await cache.get("q"), {"id": "v2"})
+        self.assertEqual((cache.hits, cache.stale_hits, cache.misses), (1, 2, 1))
+        await cache.close()
+
+    async def test_expired_entry_is_reloaded(self):
+        """Test entries past the stale window are loaded synchronously again"""
+        clock = FakeClock()
+        loader = AsyncMock(side_effect=[{"id": "v1"}, {"id": "v2"}])
+        cache = RecommendationCache(loader, ttl_seconds=10, stale_seconds=10, clock=clock)
+
+        await cache.get("q")
+        clock.now += 30
+
+        self.assertIsNone(await cache.peek("q"))
+        self.assertEqual(await cache.get("q"), {"id": "v2"})
+
+    async def test_failed_refresh_keeps_stale_entry(self):
+        """Test a failing background refresh keeps serving the stale value"""
+        clock = FakeClock()
+        loader = AsyncMock(side_effect=[{"id": "v1"}, Exception("agent down")])
+        cache = RecommendationCache(loader, ttl_seconds=10, stale_seconds=100, clock=clock)
+
+        await cache.get("q")
+        clock.now += 20
+        self.assertEqual(await cache.get("q"), {"id": "v1"})
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(await cache.peek("q"), {"id": "v1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
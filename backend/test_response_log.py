@@ -0,0 +1,85 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from response_log import ResponseLog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = Path(self.tmp_dir.name) / "responses.jsonl"
+        self.clock = FakeClock()
+        self.log = ResponseLog(self.path, clock=self.clock)
+
+    def test_append_writes_one_json_line(self):
+        """Test each answer is one compact JSON line with its metadata"""
+        self.log.append("水筒", {"id": "10"}, 1.2345, "completed")
+        lines = self.path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0]), {
+            "ts": 1000.0, "query": "水筒", "key": "水筒", "recommendation": {"id": "10"},
+            "latency_ms": 1234.5, "status": "completed",
+        })
+
+    def test_latest_per_normalized_query(self):
+        """Test later answers replace earlier ones for the same cache key"""
+        self.log.append("水筒", {"id": "1"}, 1.0, "completed")
+        self.clock.now += 10
+        self.log.append(" 水筒 ", {"id": "2"}, 1.0, "completed")
+        self.log.append(None, {"id": "3"}, 1.0, "in_progress")
+        latest = self.log.latest()
+        self.assertEqual(latest["水筒"]["recommendation"], {"id": "2"})
+        self.assertEqual(latest[""]["query"], None)
+
+    def test_latest_max_age(self):
+        """Test old answers can be left out"""
+        self.log.append("古い", {"id": "1"}, 1.0, "completed")
+        self.clock.now += 100
+        self.log.append("新しい", {"id": "2"}, 1.0, "completed")
+        self.assertEqual(list(self.log.latest(max_age_seconds=50)), ["新しい"])
+
+    def test_unreadable_lines_are_skipped(self):
+        """Test a torn or foreign line does not stop reading the log"""
+        self.log.append("水筒", {"id": "1"}, 1.0, "completed")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"ts": 1, "query": "途中\n[1, 2]\n')
+        self.log.append("マグ", {"id": "2"}, 1.0, "completed")
+        self.assertEqual(sorted(self.log.latest()), ["マグ", "水筒"])
+
+    def test_incomplete_records_are_skipped(self):
+        """Test records without a time or query (hand-edited, older format) are not replayed"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"query": "時刻なし", "recommendation": {"id": "1"}}\n')
+            f.write('{"ts": 1, "recommendation": {"id": "1"}}\n')
+            f.write('{"ts": "昨日", "query": "文字列", "recommendation": {"id": "1"}}\n')
+        self.log.append("マグ", {"id": "2"}, 1.0, "completed")
+        self.assertEqual(list(self.log.latest()), ["マグ"])
+
+    def test_missing_file_is_empty(self):
+        """Test reading a log that does not exist yet"""
+        self.assertEqual(self.log.latest(), {})
+
+    def test_compact_keeps_latest(self):
+        """Test compaction rewrites the log with one record per key"""
+        for index in range(3):
+            self.clock.now += 1
+            self.log.append("水筒", {"id": str(index)}, 1.0, "completed")
+        self.assertEqual(self.log.compact(), 1)
+        self.assertEqual(len(self.path.read_text(encoding="utf-8").splitlines()), 1)
+        self.assertEqual(self.log.latest()["水筒"]["recommendation"], {"id": "2"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from content_columns import ContentColumns
+from search_index import SearchIndex, tokenize
+from test_helpers import make_item
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_bigrams(self):
+        """Test words are split into overlapping character bigrams"""
+        self.assertEqual(tokenize("真空水筒"), ["真空", "空水", "水筒"])
+
+    def test_normalizes_width_and_case(self):
+        """Test full-width and upper-case text tokenizes like its plain form"""
+        self.assertEqual(tokenize("ＧＥＮ５ Bottle"), tokenize("gen5 bottle"))
+
+    def test_short_words(self):
+        """Test words shorter than n are kept as one token"""
+        self.assertEqual(tokenize("水 筒"), ["水", "筒"])
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [
+            make_item("1", "キッチン", title="エコフレンドリー水筒"),
+            make_item("2", "キッチン", title="真空断熱水筒 500ml", rating=4.9),
+            make_item("3", "オーディオ", title="ワイヤレスイヤホン"),
+            make_item("4", "キッチン", title="ステンレスマグ"),
+        ]
+        self.index = SearchIndex(ContentColumns(self.items))
+
+    def ids(self, query, limit=10):
+        return [item.id for item in self.index.search_items(query, limit)]
+
+    def test_japanese_substring_match(self):
+        """Test a Japanese keyword matches titles containing it without an analyzer"""
+        self.assertEqual(set(self.ids("水筒")), {"1", "2"})
+
+    def test_rating_breaks_close_scores(self):
+        """Test the higher rated item ranks first among equally relevant matches"""
+        self.assertEqual(self.ids("水筒")[0], "2")
+
+    def test_category_is_searchable(self):
+        """Test the category is indexed along with the title"""
+        self.assertEqual(self.ids("オーディオ"), ["3"])
+
+    def test_single_character_and_limit(self):
+        """Test one-character queries match and limit caps the results"""
+        self.assertEqual(len(self.ids("水", limit=1)), 1)
+
+    def test_candidates_topped_up_by_rating(self):
+        """Test candidates start with matches and fill up with the best rated items"""
+        self.assertEqual(self.index.candidates("オーディオ", 3), [2, 1, 0])
+        self.assertEqual(self.index.candidates("カメラ", 2), [1, 0])
+
+    def test_no_match(self):
+        """Test queries with no indexed tokens return nothing"""
+        self.assertEqual(self.ids("カメラ"), [])
+        self.assertEqual(SearchIndex(ContentColumns()).search("水筒"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+
+from single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test identical concurrent calls run fn once and all get its result"""
+        flight = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"id": "bottle-001"}
+
+        waiters = [asyncio.create_task(flight.do("水筒", fn)) for _ in range(50)]
+        await asyncio.sleep(0)
+        self.assertTrue(flight.in_flight("水筒"))
+
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(result == {"id": "bottle-001"} for result in results))
+        self.assertEqual(len(flight), 0)
+        self.assertEqual((flight.started, flight.coalesced), (1, 49))
+
+    async def test_different_keys_run_independently(self):
+        """Test calls with different keys are not coalesced"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fn(key):
+            calls.append(key)
+            await asyncio.sleep(0)
+            return key
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: fn("a")),
+            flight.do("b", lambda: fn("b")))
+
+        self.assertEqual(results, ["a", "b"])
+        self.assertEqual(sorted(calls), ["a", "b"])
+
+    async def test_exception_is_shared_and_flight_forgotten(self):
+        """Test an exception reaches every waiter and the next call starts fresh"""
+        flight = SingleFlight()
+        attempts = 0
+
+        async def fn():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0)
+            if attempts == 1:
+                raise RuntimeError("agent down")
+            return "ok"
+
+        results = await asyncio.gather(
+            flight.do("q", fn), flight.do("q", fn), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+        self.assertEqual(await flight.do("q", fn), "ok")
+        self.assertEqual(attempts, 2)
+
+    async def test_waiter_timeout_does_not_affect_others(self):
+        """Test one waiter timing out leaves the shared call and other waiters alone"""
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "done"
+
+        patient = asyncio.create_task(flight.do("q", fn))
+        with self.assertRaises(asyncio.TimeoutError):
+            await flight.do("q", fn, timeout=0.01)
+
+        release.set()
+        self.assertEqual(await patient, "done")
+
+    async def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        """Test cancelling the first caller keeps the call running for later waiters"""
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.create_task(flight.do("q", fn))
+        follower = asyncio.create_task(flight.do("q", fn))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        release.set()
+
+        self.assertEqual(await follower, "done")
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+    async def test_abandoned_call_is_cancelled_when_enabled(self):
+        """Test the shared call is cancelled once every waiter has left"""
+        flight = SingleFlight(cancel_abandoned=True)
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await flight.do("q", fn, timeout=0.01)
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        self.assertEqual(len(flight), 0)
+
+    async def test_abandoned_call_keeps_running_by_default(self):
+        """Test the shared call finishes even when every waiter timed out"""
+        flight = SingleFlight()
+        finished = asyncio.Event()
+
+        async def fn():
+            await asyncio.sleep(0.02)
+            finished.set()
+            return "done"
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await flight.do("q", fn, timeout=0.001)
+
+        await asyncio.wait_for(finished.wait(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()